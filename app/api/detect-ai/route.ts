@@ -132,6 +132,8 @@ async function analyzeWithDetectGPT(text: string, previousText?: string) {
     body: JSON.stringify({
       text,
       previousText: previousText || null,
+      // Draft-to-final checks rescore only the segments that changed
+      ...(previousText ? { scorer: "analytic" } : {}),
     }),
     signal: AbortSignal.timeout(15000), // 15 second timeout
   })
@@ -24,83 +24,88 @@ export async function POST(req: NextRequest) {
 
     console.log(`Analyzing ${sentences.length} sentences from text`)
 
-    const analyzedSentences = []
-    
-    for (let i = 0; i < sentences.length; i++) {
-      const sentence = sentences[i]
-      
-      // Skip if just punctuation
-      if (/^[.!?\s]+$/.test(sentence)) {
-        continue
+    // One DetectGPT call scores every sentence from a single pass over the
+    // document (same sentence split as above)
+    let serviceSentences: any[] | null = null
+    try {
+      const detectGPTUrl = process.env.DETECTGPT_SERVICE_URL || "http://localhost:8000"
+      const response = await fetch(`${detectGPTUrl}/detect/sentences`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ text }),
+        signal: AbortSignal.timeout(15000),
+      })
+
+      if (response.ok) {
+        const result = await response.json()
+        serviceSentences = result.sentences
+        console.log(`DetectGPT scored ${serviceSentences?.length} sentences (document score: ${result.score}, method: ${result.method})`)
       }
+    } catch (err) {
+      // Fallback to heuristic
+    }
+
+    const analyzedSentences = []
+
+    if (serviceSentences) {
+      for (const result of serviceSentences) {
+        const sentence = result.text
+
+        // Skip if just punctuation
+        if (/^[.!?\s]+$/.test(sentence)) {
+          continue
+        }
+
+        if (sentence.split(/\s+/).length < 5) {
+          // Too short to analyze reliably
+          analyzedSentences.push({
+            text: sentence,
+            aiLikelihood: 50,
+            type: "unknown",
+            confidence: "low"
+          })
+          continue
+        }
 
-      const sentenceWords = sentence.split(/\s+/).length
-      
-      if (sentenceWords < 5) {
-        // Too short to analyze reliably
         analyzedSentences.push({
           text: sentence,
-          aiLikelihood: 50,
-          type: "unknown",
-          confidence: "low"
+          aiLikelihood: result.aiLikelihood,
+          type: result.aiLikelihood >= 50 ? "ai" : "human",
+          confidence: result.confidence.toLowerCase(),
+          score: result.score
         })
-        continue
       }
+    } else {
+      console.log(`DetectGPT unavailable, using heuristic for all sentences`)
 
-      // Skip very long sentences for DetectGPT (>150 words)
-      // These will use heuristic instead
-      const useDetectGPT = sentenceWords <= 150
-
-      // Try DetectGPT service first (for reasonable length sentences)
-      if (useDetectGPT) {
-        try {
-          const detectGPTUrl = process.env.DETECTGPT_SERVICE_URL || "http://localhost:8000"
-          const response = await fetch(`${detectGPTUrl}/detect`, {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ text: sentence }),
-            signal: AbortSignal.timeout(5000),
-          })
+      for (const sentence of sentences) {
+        // Skip if just punctuation
+        if (/^[.!?\s]+$/.test(sentence)) {
+          continue
+        }
 
-          if (response.ok) {
-            const result = await response.json()
-            
-            // Debug logging
-            console.log(`DetectGPT result: "${sentence.substring(0, 50)}..." -> ${result.aiLikelihood}% AI (score: ${result.score}, method: ${result.method})`)
-            
-            // If DetectGPT returned error fallback (50/50), use heuristic instead
-            if (result.method === "Error Fallback" || (result.aiLikelihood === 50 && result.score === 0)) {
-              console.log(`DetectGPT failed for this sentence, using heuristic instead`)
-              // Fall through to heuristic
-            } else {
-              // Use DetectGPT result
-              analyzedSentences.push({
-                text: sentence,
-                aiLikelihood: result.aiLikelihood,
-                type: result.aiLikelihood >= 50 ? "ai" : "human",
-                confidence: result.confidence.toLowerCase(),
-                score: result.score
-              })
-              continue
-            }
-          }
-        } catch (err) {
-          // Fallback to heuristic
+        if (sentence.split(/\s+/).length < 5) {
+          // Too short to analyze reliably
+          analyzedSentences.push({
+            text: sentence,
+            aiLikelihood: 50,
+            type: "unknown",
+            confidence: "low"
+          })
+          continue
         }
-      }
 
-      // Heuristic fallback for sentence-level
-      const aiLikelihood = analyzeSentenceHeuristic(sentence)
-      
-      console.log(`Heuristic fallback: "${sentence.substring(0, 50)}..." -> ${aiLikelihood}% AI`)
-      
-      analyzedSentences.push({
-        text: sentence,
-        aiLikelihood,
-        type: aiLikelihood >= 50 ? "ai" : "human",
-        confidence: "medium",
-        method: "heuristic"
-      })
+        // Heuristic fallback for sentence-level
+        const aiLikelihood = analyzeSentenceHeuristic(sentence)
+
+        analyzedSentences.push({
+          text: sentence,
+          aiLikelihood,
+          type: aiLikelihood >= 50 ? "ai" : "human",
+          confidence: "medium",
+          method: "heuristic"
+        })
+      }
     }
 
     return NextResponse.json({
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Peak-memory benchmark for log-likelihood scoring
+
+Each mode runs in a fresh subprocess, so its peak RSS only reflects that mode:
+  full - model(...).logits + log_softmax over the whole padded batch
+         (materializes [batch, tokens, vocab] float32 logits)
+  lean - GPT2PPL.getLogLikelihoods (transformer body once, LM head applied
+         head_chunk_tokens positions at a time)
+
+Usage: python bench_memory.py [--tokens 1024] [--batch 1] [--model gpt2]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+SAMPLE = (
+    "Students often begin a research paper by collecting sources, reading "
+    "them closely and taking notes on the arguments they find convincing. "
+)
+
+
+def current_rss_mb():
+    """Resident set size right now (Linux), or None"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def run_mode(mode, model_id, tokens, batch):
+    """Load the model, score batch texts of tokens tokens, print a JSON report"""
+    import torch
+    from model import GPT2PPL
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    detector = GPT2PPL(device=device, model_id=model_id, max_batch_size=batch,
+                       max_batch_tokens=batch * tokens)
+    tokens = min(tokens, detector.max_length)
+    ids = detector.tokenizer(SAMPLE * (tokens // 10 + 1)).input_ids[:tokens]
+    texts = [detector.tokenizer.decode(ids)] * batch
+
+    rss_loaded = current_rss_mb()
+    peak_loaded = peak_rss_mb()
+    if device == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+
+    start = time.perf_counter()
+    if mode == "full":
+        with torch.no_grad():
+            input_ids = torch.tensor([ids] * batch, device=device)
+            logits = detector.model(input_ids).logits
+            log_probs = torch.log_softmax(logits[:, :-1].float(), dim=-1)
+            lls = log_probs.gather(-1, input_ids[:, 1:].unsqueeze(-1)).squeeze(-1).mean(dim=1)
+    else:
+        lls = detector.getLogLikelihoods(texts)
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "mode": mode,
+        "tokens": tokens,
+        "batch": batch,
+        "rss_after_load_mb": rss_loaded,
+        "peak_rss_after_load_mb": peak_loaded,
+        "peak_rss_mb": peak_rss_mb(),
+        "seconds": elapsed,
+        "log_likelihood": float(lls[0]),
+    }
+    if device == "cuda":
+        report["cuda_peak_mb"] = torch.cuda.max_memory_allocated() / 2**20
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--model", default="gpt2")
+    parser.add_argument("--tokens", type=int, default=1024)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--mode", choices=("full", "lean"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.model, args.tokens, args.batch)
+        return
+
+    reports = []
+    for mode in ("full", "lean"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--model", args.model,
+             "--tokens", str(args.tokens), "--batch", str(args.batch)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        reports.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'mode':<6} {'tokens':>6} {'batch':>5} {'after load MB':>14} {'peak MB':>9} "
+          f"{'scoring MB':>11} {'seconds':>8} {'log-lik':>10}")
+    for r in reports:
+        baseline = r["rss_after_load_mb"] or r["peak_rss_after_load_mb"]
+        print(f"{r['mode']:<6} {r['tokens']:>6} {r['batch']:>5} {baseline:>14.0f} "
+              f"{r['peak_rss_mb']:>9.0f} {r['peak_rss_mb'] - baseline:>11.0f} "
+              f"{r['seconds']:>8.2f} {r['log_likelihood']:>10.4f}")
+        if "cuda_peak_mb" in r:
+            print(f"{'':<6} CUDA peak allocated: {r['cuda_peak_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
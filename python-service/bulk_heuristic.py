@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Bulk heuristic scoring of a corpus
+
+Scores every text of a CSV / JSONL / plain-text file with the heuristic
+detector (heuristic.py) in one process, for research exports and backfills.
+Each chunk of texts is joined into one string and flattened into arrays -
+word offsets and ids, sentence offsets, the documents they belong to - and
+entropy, pattern counts, sentence-length variance and the ai_likelihood blend
+are computed with vectorized NumPy operations instead of per-text Python.
+Results match heuristic.analyze_text up to floating-point rounding in the
+last digits.
+
+Usage: python bulk_heuristic.py INPUT [-o OUTPUT] [--text-field content]
+                                [--id-field id] [--format csv|jsonl]
+                                [--chunk-size 20000] [--workers N]
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import numpy as np
+from heuristic import AI_PATTERNS, HUMAN_PATTERNS, build_phrase_regex, count_patterns
+
+METHOD = "DetectGPT-Lite (Heuristic Analysis)"
+
+RAW_METRICS = (
+    "perplexity_score", "ai_patterns", "human_patterns", "structure_consistency",
+    "structure_variation", "word_count", "sentence_count", "avg_words_per_sentence",
+)
+
+VERDICTS = np.array([
+    "Highly likely human-written content",
+    "Likely human-written content",
+    "Mixed or uncertain - may contain AI assistance",
+    "Likely AI-generated content",
+    "Highly likely AI-generated content",
+])
+
+# Code point classes: str.split() whitespace, and the characters of
+# heuristic.SENTENCE_SPLIT
+SPACE, SENTENCE_END = 1, 2
+CHAR_CLASS = np.zeros(sys.maxunicode + 1, dtype=np.uint8)
+CHAR_CLASS[[c for c in range(sys.maxunicode + 1) if chr(c).isspace()]] = SPACE
+CHAR_CLASS[[ord(c) for c in ".!?"]] = SENTENCE_END
+
+
+def multi_word_patterns(patterns):
+    """The phrase groups restricted to their multi-word alternatives"""
+    multi = []
+    for alternation, overlapping in patterns:
+        phrases = [phrase for phrase in alternation.split("|") if " " in phrase]
+        if phrases:
+            multi.append(("|".join(phrases), overlapping))
+    return multi
+
+
+# Single-word phrases never contain whitespace, so they are counted once per
+# distinct token with heuristic.count_patterns. Multi-word phrases are only
+# scanned for in windows starting at a token ending with a phrase's first
+# word and followed by one starting with its second word.
+MULTI_WORD_REGEX, MULTI_WORD_KINDS = build_phrase_regex(
+    multi_word_patterns(AI_PATTERNS), multi_word_patterns(HUMAN_PATTERNS)
+)
+MULTI_WORD_PHRASES = [
+    phrase.split(" ")
+    for alternation, _ in multi_word_patterns(AI_PATTERNS) + multi_word_patterns(HUMAN_PATTERNS)
+    for phrase in alternation.split("|")
+]
+FIRST_WORD = re.compile(
+    rf"\b(?:{'|'.join(sorted({words[0] for words in MULTI_WORD_PHRASES}))})\Z", re.IGNORECASE
+)
+SECOND_WORD = re.compile(
+    rf"(?:{'|'.join(sorted({words[1] for words in MULTI_WORD_PHRASES}))})\b", re.IGNORECASE
+)
+MAX_PHRASE_WORDS = max(len(words) for words in MULTI_WORD_PHRASES)
+
+
+def tokenize_corpus(texts):
+    """
+    Flatten a corpus (joined with newlines) into arrays of token offsets
+    Returns the corpus, doc_start [D], the start/end offset and document of
+    every whitespace-separated word (word_start, word_end, word_doc), the
+    words themselves, and the word count and document of every non-empty
+    sentence (sentence_lengths, sentence_doc) in text order.
+    """
+    corpus = "\n".join(texts)
+    lengths = np.fromiter((len(text) + 1 for text in texts), dtype=np.int64, count=len(texts))
+    doc_start = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    char_class = CHAR_CLASS[np.frombuffer(corpus.encode("utf-32-le"), dtype=np.uint32)]
+
+    # Words: maximal runs of non-whitespace (the newline separators included)
+    space = char_class == SPACE
+    word_start = np.flatnonzero(~space & np.concatenate(([True], space[:-1])))
+    word_end = np.flatnonzero(~space & np.concatenate((space[1:], [True]))) + 1
+    word_doc = np.searchsorted(doc_start, word_start, side="right") - 1
+
+    # Sentence words: runs of neither whitespace nor sentence punctuation. A
+    # sentence is the words between two punctuation runs (or documents), so a
+    # word starts a new sentence when a break lies between it and the last one
+    delimiter = char_class != 0
+    piece_start = np.flatnonzero(~delimiter & np.concatenate(([True], delimiter[:-1])))
+    sentence_end = char_class == SENTENCE_END
+    sentence_end[doc_start[1:] - 1] = True
+    breaks = np.flatnonzero(sentence_end)
+    sentence = np.searchsorted(breaks, piece_start)
+    first = np.flatnonzero(np.diff(sentence, prepend=-1))
+    sentence_lengths = np.diff(np.append(first, len(sentence)))
+    sentence_doc = np.searchsorted(doc_start, piece_start[first], side="right") - 1
+
+    return {
+        "corpus": corpus,
+        "doc_start": doc_start,
+        "words": corpus.split(),
+        "word_start": word_start,
+        "word_end": word_end,
+        "word_doc": word_doc,
+        "sentence_lengths": sentence_lengths.astype(np.float64),
+        "sentence_doc": sentence_doc,
+    }
+
+
+def word_ids(words):
+    """(distinct words in first-occurrence order, id of each word)"""
+    vocab = {word: i for i, word in enumerate(dict.fromkeys(words))}
+    ids = np.fromiter(map(vocab.__getitem__, words), dtype=np.int64, count=len(words))
+    return list(vocab), ids
+
+
+def word_entropy(word_doc, ids, n_ids, n_docs, word_count):
+    """
+    (entropy, distinct words) per document
+    Each document's (word, count) pairs are summed in first-occurrence order,
+    the order of heuristic.perplexity_score.
+    """
+    keys, first, counts = np.unique(word_doc * n_ids + ids, return_index=True, return_counts=True)
+    order = np.argsort(first, kind="stable")
+    doc = keys[order] // n_ids
+    prob = counts[order] / word_count[doc]
+    entropy = np.bincount(doc, weights=-prob * np.log2(prob), minlength=n_docs)
+    return entropy, np.bincount(doc, minlength=n_docs)
+
+
+def count_corpus_patterns(tokens, vocab, ids, n_docs):
+    """AI and human phrase matches per document"""
+    # Single-word phrases, per distinct token
+    token_counts = np.array([count_patterns(token) for token in vocab], dtype=np.int64).reshape(-1, 2)
+    word_doc = tokens["word_doc"]
+    ai_patterns = np.bincount(word_doc, weights=token_counts[ids, 0], minlength=n_docs).astype(np.int64)
+    human_patterns = np.bincount(word_doc, weights=token_counts[ids, 1], minlength=n_docs).astype(np.int64)
+
+    # Multi-word phrases, in windows of the words that can start one
+    # (dtype=bool: an empty vocabulary would otherwise give float arrays)
+    starts_phrase = np.array([FIRST_WORD.search(token) is not None for token in vocab], dtype=bool)
+    continues_phrase = np.array([SECOND_WORD.match(token) is not None for token in vocab], dtype=bool)
+    word_start, word_end = tokens["word_start"], tokens["word_end"]
+    candidates = np.flatnonzero(
+        starts_phrase[ids[:-1]] & continues_phrase[ids[1:]] & (word_start[1:] == word_end[:-1] + 1)
+    )
+    if len(candidates):
+        corpus = tokens["corpus"]
+        window_end = word_end[np.minimum(candidates + MAX_PHRASE_WORDS - 1, len(ids) - 1)]
+        windows = [corpus[start:end] for start, end in zip(word_start[candidates].tolist(), window_end.tolist())]
+        offsets = np.concatenate(([0], np.cumsum([len(window) + 1 for window in windows])[:-1]))
+        first_length = word_end[candidates] - word_start[candidates]
+        for match in MULTI_WORD_REGEX.finditer("\n".join(windows)):
+            window = np.searchsorted(offsets, match.start(), side="right") - 1
+            # Count each phrase only in the window of the word it starts in
+            if match.start() - offsets[window] < first_length[window]:
+                doc = word_doc[candidates[window]]
+                if MULTI_WORD_KINDS[match.lastindex] == "ai":
+                    ai_patterns[doc] += 1
+                else:
+                    human_patterns[doc] += 1
+    return ai_patterns, human_patterns
+
+
+def score_chunk(texts):
+    """score_corpus for one chunk of texts"""
+    n_docs = len(texts)
+    tokens = tokenize_corpus(texts)
+    word_doc = tokens["word_doc"]
+    word_count = np.bincount(word_doc, minlength=n_docs)
+    sentence_doc = tokens["sentence_doc"]
+    sentence_count = np.bincount(sentence_doc, minlength=n_docs)
+
+    # Word entropy over lowercased words, normalized by its maximum
+    # log2(distinct words). Lowercasing never changes token boundaries, so
+    # each distinct token is lowercased once
+    vocab, ids = word_ids(tokens["words"])
+    lowered, lowered_ids = word_ids([token.lower() for token in vocab])
+    entropy, distinct = word_entropy(word_doc, lowered_ids[ids], len(lowered), n_docs, word_count)
+    max_entropy = np.where(distinct > 1, np.log2(np.maximum(distinct, 1)), 1.0)
+    perplexity = np.clip((1 - entropy / max_entropy) * 100, 0, 100)
+    perplexity = np.where(word_count < 5, 50.0, perplexity)
+
+    # Sentence-length variation (population std / mean)
+    lengths = tokens["sentence_lengths"]
+    n_sentences = np.maximum(sentence_count, 1)
+    mean = np.bincount(sentence_doc, weights=lengths, minlength=n_docs) / n_sentences
+    variance = np.bincount(sentence_doc, weights=(lengths - mean[sentence_doc]) ** 2, minlength=n_docs) / n_sentences
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variation = np.minimum(1.0, np.sqrt(variance) / mean)
+    variation = np.where(sentence_count < 2, 0.5, variation)
+    consistency = np.where(sentence_count < 2, 0.5, 1 - variation)
+
+    ai_patterns, human_patterns = count_corpus_patterns(tokens, vocab, ids, n_docs)
+    avg_words = word_count / n_sentences
+
+    # Weighted blend: perplexity 40%, patterns 30%, consistency 20%, length 10%
+    pattern_score = np.clip(50 + ai_patterns * 10 - human_patterns * 5, 0, 100)
+    ai_likelihood = perplexity * 0.4
+    ai_likelihood = ai_likelihood + pattern_score * 0.3
+    ai_likelihood = ai_likelihood + consistency * 100 * 0.2
+    ai_likelihood = ai_likelihood + np.select([avg_words > 20, avg_words < 8], [1.0, -1.0], 0.0)
+    ai_likelihood = np.clip(ai_likelihood, 0, 100)
+
+    confidence = np.select(
+        [
+            word_count < 50,
+            (word_count > 200) & ((ai_likelihood < 20) | (ai_likelihood > 80)),
+            (word_count > 100) & ((ai_likelihood < 30) | (ai_likelihood > 70)),
+        ],
+        ["low", "high", "medium-high"],
+        "medium"
+    )
+    verdict = VERDICTS[np.searchsorted([20, 40, 60, 80], ai_likelihood, side="right")]
+
+    return {
+        "perplexity_score": perplexity,
+        "ai_patterns": ai_patterns,
+        "human_patterns": human_patterns,
+        "structure_consistency": consistency,
+        "structure_variation": variation,
+        "word_count": word_count,
+        "sentence_count": sentence_count,
+        "avg_words_per_sentence": avg_words,
+        "ai_likelihood": ai_likelihood,
+        "human_likelihood": 100 - ai_likelihood,
+        "confidence": confidence,
+        "verdict": verdict,
+    }
+
+
+def score_corpus(texts, chunk_size=20000, workers=1):
+    """
+    Heuristic features and scores for every text, as a dict of [D] arrays:
+    the raw_metrics fields plus ai_likelihood, human_likelihood, confidence
+    and verdict (same definitions as heuristic.extract_features and
+    heuristic.score_features)
+    Texts are processed chunk_size at a time to bound memory, on up to
+    workers processes.
+    """
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)] or [[]]
+    if workers > 1 and len(chunks) > 1:
+        with multiprocessing.Pool(min(workers, len(chunks))) as pool:
+            chunks = pool.map(score_chunk, chunks)
+    else:
+        chunks = [score_chunk(chunk) for chunk in chunks]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def iter_results(ids, scores):
+    """analyze_text-shaped result dicts, one per document"""
+    columns = {name: values.tolist() for name, values in scores.items()}
+    ai_rounded = np.round(scores["ai_likelihood"]).astype(np.int64).tolist()
+    human_rounded = np.round(scores["human_likelihood"]).astype(np.int64).tolist()
+    for i, doc_id in enumerate(ids):
+        yield {
+            "id": doc_id,
+            "aiLikelihood": ai_rounded[i],
+            "humanLikelihood": human_rounded[i],
+            "confidence": columns["confidence"][i],
+            "verdict": columns["verdict"][i],
+            "score": columns["ai_likelihood"][i] / 100.0,
+            "raw_metrics": {name: columns[name][i] for name in RAW_METRICS},
+            "method": METHOD,
+        }
+
+
+def read_corpus(path, text_field, id_field):
+    """(ids, texts) from a .csv, .jsonl or plain-text (one text per line) file"""
+    ids, texts = [], []
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as f:
+        if extension == ".csv":
+            rows = csv.DictReader(f)
+        elif extension in (".jsonl", ".ndjson"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = ({text_field: line.rstrip("\n")} for line in f)
+        for n, row in enumerate(rows):
+            ids.append(row.get(id_field, n))
+            texts.append((row.get(text_field) or "").strip())
+    return ids, texts
+
+
+def write_results(results, output, fmt):
+    """Write result dicts as CSV (raw_metrics flattened into columns) or JSONL"""
+    if fmt == "jsonl":
+        for result in results:
+            output.write(json.dumps(result) + "\n")
+        return
+    writer = csv.writer(output)
+    header = ["id", "aiLikelihood", "humanLikelihood", "confidence", "verdict", "score"]
+    writer.writerow(header + list(RAW_METRICS))
+    for result in results:
+        writer.writerow([result[name] for name in header] + [result["raw_metrics"][name] for name in RAW_METRICS])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("input", help=".csv, .jsonl or .txt (one text per line)")
+    parser.add_argument("-o", "--output", help="output file (default stdout)")
+    parser.add_argument("--text-field", default="content")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--format", choices=("csv", "jsonl"),
+                        help="output format (default from the output extension, else csv)")
+    parser.add_argument("--chunk-size", type=int, default=20000, help="texts scored per vectorized pass")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes scoring chunks")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        fmt = "jsonl" if args.output and args.output.endswith((".jsonl", ".ndjson")) else "csv"
+
+    start = time.perf_counter()
+    ids, texts = read_corpus(args.input, args.text_field, args.id_field)
+    scored = time.perf_counter()
+    scores = score_corpus(texts, args.chunk_size, args.workers)
+    elapsed = time.perf_counter() - scored
+
+    output = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        write_results(iter_results(ids, scores), output, fmt)
+    finally:
+        if args.output:
+            output.close()
+    print(f"Scored {len(texts)} texts in {elapsed:.2f}s ({time.perf_counter() - start:.2f}s total)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
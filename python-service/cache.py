@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Content-addressed caches for detection results and T5 perturbations
+
+Scores are deterministic for a given text, model and scoring configuration,
+so results are keyed by a hash of exactly those and reused across drafts,
+final submissions, retries and faculty rescans. T5 perturbations are
+deterministic for a given text, masking and sampling configuration, so they
+are stored the same way and reused by any scoring model.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """Canonical form of a submission: NFC, \\n line endings, no outer whitespace"""
+    text = unicodedata.normalize("NFC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.strip()
+
+
+def cache_key(text, model_id, scorer, params):
+    """SHA-256 over the normalized text, model id, scorer and scoring parameters"""
+    payload = json.dumps(
+        {"model": model_id, "scorer": scorer, "params": params},
+        sort_keys=True
+    )
+    digest = hashlib.sha256()
+    digest.update(payload.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def perturbation_key(text, params):
+    """SHA-256 over the exact text and the masking / sampling parameters"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier result cache
+
+    Memory tier: LRU of at most max_entries results, each valid for ttl_s.
+    Disk tier (optional): SQLite file at path that survives restarts, holding
+    at most max_disk_entries results under the same TTL. Disk hits are
+    promoted to the memory tier. From async code use get_async / put_async,
+    which run disk-tier I/O on a worker thread instead of the event loop.
+    """
+
+    def __init__(self, max_entries=2048, ttl_s=86400, path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.ttl = ttl_s
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+
+        self.memory = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_evictions = 0
+        self.puts_since_prune = 0
+
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.db.commit()
+            self.prune_disk()
+
+    def get(self, key):
+        """Return the cached result for key, or None"""
+        now = time.time()
+        with self.lock:
+            value = self.get_memory(key, now)
+            if value is not None:
+                return value
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if row[1] > now:
+                        value = json.loads(row[0])
+                        self.store_memory(key, row[1], value)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self.db.commit()
+                    self.expirations += 1
+
+            self.misses += 1
+            return None
+
+    def get_memory(self, key, now):
+        """Memory-tier lookup (caller holds the lock); counts a hit, drops an expired entry"""
+        entry = self.memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return value
+            del self.memory[key]
+            self.expirations += 1
+        return None
+
+    async def get_async(self, key):
+        """get() for the event loop: memory hits inline, disk lookups on a worker thread"""
+        if self.db is None:
+            return self.get(key)
+        with self.lock:
+            value = self.get_memory(key, time.time())
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def put_async(self, key, value):
+        """put() for the event loop: the disk write runs on a worker thread"""
+        if self.db is None:
+            self.put(key, value)
+        else:
+            await asyncio.to_thread(self.put, key, value)
+
+    def put(self, key, value):
+        """Cache a result under key"""
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self.store_memory(key, expires_at, value)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at)
+                )
+                self.db.commit()
+                self.puts_since_prune += 1
+                if self.puts_since_prune >= 1000:
+                    self.prune_disk()
+
+    def store_memory(self, key, expires_at, value):
+        """Insert into the LRU tier, evicting the least recently used entries"""
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.evictions += 1
+
+    def prune_disk(self):
+        """Drop expired disk entries and trim the disk tier to max_disk_entries"""
+        self.puts_since_prune = 0
+        cursor = self.db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        self.expirations += max(cursor.rowcount, 0)
+        cursor = self.db.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+        self.disk_evictions += max(cursor.rowcount, 0)
+        self.db.commit()
+
+    def stats(self):
+        """Hit/miss/eviction counters"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "expirations": self.expirations,
+                "memory_entries": len(self.memory),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "disk_path": self.path,
+            }
+            if self.db is not None:
+                stats["disk_entries"] = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            return stats
+
+
+class PerturbationStore:
+    """
+    On-disk store of T5-perturbed texts
+
+    SQLite file at path mapping a perturbation_key to the list of perturbed
+    texts (None for variants T5 failed to fill), stored as zlib-compressed
+    JSON. The least recently used entries are evicted once the stored data
+    exceeds max_bytes. Every process opens its own connection, so forked and
+    spawned workers can share one file.
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = None
+        self.pid = None
+        self.bytes_since_prune = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def connection(self):
+        """This process's connection, created (with the table) on first use"""
+        if self.pid != os.getpid():
+            self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS perturbations ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "last_used REAL NOT NULL)"
+            )
+            self.db.commit()
+            self.pid = os.getpid()
+        return self.db
+
+    def get(self, key):
+        """Return the stored perturbed texts for key, or None"""
+        with self.lock:
+            db = self.connection()
+            row = db.execute("SELECT value FROM perturbations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE perturbations SET last_used = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            self.hits += 1
+            return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key, texts):
+        """Store the perturbed texts for key, evicting old entries when over max_bytes"""
+        value = zlib.compress(json.dumps(texts).encode("utf-8"))
+        with self.lock:
+            db = self.connection()
+            db.execute(
+                "INSERT OR REPLACE INTO perturbations (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time())
+            )
+            db.commit()
+            self.bytes_since_prune += len(value)
+            if self.bytes_since_prune >= self.max_bytes // 100:
+                self.prune()
+
+    def prune(self):
+        """Evict least recently used entries until the store fits in max_bytes"""
+        self.bytes_since_prune = 0
+        db = self.connection()
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM perturbations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evict = []
+        for key, size in db.execute("SELECT key, size FROM perturbations ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evict.append((key,))
+            total -= size
+        db.executemany("DELETE FROM perturbations WHERE key = ?", evict)
+        db.commit()
+        self.evictions += len(evict)
+
+    def stats(self):
+        """Hit/miss/eviction counters and the stored entries and bytes"""
+        with self.lock:
+            entries, size = self.connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM perturbations"
+            ).fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "path": self.path,
+            }
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Fit the analytic scorer's calibration (ANALYTIC_CENTER / ANALYTIC_SCALE)
+
+The analytic scorer reports score = (curvature - center) / scale, so that the
+getVerdict thresholds of the perturbation scorer apply to it too. This script
+scores a corpus of real submissions with both scorers and fits center and
+scale by least squares of the perturbation score on the analytic curvature.
+With a label column (ai / human, or 1 / 0) it also reports how often each
+scorer's verdict (aiLikelihood >= 50 means AI) matches the labels, before and
+after calibration.
+
+Usage: python calibrate_analytic.py corpus.csv [--text-field content]
+                                    [--label-field label] [--model gpt2]
+                                    [--limit 500]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import numpy as np
+from model import GPT2PPL
+
+AI_LABELS = {"ai", "1", "true", "yes"}
+HUMAN_LABELS = {"human", "0", "false", "no"}
+
+
+def read_labelled(path, text_field, label_field):
+    """(texts, labels) from a .csv, .jsonl or plain-text file; labels are None when missing"""
+    texts, labels = [], []
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as f:
+        if extension == ".csv":
+            rows = csv.DictReader(f)
+        elif extension in (".jsonl", ".ndjson"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = ({text_field: line.rstrip("\n")} for line in f)
+        for row in rows:
+            texts.append((row.get(text_field) or "").strip())
+            labels.append(parse_label(row.get(label_field)))
+    return texts, labels
+
+
+def fit_calibration(curvatures, scores):
+    """(center, scale) with scores ~ (curvatures - center) / scale, by least squares"""
+    slope, intercept = np.polyfit(np.asarray(curvatures), np.asarray(scores), 1)
+    if slope <= 0:
+        raise ValueError("perturbation scores do not increase with the curvature; cannot calibrate")
+    return -intercept / slope, 1.0 / slope
+
+
+def parse_label(value):
+    """True for AI, False for human, None for unlabelled rows"""
+    value = str(value if value is not None else "").strip().lower()
+    if value in AI_LABELS:
+        return True
+    if value in HUMAN_LABELS:
+        return False
+    return None
+
+
+def accuracy(detector, scores, labels):
+    """Fraction of labelled texts whose verdict (aiLikelihood >= 50) matches the label"""
+    pairs = [(score, label) for score, label in zip(scores, labels) if label is not None]
+    if not pairs:
+        return None
+    return sum((detector.getLikelihood(score) >= 50) == label for score, label in pairs) / len(pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("input", help=".csv, .jsonl or .txt (one text per line)")
+    parser.add_argument("--text-field", default="content")
+    parser.add_argument("--label-field", default="label")
+    parser.add_argument("--model", default="gpt2", help="MODEL_ID to calibrate")
+    parser.add_argument("--limit", type=int, help="score at most this many texts")
+    args = parser.parse_args()
+
+    texts, labels = read_labelled(args.input, args.text_field, args.label_field)
+    keep = [i for i, text in enumerate(texts) if len(text.split()) >= 30][:args.limit]
+    if len(keep) < 2:
+        sys.exit("Need at least two texts of 30 words or more")
+
+    detector = GPT2PPL(model_id=args.model)
+    curvatures, analytic_scores, perturbation_scores, scored_labels = [], [], [], []
+    start = time.perf_counter()
+    for n, i in enumerate(keep, 1):
+        analytic = detector.analyze(texts[i], scorer="analytic")
+        perturbation = detector.analyze(texts[i], scorer="perturbation")
+        if "error" in analytic["raw_metrics"] or "error" in perturbation["raw_metrics"]:
+            continue
+        curvatures.append(analytic["raw_metrics"]["diff"] / analytic["raw_metrics"]["std"])
+        analytic_scores.append(analytic["score"])
+        perturbation_scores.append(perturbation["score"])
+        scored_labels.append(labels[i])
+        if n % 50 == 0:
+            print(f"Scored {n}/{len(keep)} texts", file=sys.stderr)
+
+    center, scale = fit_calibration(curvatures, perturbation_scores)
+    calibrated = [(curvature - center) / scale for curvature in curvatures]
+    correlation = float(np.corrcoef(curvatures, perturbation_scores)[0, 1])
+
+    print(f"Scored {len(curvatures)} texts with {args.model} in {time.perf_counter() - start:.1f}s")
+    print(f"Correlation of curvature and perturbation score: {correlation:.3f}")
+    print(f"Current calibration:  center={detector.analytic_center}, scale={detector.analytic_scale}")
+    print(f"Fitted calibration:   center={center:.4f}, scale={scale:.4f}")
+
+    if any(label is not None for label in scored_labels):
+        print("Verdict accuracy on labelled texts:")
+        print(f"  perturbation:          {accuracy(detector, perturbation_scores, scored_labels):.3f}")
+        print(f"  analytic (current):    {accuracy(detector, analytic_scores, scored_labels):.3f}")
+        print(f"  analytic (calibrated): {accuracy(detector, calibrated, scored_labels):.3f}")
+
+    print("\nAdd to the service's environment:")
+    print(f"ANALYTIC_CENTER={center:.4f}")
+    print(f"ANALYTIC_SCALE={scale:.4f}")
+
+
+if __name__ == "__main__":
+    main()
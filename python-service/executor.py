@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Managed executor for blocking model inference
+
+Keeps GPT-2 forward passes off the asyncio event loop so /health and other
+requests stay responsive while an essay is being scored. Work is admitted
+through a bounded queue and queued work is dropped when its caller goes away.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue cannot take more work"""
+
+
+def fork_worker_main(conn, initializer, initargs):
+    """Forked worker process: run (fn, args) tasks from conn until None"""
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        fn, args = task
+        try:
+            reply = (True, fn(*args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:  # result or exception could not be pickled
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class ForkWorker:
+    """
+    One forked worker process plus the parent-side thread feeding it
+    Tasks wait in the parent's queue and are sent to the process one at a
+    time, so a task that has not been sent yet can still be cancelled.
+    """
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.tasks = queue.Queue()
+        self.load = 0  # queued + running tasks, guarded by pool.lock
+        self.completed = 0
+        self.restarts = 0
+        self.start_process()
+        self.thread = threading.Thread(target=self.dispatch, name=f"fork-worker-{index}", daemon=True)
+        self.thread.start()
+
+    def start_process(self):
+        """Fork the worker process (it inherits the parent's loaded model)"""
+        ctx = multiprocessing.get_context("fork")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=fork_worker_main,
+            args=(child_conn, self.pool.initializer, self.pool.initargs),
+            name=f"inference-{self.index}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def dispatch(self):
+        """Parent-side loop: send queued tasks to the process and resolve their futures"""
+        while True:
+            item = self.tasks.get()
+            if item is None:
+                break
+            future, fn, args = item
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    self.conn.send((fn, args))
+                    ok, value = self.conn.recv()
+                except (EOFError, OSError):
+                    future.set_exception(RuntimeError(f"Inference worker {self.index} exited"))
+                    if not self.pool.closed:
+                        print(f"WARNING: Inference worker {self.index} exited, forking a replacement")
+                        self.restarts += 1
+                        self.start_process()
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+                self.completed += 1
+            finally:
+                with self.pool.lock:
+                    self.load -= 1
+
+    def stop(self):
+        """Drop queued tasks and stop the process"""
+        while True:
+            try:
+                item = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[0].cancel()
+                with self.pool.lock:
+                    self.load -= 1
+        self.tasks.put(None)
+        self.process.terminate()
+
+
+class ForkWorkerPool:
+    """
+    Pre-forked worker processes sharing the parent's model
+    The parent loads the model before creating the pool; fork gives every
+    worker the same weight pages (shared memory or copy-on-write), so N
+    workers cost one model plus their activations. Each worker runs
+    initializer(*initargs) once (e.g. to set its torch thread count) and
+    each task goes to the worker with the fewest queued + running tasks.
+    """
+
+    def __init__(self, workers, initializer=None, initargs=()):
+        self.initializer = initializer
+        self.initargs = initargs
+        self.lock = threading.Lock()
+        self.closed = False
+        self.rotation = itertools.count()
+        self.workers = [ForkWorker(self, i) for i in range(workers)]
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) on the least-loaded worker; returns a Future"""
+        future = Future()
+        with self.lock:
+            # Rotate the starting point so idle workers share the work
+            offset = next(self.rotation)
+            count = len(self.workers)
+            worker = min(
+                (self.workers[(offset + i) % count] for i in range(count)),
+                key=lambda w: w.load
+            )
+            worker.load += 1
+        worker.tasks.put((future, fn, args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Stop every worker process, cancelling queued tasks"""
+        self.closed = True
+        for worker in self.workers:
+            worker.stop()
+        if wait:
+            for worker in self.workers:
+                worker.process.join()
+
+    def stats(self):
+        """Per-worker load, completed tasks and restarts"""
+        return [
+            {"load": w.load, "completed": w.completed, "restarts": w.restarts, "pid": w.process.pid}
+            for w in self.workers
+        ]
+
+
+class InferenceExecutor:
+    """
+    Runs blocking inference calls on a dedicated pool
+
+    backend:     "thread" (workers share the in-process model), "process"
+                 (each worker process runs initializer to load its own model)
+                 or "fork" (workers are forked from this process after it has
+                 loaded the model and share its weights; initializer runs
+                 once in each worker)
+    workers:     number of threads / processes
+    max_pending: maximum calls queued or running before QueueFullError
+    """
+
+    def __init__(self, backend="thread", workers=1, max_pending=64, initializer=None, initargs=()):
+        if backend not in ("thread", "process", "fork"):
+            raise ValueError(f"Unknown executor backend: {backend}")
+
+        self.backend = backend
+        self.workers = workers
+        self.max_pending = max_pending
+
+        if backend == "thread":
+            self.pool = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix="inference",
+                initializer=initializer,
+                initargs=initargs
+            )
+        elif backend == "fork":
+            self.pool = ForkWorkerPool(workers, initializer=initializer, initargs=initargs)
+        else:
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer,
+                initargs=initargs
+            )
+
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    async def run(self, fn, *args):
+        """
+        Run fn(*args) on the pool and wait for its result
+
+        Raises QueueFullError when max_pending calls are already in flight.
+        If the awaiting task is cancelled (deadline or client disconnect)
+        before fn has started, the queued call is dropped.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise QueueFullError(f"Inference queue is full ({self.pending} pending)")
+
+        self.pending += 1
+        future = self.pool.submit(fn, *args)
+        try:
+            result = await asyncio.wrap_future(future)
+            self.completed += 1
+            return result
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            future.cancel()
+            raise
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        """Stop the pool, dropping queued calls"""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        """Queue and outcome counters"""
+        stats = {
+            "backend": self.backend,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+        }
+        if self.backend == "fork":
+            stats["worker_stats"] = self.pool.stats()
+        return stats
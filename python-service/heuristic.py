@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Heuristic AI-content detector: word entropy, phrase patterns, sentence structure
+
+Shared by python-service (api/detect.py and the cascade scorer in main.py),
+detectgpt-lite and detectgpt-hf. The last two are deployed on their own, so
+they carry identical copies of this file (detectgpt-lite/api/_heuristic.py,
+detectgpt-hf/heuristic.py) - edit this one and copy it over.
+
+Each text is split into words and sentences once, and every phrase pattern is
+counted in a single scan of one compiled regex. The features (raw_metrics)
+and scores are exactly those of the original per-feature functions.
+"""
+import math
+import re
+from collections import Counter
+
+# Phrase patterns, matched case-insensitively as whole words: each entry is
+# (alternation, overlapping). A match of an overlapping group can share words
+# with another group's match ("let's explore in depth", "it's vital to
+# summarize", "I think"), so those groups are matched in a lookahead that
+# does not consume the text - every group is still counted as if scanned
+# on its own.
+AI_PATTERNS = [
+    (r"it's important to note|it's worth noting|it's crucial to understand", False),
+    (r"in conclusion|to summarize|in summary", False),
+    (r"furthermore|moreover|additionally|consequently", False),
+    (r"delve into|dive deep|explore in depth", False),
+    (r"let's explore|let's examine|let's consider", True),
+    (r"comprehensive|multifaceted|holistic approach", False),
+    (r"it's essential to|it's vital to|it's critical to", True),
+]
+
+HUMAN_PATTERNS = [
+    (r"I|me|my|mine|myself", False),
+    (r"don't|won't|can't|isn't|aren't", False),
+    (r"yeah|yep|nope|gonna|wanna|gotta", False),
+    (r"amazing|awesome|terrible|horrible|fantastic", False),
+    (r"maybe|perhaps|possibly|probably|I think", True),
+]
+
+
+def build_phrase_regex(ai_patterns=AI_PATTERNS, human_patterns=HUMAN_PATTERNS):
+    """
+    One regex over all phrase groups, as (regex, kinds): kinds[i] is "ai" or
+    "human" for the group captured by group number i
+    Alternatives are bucketed by first letter, so at each word start only the
+    phrases that can begin there are tried. Bucketing keeps each group's
+    alternatives in order, so every match is the one the group's own regex
+    would find.
+    """
+    buckets = {}  # first letter -> [(overlapping, kind, alternation)] in group order
+    for kind, patterns in (("ai", ai_patterns), ("human", human_patterns)):
+        for alternation, overlapping in patterns:
+            by_letter = {}
+            for phrase in alternation.split("|"):
+                by_letter.setdefault(phrase[0].lower(), []).append(phrase)
+            for letter, phrases in by_letter.items():
+                buckets.setdefault(letter, []).append((overlapping, kind, "|".join(phrases)))
+
+    kinds = [None]
+    branches = []
+    for letter, groups in sorted(buckets.items()):
+        # Lookaheads come first: after one matches (empty) at a position, the
+        # scan retries that position with the consuming groups
+        alternatives = []
+        for overlapping, kind, alternation in sorted(groups, key=lambda group: not group[0]):
+            kinds.append(kind)
+            group = rf"({alternation})\b"
+            alternatives.append(f"(?={group})" if overlapping else group)
+        branches.append(f"(?=[{letter}{letter.upper()}])(?:{'|'.join(alternatives)})")
+
+    first_letters = "".join(sorted(buckets)) + "".join(sorted(buckets)).upper()
+    regex = rf"\b(?=[{first_letters}])(?:{'|'.join(branches)})"
+    return re.compile(regex, re.IGNORECASE), kinds
+
+
+PHRASE_REGEX, PHRASE_KINDS = build_phrase_regex()
+SENTENCE_SPLIT = re.compile(r"[.!?]+")
+
+
+def count_patterns(text):
+    """(AI phrase matches, human phrase matches)"""
+    ai_patterns = human_patterns = 0
+    for match in PHRASE_REGEX.finditer(text):
+        if PHRASE_KINDS[match.lastindex] == "ai":
+            ai_patterns += 1
+        else:
+            human_patterns += 1
+    return ai_patterns, human_patterns
+
+
+def perplexity_score(words):
+    """Simplified perplexity-like score from the lowercased words: low word entropy = AI-like"""
+    if len(words) < 5:
+        return 50.0
+
+    # Calculate word frequency distribution
+    word_freq = Counter(words)
+    total_words = len(words)
+    unique_words = len(word_freq)
+
+    # Calculate entropy-like measure
+    entropy = 0
+    for count in word_freq.values():
+        prob = count / total_words
+        entropy -= prob * math.log2(prob)
+
+    # Normalize entropy (higher entropy = more human-like)
+    max_entropy = math.log2(unique_words) if unique_words > 1 else 1
+    normalized_entropy = entropy / max_entropy if max_entropy > 0 else 0
+
+    # Convert to AI likelihood (lower entropy = higher AI likelihood)
+    ai_score = (1 - normalized_entropy) * 100
+
+    return max(0, min(100, ai_score))
+
+
+def text_structure(sentences):
+    """Sentence length consistency / variation (AI tends to be more consistent)"""
+    if len(sentences) < 2:
+        return {"consistency": 0.5, "variation": 0.5}
+
+    # Calculate sentence length variation
+    lengths = [len(s.split()) for s in sentences]
+    avg_length = sum(lengths) / len(lengths)
+    variance = sum((l - avg_length) ** 2 for l in lengths) / len(lengths)
+    variation = min(1.0, math.sqrt(variance) / avg_length) if avg_length > 0 else 0
+
+    # Calculate consistency (AI tends to be more consistent)
+    consistency = 1 - variation
+
+    return {"consistency": consistency, "variation": variation}
+
+
+def extract_features(text):
+    """All heuristic features of a text - the raw_metrics of analyze_text"""
+    # Lowercasing never adds or removes whitespace, so one split serves both
+    # the word count and the entropy
+    words = text.lower().split()
+    sentences = [s for s in (part.strip() for part in SENTENCE_SPLIT.split(text)) if s]
+    ai_patterns, human_patterns = count_patterns(text)
+    structure = text_structure(sentences)
+
+    word_count = len(words)
+    sentence_count = len(sentences)
+    return {
+        "perplexity_score": perplexity_score(words),
+        "ai_patterns": ai_patterns,
+        "human_patterns": human_patterns,
+        "structure_consistency": structure["consistency"],
+        "structure_variation": structure["variation"],
+        "word_count": word_count,
+        "sentence_count": sentence_count,
+        "avg_words_per_sentence": word_count / max(sentence_count, 1)
+    }
+
+
+def score_features(features):
+    """(ai_likelihood, human_likelihood, confidence, verdict) for extract_features output"""
+    # Calculate final AI likelihood
+    ai_likelihood = 0
+
+    # Perplexity contribution (40%)
+    ai_likelihood += features["perplexity_score"] * 0.4
+
+    # Pattern analysis (30%)
+    pattern_score = (features["ai_patterns"] * 10) - (features["human_patterns"] * 5)
+    pattern_score = max(0, min(100, 50 + pattern_score))
+    ai_likelihood += pattern_score * 0.3
+
+    # Structure consistency (20%)
+    consistency_score = features["structure_consistency"] * 100
+    ai_likelihood += consistency_score * 0.2
+
+    # Length and complexity (10%)
+    avg_words_per_sentence = features["avg_words_per_sentence"]
+    if avg_words_per_sentence > 20:  # Very long sentences might indicate AI
+        ai_likelihood += 10 * 0.1
+    elif avg_words_per_sentence < 8:  # Very short might indicate human
+        ai_likelihood -= 10 * 0.1
+
+    # Normalize final score
+    ai_likelihood = max(0, min(100, ai_likelihood))
+    human_likelihood = 100 - ai_likelihood
+
+    # Determine confidence
+    word_count = features["word_count"]
+    if word_count < 50:
+        confidence = "low"
+    elif word_count > 200 and (ai_likelihood < 20 or ai_likelihood > 80):
+        confidence = "high"
+    elif word_count > 100 and (ai_likelihood < 30 or ai_likelihood > 70):
+        confidence = "medium-high"
+    else:
+        confidence = "medium"
+
+    # Generate verdict
+    if ai_likelihood >= 80:
+        verdict = "Highly likely AI-generated content"
+    elif ai_likelihood >= 60:
+        verdict = "Likely AI-generated content"
+    elif ai_likelihood >= 40:
+        verdict = "Mixed or uncertain - may contain AI assistance"
+    elif ai_likelihood >= 20:
+        verdict = "Likely human-written content"
+    else:
+        verdict = "Highly likely human-written content"
+
+    return ai_likelihood, human_likelihood, confidence, verdict
+
+
+def analyze_text(text, method="DetectGPT-Lite (Heuristic Analysis)"):
+    """Heuristic detection result for one text (neutral fallback on errors)"""
+    try:
+        raw_metrics = extract_features(text)
+        ai_likelihood, human_likelihood, confidence, verdict = score_features(raw_metrics)
+        return {
+            "aiLikelihood": int(round(ai_likelihood)),
+            "humanLikelihood": int(round(human_likelihood)),
+            "confidence": confidence,
+            "verdict": verdict,
+            "score": ai_likelihood / 100.0,
+            "raw_metrics": raw_metrics,
+            "method": method
+        }
+
+    except Exception as e:
+        # Fallback response
+        return {
+            "aiLikelihood": 50,
+            "humanLikelihood": 50,
+            "confidence": "low",
+            "verdict": "Analysis failed - using neutral score",
+            "score": 0.5,
+            "raw_metrics": {"error": str(e)},
+            "method": "Error Fallback"
+        }
+
+
+def analyze_many(texts, method="DetectGPT-Lite (Heuristic Analysis)"):
+    """analyze_text for each of texts"""
+    return [analyze_text(text, method) for text in texts]
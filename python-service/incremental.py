@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Draft-vs-final segmentation for incremental rescoring
+
+A final submission usually repeats most of its draft. Both versions are
+split into sentence segments and aligned, so only segments that changed
+need to be scored again.
+"""
+import re
+from difflib import SequenceMatcher
+
+
+def split_spans(text, separator, start=0, end=None):
+    """(start, end) spans of text[start:end] between matches of separator (like re.split)"""
+    end = len(text) if end is None else end
+    spans = []
+    for match in re.compile(separator).finditer(text, start, end):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, end))
+    return spans
+
+
+def segment_spans(text):
+    """
+    (start, end) character spans of the sentence segments of text
+    Paragraphs are split first, then sentences; each span has its outer
+    whitespace trimmed. Empty segments are skipped.
+    """
+    spans = []
+    for paragraph_start, paragraph_end in split_spans(text, r"\n\s*\n"):
+        for start, end in split_spans(text, r"(?<=[.!?])\s+", paragraph_start, paragraph_end):
+            sentence = text[start:end]
+            if sentence.strip():
+                lead = len(sentence) - len(sentence.lstrip())
+                spans.append((start + lead, start + len(sentence.rstrip())))
+    return spans
+
+
+def split_segments(text):
+    """
+    Split text into sentence segments (paragraphs first, then sentences)
+    Whitespace inside a segment is collapsed so formatting-only edits do not
+    count as changes.
+    """
+    return [" ".join(text[start:end].split()) for start, end in segment_spans(text)]
+
+
+def diff_segments(previous, current):
+    """
+    Align current segments with the previous version
+    Returns one (status, previous_index) pair per current segment, where
+    status is "unchanged", "changed" (an edit of previous[previous_index])
+    or "added" (previous_index None).
+    """
+    plan = [("added", None)] * len(current)
+    matcher = SequenceMatcher(None, previous, current, autojunk=False)
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(j2 - j1):
+                plan[j1 + offset] = ("unchanged", i1 + offset)
+        elif tag == "replace":
+            # Pair each rewritten segment with the most similar old one
+            for j in range(j1, j2):
+                best, best_ratio = None, 0.0
+                for i in range(i1, i2):
+                    ratio = SequenceMatcher(None, previous[i], current[j]).ratio()
+                    if ratio > best_ratio:
+                        best, best_ratio = i, ratio
+                if best is not None and best_ratio >= 0.5:
+                    plan[j] = ("changed", best)
+
+    return plan
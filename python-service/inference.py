@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Inference entry points run on the executor's workers
+
+Each worker (thread pool: the service process, process pool: every worker
+process) holds one GPT2PPL in the module-level detector. Fork workers
+inherit the detector the service process loaded before forking them. torch and
+transformers are only imported once a worker loads its model.
+"""
+detector = None
+
+
+def load_detector(device, model_id, max_batch_size, max_batch_tokens, precision="fp32",
+                  compile_mode=None, warmup=False, perturbation_store_path=None,
+                  perturbation_store_mb=1024, analytic_center=1.0, analytic_scale=2.0,
+                  perturbation_mode="batched", use_t5=False):
+    """
+    Load the worker's GPT2PPL instance (warmup: run GPT2PPL.warmup too)
+    perturbation_store_path: SQLite file of a PerturbationStore for T5
+    perturbations, holding at most perturbation_store_mb megabytes
+    analytic_center / analytic_scale: calibration of the analytic scorer
+    perturbation_mode: "batched", "prefix" or "sequential" word-drop scoring
+    use_t5: perturb with T5 fills instead of word drops
+    """
+    global detector
+    if detector is None:
+        from model import GPT2PPL
+        detector = GPT2PPL(
+            device=device,
+            model_id=model_id,
+            max_batch_size=max_batch_size,
+            max_batch_tokens=max_batch_tokens,
+            precision=precision,
+            compile_mode=compile_mode,
+            analytic_center=analytic_center,
+            analytic_scale=analytic_scale,
+            perturbation_mode=perturbation_mode,
+            use_t5=use_t5
+        )
+        if perturbation_store_path:
+            from cache import PerturbationStore
+            detector.perturbation_store = PerturbationStore(
+                perturbation_store_path, max_bytes=int(perturbation_store_mb * 1024 * 1024)
+            )
+        if warmup:
+            detector.warmup()
+    return detector
+
+
+def share_detector():
+    """
+    Move the model's weights into shared memory before workers are forked
+    Quantized (int8) weights are packed outside regular tensors; forked
+    workers still share those pages copy-on-write.
+    """
+    detector.model.share_memory()
+
+
+def init_fork_worker(num_threads):
+    """Per-process setup of a forked worker: its share of the CPU cores"""
+    import torch
+    torch.set_num_threads(num_threads)
+
+
+def analyze_batch(items):
+    """
+    Score a micro-batch of (text, scorer) pairs, grouping texts by scorer
+    Analytic results carry their per-segment sums under "segments".
+    """
+    results = [None] * len(items)
+    groups = {}
+    for i, (text, scorer) in enumerate(items):
+        groups.setdefault(scorer, []).append(i)
+
+    for scorer, indices in groups.items():
+        texts = [items[i][0] for i in indices]
+        for i, result in zip(indices, detector.analyzeMany(texts, scorer=scorer, segments=True)):
+            results[i] = result
+
+    return results
+
+
+def analyze_sentences(text):
+    """Per-sentence scores for a document"""
+    return detector.analyzeSentences(text)
+
+
+def analyze_incremental(text, plan, previous_sums, known_sums=None):
+    """Incremental draft-vs-final scoring (see GPT2PPL.analyzeIncremental)"""
+    return detector.analyzeIncremental(text, plan, previous_sums, known_sums)
+
+
+def plan_chunks(text):
+    """Tokens, offsets and chunk ranges of a text for perturbation scoring (see GPT2PPL.makeChunks)"""
+    ids, offsets = detector.encode(text)
+    return ids, offsets, detector.makeChunks(len(ids))
+
+
+def analyze_chunk(text, ids, offsets, context=0):
+    """Perturbation scoring of one chunk of a long document (see GPT2PPL.analyzeChunk)"""
+    return detector.analyzeChunk(text, ids, offsets, context)
+
+
+def pool_chunks(scored, n_chunks):
+    """Document result from its scored chunks (see GPT2PPL.chunkedResult)"""
+    return detector.chunkedResult(scored, n_chunks)
+
+
+def cache_params():
+    """Scoring parameters per scorer, for result cache keys"""
+    return {
+        scorer: detector.cacheParams(scorer)
+        for scorer in ("analytic", "perturbation", "sentences", "segments")
+    }
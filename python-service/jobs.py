@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Persistent detection jobs for long and bulk scoring
+
+A job is a list of documents scored in the background. Jobs and their
+documents live in a SQLite file, and every finished document is checkpointed
+there as soon as it is scored. After a restart, the documents that have no
+result yet are queued again, and finished ones are never rescored. Clients
+poll a job or stream its results instead of holding one HTTP request open.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from executor import QueueFullError
+
+
+class JobStore:
+    """
+    SQLite-backed jobs and per-document results
+
+    A job is "queued" until its first document finishes, "running" while
+    documents remain, then "done". A document's seq is the order in which it
+    finished within its job, so results can be streamed incrementally.
+    Methods block on SQLite; JobRunner calls them on worker threads, so one
+    lock serializes them on the shared connection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, scorer TEXT NOT NULL, status TEXT NOT NULL, "
+            "total INTEGER NOT NULL, completed INTEGER NOT NULL, failed INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "job_id TEXT NOT NULL, idx INTEGER NOT NULL, text TEXT NOT NULL, "
+            "result TEXT, seq INTEGER, PRIMARY KEY (job_id, idx))"
+        )
+        self.db.commit()
+
+    def create(self, texts, scorer):
+        """Persist a new job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        # The connection as a context manager commits, or rolls back on error
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO jobs (id, scorer, status, total, completed, failed, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, 0, ?, ?)",
+                (job_id, scorer, "queued" if texts else "done", len(texts), now, now)
+            )
+            self.db.executemany(
+                "INSERT INTO documents (job_id, idx, text) VALUES (?, ?, ?)",
+                [(job_id, i, text) for i, text in enumerate(texts)]
+            )
+        return job_id
+
+    def job(self, job_id):
+        """Job status and progress, or None for an unknown id"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id, scorer, status, total, completed, failed, created_at, updated_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            keys = ("id", "scorer", "status", "total", "completed", "failed", "created_at", "updated_at")
+            return dict(zip(keys, row))
+
+    def results(self, job_id):
+        """Result of every document of a job in order (None while pending)"""
+        with self.lock:
+            return [
+                json.loads(result) if result is not None else None
+                for (result,) in self.db.execute(
+                    "SELECT result FROM documents WHERE job_id = ? ORDER BY idx", (job_id,)
+                )
+            ]
+
+    def results_after(self, job_id, seq):
+        """(seq, index, result) of the documents that finished after seq, in finishing order"""
+        with self.lock:
+            return [
+                (row_seq, idx, json.loads(result))
+                for row_seq, idx, result in self.db.execute(
+                    "SELECT seq, idx, result FROM documents WHERE job_id = ? AND seq > ? ORDER BY seq",
+                    (job_id, seq)
+                )
+            ]
+
+    def pending(self):
+        """(job id, scorer, index) of every unfinished document, oldest jobs first"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT d.job_id, j.scorer, d.idx FROM documents d JOIN jobs j ON j.id = d.job_id "
+                "WHERE d.result IS NULL ORDER BY j.created_at, d.idx"
+            ).fetchall()
+
+    def text(self, job_id, idx):
+        """Text of one document"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT text FROM documents WHERE job_id = ? AND idx = ?", (job_id, idx)
+            ).fetchone()[0]
+
+    def checkpoint(self, job_id, idx, result, failed=False):
+        """
+        Record a finished document and advance its job
+        Returns False (and changes nothing) if the document already has a
+        result, so a document scored twice is counted once.
+        """
+        with self.lock, self.db:
+            recorded = self.db.execute(
+                "UPDATE documents SET result = ?, seq = (SELECT completed + 1 FROM jobs WHERE id = ?) "
+                "WHERE job_id = ? AND idx = ? AND result IS NULL",
+                (json.dumps(result), job_id, job_id, idx)
+            ).rowcount
+            if not recorded:
+                return False
+            self.db.execute(
+                "UPDATE jobs SET completed = completed + 1, failed = failed + ?, updated_at = ?, "
+                "status = CASE WHEN completed + 1 >= total THEN 'done' ELSE 'running' END "
+                "WHERE id = ?",
+                (int(failed), time.time(), job_id)
+            )
+            return True
+
+    def stats(self):
+        """Job counts by status and documents still to score"""
+        with self.lock:
+            counts = dict(self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            pending = self.db.execute("SELECT COUNT(*) FROM documents WHERE result IS NULL").fetchone()[0]
+            return {"jobs": counts, "pending_documents": pending, "path": self.path}
+
+
+class JobRunner:
+    """
+    Scores the documents of persisted jobs on a pool of asyncio workers
+
+    score is a coroutine function (text, scorer) -> result. workers documents
+    are scored at once, so documents of one job share micro-batches. A
+    document whose scoring raises is checkpointed with an error result; a
+    full inference queue only delays it. Store calls run on worker threads
+    (asyncio.to_thread), never on the event loop. If the store itself fails,
+    the worker logs the error and queues the document again after retry_s.
+    """
+
+    def __init__(self, store, score, workers=4, retry_s=1.0):
+        self.store = store
+        self.score = score
+        self.workers = workers
+        self.retry_s = retry_s
+        self.queue = asyncio.Queue()
+        self.queued = set()  # (job id, index) of documents queued or being scored
+        self.tasks = []
+        self.progress = asyncio.Event()  # set whenever a document is checkpointed
+        self.worker_errors = 0
+
+    async def start(self):
+        """Queue every unfinished document (resuming earlier runs) and start the workers"""
+        # Workers start first, so jobs submitted while the store is read are
+        # queued right away; enqueue skips them when they show up as pending
+        self.queue = asyncio.Queue()
+        self.queued = set()
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+        pending = await asyncio.to_thread(self.store.pending)
+        for item in pending:
+            self.enqueue(item)
+        if pending:
+            print(f"Resuming {len(pending)} pending job document(s)")
+
+    async def stop(self):
+        """Stop the workers; unfinished documents stay pending in the store"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def submit(self, texts, scorer):
+        """Persist a job and queue its documents; returns the job status"""
+        job_id = await asyncio.to_thread(self.store.create, texts, scorer)
+        if self.tasks:
+            for i in range(len(texts)):
+                self.enqueue((job_id, scorer, i))
+        return await self.job(job_id)
+
+    def enqueue(self, item):
+        """Queue a (job id, scorer, index) document unless it is already queued or being scored"""
+        key = (item[0], item[2])
+        if key not in self.queued:
+            self.queued.add(key)
+            self.queue.put_nowait(item)
+
+    async def job(self, job_id):
+        """Job status and progress, or None for an unknown id"""
+        return await asyncio.to_thread(self.store.job, job_id)
+
+    async def results(self, job_id):
+        """Result of every document of a job in order (None while pending)"""
+        return await asyncio.to_thread(self.store.results, job_id)
+
+    async def work(self):
+        """Worker loop: score queued documents one at a time and checkpoint them"""
+        while True:
+            item = await self.queue.get()
+            try:
+                await self.process(*item)
+                self.queued.discard((item[0], item[2]))
+            except Exception as e:
+                # A store failure (disk full, locked database): the document
+                # is still pending, so try it again later
+                self.worker_errors += 1
+                print(f"ERROR in job worker on job {item[0]} document {item[2]}: {e}; retrying in {self.retry_s}s")
+                await asyncio.sleep(self.retry_s)
+                self.queue.put_nowait(item)
+
+    async def process(self, job_id, scorer, idx):
+        """Score one document and checkpoint its result"""
+        text = await asyncio.to_thread(self.store.text, job_id, idx)
+        while True:
+            try:
+                result = await self.score(text, scorer)
+                break
+            except QueueFullError:
+                await asyncio.sleep(self.retry_s)
+            except Exception as e:
+                print(f"ERROR scoring job {job_id} document {idx}: {e}")
+                result = {"error": str(e)}
+                break
+        await asyncio.to_thread(self.store.checkpoint, job_id, idx, result, "error" in result)
+        self.progress.set()
+        self.progress.clear()
+
+    async def wait_progress(self, timeout):
+        """Wait until another document is checkpointed (or timeout seconds pass)"""
+        try:
+            await asyncio.wait_for(self.progress.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def stream(self, job_id, poll_s=1.0):
+        """
+        NDJSON lines with the results of a job as its documents finish
+        Each line is {"index", "result"}; the last one is the final job
+        status (with "status": "done").
+        """
+        seq = 0
+        while True:
+            job = await self.job(job_id)
+            for seq, idx, result in await asyncio.to_thread(self.store.results_after, job_id, seq):
+                yield json.dumps({"index": idx, "result": result}) + "\n"
+            if job["status"] == "done":
+                yield json.dumps(job) + "\n"
+                return
+            await self.wait_progress(poll_s)
+
+    async def stats(self):
+        """Queue depth, worker errors and persisted job counts"""
+        stats = await asyncio.to_thread(self.store.stats)
+        stats["queued_documents"] = self.queue.qsize()
+        stats["workers"] = self.workers
+        stats["worker_errors"] = self.worker_errors
+        return stats
@@ -2,12 +2,24 @@
 """
 FastAPI server for DetectGPT AI content detection
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
-import torch
-from model import GPT2PPL
+from collections import Counter
+import asyncio
+import json
+import math
+import os
+import time
+import inference
+from heuristic import analyze_text as heuristic_analyze
+from cache import ResultCache, cache_key, normalize_text
+from executor import InferenceExecutor, QueueFullError
+from incremental import split_segments, diff_segments
+from jobs import JobStore, JobRunner
+from scheduler import MicroBatcher, SingleFlight
 
 app = FastAPI(
     title="DetectGPT API",
@@ -29,13 +41,129 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global model instance
-detector = None
+# Scoring model: MODEL_ID (gpt2, gpt2-medium, ...) loaded in MODEL_PRECISION
+# ("fp32", "bf16" autocast or "int8" dynamic quantization, CPU only)
+MODEL_ID = os.getenv("MODEL_ID", "gpt2")
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32")
+# Optional compiled forward pass: "trace" (torch.jit.trace) or "compile"
+# (torch.compile), built for padded shape buckets at startup; eager if unset
+# or if compilation fails
+MODEL_COMPILE = os.getenv("MODEL_COMPILE") or None
+# Run a warmup forward per sequence-length bucket before reporting ready
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+
+# Scorer used when a request does not name one. The analytic scorer is only
+# as good as its calibration: fit ANALYTIC_CENTER / ANALYTIC_SCALE for
+# MODEL_ID with calibrate_analytic.py before making it the default
+DEFAULT_SCORER = os.getenv("DEFAULT_SCORER", "perturbation")
+# Scorer of /detect requests with a previousText (draft) that name none:
+# only the analytic scorer rescores a final submission incrementally
+DRAFT_SCORER = os.getenv("DRAFT_SCORER", "analytic")
+ANALYTIC_CENTER = float(os.getenv("ANALYTIC_CENTER", "1.0"))
+ANALYTIC_SCALE = float(os.getenv("ANALYTIC_SCALE", "2.0"))
+
+# How word-drop perturbations go through the model (scores are the same):
+# "batched" pads them into shared [B, T] batches, "prefix" runs each original
+# once and rescores only the tokens after every dropped word from its KV
+# cache, "sequential" scores them one by one
+PERTURBATION_MODE = os.getenv("PERTURBATION_MODE", "batched")
+# Perturb with T5 (t5-base) mask fills instead of word drops: closer to
+# DetectGPT, but loads a second model and generates every perturbation
+USE_T5 = os.getenv("USE_T5", "false").lower() in ("1", "true")
+
+# Micro-batching: concurrent requests are grouped for up to BATCH_WAIT_MS
+# and scored together, bounded by BATCH_MAX_SIZE texts / BATCH_MAX_TOKENS tokens
+BATCH_WAIT_MS = float(os.getenv("BATCH_WAIT_MS", "10"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "8192"))
+
+# Inference executor: model calls run on INFERENCE_WORKERS threads or
+# processes, never on the event loop. At most INFERENCE_MAX_QUEUE requests
+# may wait before new ones get 429; each request has REQUEST_TIMEOUT_S
+# (or its own deadline_ms) to finish. The "fork" backend loads the model once
+# and forks workers sharing its weights, each using INFERENCE_THREADS torch
+# threads (0 = CPU cores / INFERENCE_WORKERS).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "64"))
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", "60"))
+DISCONNECT_POLL_S = 0.25
+# A batch waits this long before retrying a text that found the queue full
+QUEUE_RETRY_S = 0.05
+
+# Result cache: RESULT_CACHE_SIZE results in memory for RESULT_CACHE_TTL_S,
+# plus an optional SQLite tier at RESULT_CACHE_PATH that survives restarts
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "86400"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH") or None
+
+# T5 perturbation store: SQLite file at PERTURBATION_STORE_PATH (empty =
+# disabled) of at most PERTURBATION_STORE_MAX_MB, so re-scoring a text reuses
+# its T5-perturbed texts
+PERTURBATION_STORE_PATH = os.getenv("PERTURBATION_STORE_PATH") or None
+PERTURBATION_STORE_MAX_MB = float(os.getenv("PERTURBATION_STORE_MAX_MB", "1024"))
+
+# Streamed responses: /detect/batch?stream=... and /detect/stream send results
+# as NDJSON lines or Server-Sent Events
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+# Background jobs: POST /jobs persists its texts in the SQLite file at
+# JOBS_PATH and JOB_WORKERS documents are scored at a time; each result is
+# checkpointed, so a restart resumes unfinished jobs without rescoring.
+# Jobs are disabled (the /jobs endpoints answer 503) while JOBS_PATH is unset
+JOBS_PATH = os.getenv("JOBS_PATH") or None
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+# Cascade scorer: the regex/entropy heuristic answers on its own when its AI
+# likelihood is outside [CASCADE_HEURISTIC_LOW, CASCADE_HEURISTIC_HIGH] (and
+# its confidence is not "low"); otherwise the analytic score answers when it
+# is outside [CASCADE_ANALYTIC_LOW, CASCADE_ANALYTIC_HIGH]; texts ambiguous to
+# both get perturbation scoring
+CASCADE_HEURISTIC_LOW = float(os.getenv("CASCADE_HEURISTIC_LOW", "20"))
+CASCADE_HEURISTIC_HIGH = float(os.getenv("CASCADE_HEURISTIC_HIGH", "80"))
+CASCADE_ANALYTIC_LOW = float(os.getenv("CASCADE_ANALYTIC_LOW", "-0.3"))
+CASCADE_ANALYTIC_HIGH = float(os.getenv("CASCADE_ANALYTIC_HIGH", "0.15"))
+
+# Global service state (the model itself lives in inference.detector).
+# The model loads in the background after startup: load_state goes from
+# "loading" to "ready" (batcher is set) or "failed" (load_error).
+executor = None
+batcher = None
+results_cache = None
+job_runner = None
+loader_task = None
+load_state = "loading"
+load_error = None
+model_info = {}
+scoring_params = {}
+cascade_tiers = {"heuristic": 0, "analytic": 0, "perturbation": 0}
+# Identical uncached texts scored concurrently share one computation;
+# duplicates within a /detect/batch call are scored once
+single_flight = SingleFlight()
+batch_duplicates = 0
+
+# Scoring modes: GPT2PPL.analyze's, plus the cascade over heuristic and both
+SCORERS = ("analytic", "perturbation", "cascade")
+
+SCORER_METHODS = {
+    "analytic": "Fast-DetectGPT (GPT-2 Analytic Curvature)",
+    "perturbation": "DetectGPT (GPT-2 Perplexity)",
+    "cascade": "Cascade",
+}
+
+CASCADE_METHODS = {
+    "heuristic": "Cascade: Heuristic Analysis",
+    "analytic": "Cascade: Fast-DetectGPT (GPT-2 Analytic Curvature)",
+    "perturbation": "Cascade: DetectGPT (GPT-2 Perplexity)",
+}
 
 class DetectionRequest(BaseModel):
     text: str
     previousText: Optional[str] = None
     use_gpu: Optional[bool] = False
+    scorer: Optional[str] = None
+    deadline_ms: Optional[int] = None
 
 class DetectionResponse(BaseModel):
     aiLikelihood: int
@@ -46,18 +174,326 @@ class DetectionResponse(BaseModel):
     raw_metrics: dict
     method: str = "DetectGPT"
 
+class JobRequest(BaseModel):
+    texts: list[str]
+    scorer: Optional[str] = None
+
 @app.on_event("startup")
 async def startup_event():
-    """Load model on startup"""
-    global detector
+    """Start loading the model in the background"""
+    global results_cache, job_runner, loader_task
+    
+    if DEFAULT_SCORER not in SCORERS:
+        raise ValueError(f"DEFAULT_SCORER must be one of: {', '.join(SCORERS)}")
+    if DRAFT_SCORER not in SCORERS:
+        raise ValueError(f"DRAFT_SCORER must be one of: {', '.join(SCORERS)}")
+    
+    # The server starts accepting connections right away - /health/live
+    # answers while the model is still loading, /health/ready once it is
+    # loaded and warmed up
+    # Opening (and pruning) the SQLite files runs off the event loop
+    results_cache = await asyncio.to_thread(
+        ResultCache,
+        max_entries=RESULT_CACHE_SIZE,
+        ttl_s=RESULT_CACHE_TTL_S,
+        path=RESULT_CACHE_PATH
+    )
+    # Jobs are accepted while the model loads; their workers start once it is ready
+    job_runner = None
+    if JOBS_PATH:
+        store = await asyncio.to_thread(JobStore, JOBS_PATH)
+        job_runner = JobRunner(store, score_document, workers=JOB_WORKERS)
+    loader_task = asyncio.create_task(load_model())
+
+async def load_model():
+    """Load (and warm up) the model, then start the executor and micro-batcher"""
+    global executor, batcher, load_state, load_error
+    
+    try:
+        # torch is only imported here, off the startup path
+        import torch
+        
+        # Check if CUDA is available
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model_id = MODEL_ID
+        model_args = (device, model_id, BATCH_MAX_SIZE, BATCH_MAX_TOKENS, MODEL_PRECISION,
+                      MODEL_COMPILE, MODEL_WARMUP, PERTURBATION_STORE_PATH, PERTURBATION_STORE_MAX_MB,
+                      ANALYTIC_CENTER, ANALYTIC_SCALE, PERTURBATION_MODE, USE_T5)
+        model_info.update({"device": device, "model": model_id, "precision": MODEL_PRECISION,
+                           "compile": MODEL_COMPILE or "eager"})
+        
+        print(f"Initializing DetectGPT with device: {device}, model: {model_id}, precision: {MODEL_PRECISION}")
+        backend = INFERENCE_BACKEND
+        if backend == "fork" and device != "cpu":
+            # CUDA cannot be used from forked processes
+            print("WARNING: The fork backend is CPU only. Using the thread backend.")
+            backend = "thread"
+        
+        if backend == "fork":
+            # Load once, then fork workers that share the weights
+            threads = INFERENCE_THREADS or max(1, (os.cpu_count() or 1) // INFERENCE_WORKERS)
+            await asyncio.to_thread(inference.load_detector, *model_args)
+            await asyncio.to_thread(inference.share_detector)
+            executor = await asyncio.to_thread(
+                InferenceExecutor,
+                backend="fork",
+                workers=INFERENCE_WORKERS,
+                max_pending=INFERENCE_MAX_QUEUE,
+                initializer=inference.init_fork_worker,
+                initargs=(threads,)
+            )
+            print(f"Forked {INFERENCE_WORKERS} inference worker(s), {threads} torch thread(s) each")
+        elif backend == "process":
+            # Every worker process loads its own model in the initializer
+            executor = InferenceExecutor(
+                backend="process",
+                workers=INFERENCE_WORKERS,
+                max_pending=INFERENCE_MAX_QUEUE,
+                initializer=inference.load_detector,
+                initargs=model_args
+            )
+        else:
+            await asyncio.to_thread(inference.load_detector, *model_args)
+            executor = InferenceExecutor(
+                backend="thread",
+                workers=INFERENCE_WORKERS,
+                max_pending=INFERENCE_MAX_QUEUE
+            )
+        
+        scoring_params.update(await executor.run(inference.cache_params))
+        scoring_params["cascade"] = {
+            "heuristic_band": [CASCADE_HEURISTIC_LOW, CASCADE_HEURISTIC_HIGH],
+            "analytic_band": [CASCADE_ANALYTIC_LOW, CASCADE_ANALYTIC_HIGH],
+            "analytic": scoring_params["analytic"],
+            "perturbation": scoring_params["perturbation"],
+        }
+        print(f"DetectGPT loaded successfully! ({INFERENCE_WORKERS} {backend} worker(s))")
+        
+        new_batcher = MicroBatcher(
+            lambda items: executor.run(inference.analyze_batch, items),
+            max_wait_ms=BATCH_WAIT_MS,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_batch_tokens=BATCH_MAX_TOKENS,
+            max_concurrent_batches=INFERENCE_WORKERS,
+            max_queue=INFERENCE_MAX_QUEUE
+        )
+        await new_batcher.start()
+        batcher = new_batcher
+        load_state = "ready"
+        if job_runner is not None:
+            await job_runner.start()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"ERROR loading model: {str(e)}")
+        load_state = "failed"
+        load_error = str(e)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the model loader, the job workers, the micro-batcher and the inference pool"""
+    if loader_task is not None and not loader_task.done():
+        loader_task.cancel()
+    if job_runner is not None:
+        await job_runner.stop()
+    if batcher is not None:
+        await batcher.stop()
+    if executor is not None:
+        executor.shutdown()
+
+def result_key(text, scorer):
+    """Result cache key for a (normalized) text and scorer"""
+    return cache_key(text, model_info["model"], scorer, scoring_params[scorer])
+
+def cacheable(result):
+    """Only real scores are cached - not errors or neutral fallbacks"""
+    return "error" not in result and "error" not in result.get("raw_metrics", {})
+
+def mark_cached(result):
+    """Copy of a cached result flagged as served from the cache"""
+    return dict(result, raw_metrics=dict(result.get("raw_metrics", {}), cached=True))
+
+def shares_batches(scorer):
+    """
+    Whether texts of scorer share forward passes in a micro-batch
+    Analytic texts and batched word-drop perturbations do; T5 perturbations
+    and the other perturbation modes run every text on its own, so it goes
+    straight to the executor and INFERENCE_WORKERS texts are scored in parallel.
+    """
+    return scorer == "analytic" or (PERTURBATION_MODE == "batched" and not USE_T5)
+
+async def compute_result(key, text, scorer):
+    """
+    Score a normalized text missing from the result cache and cache it
+    Concurrent calls for the same key (retries racing the original,
+    duplicate submissions) await one computation.
+    """
+    async def compute():
+        if scorer == "cascade":
+            result = await analyze_cascade(text)
+        elif shares_batches(scorer):
+            result = await batcher.submit(text, scorer)
+        else:
+            result = (await executor.run(inference.analyze_batch, [(text, scorer)]))[0]
+        # Analytic results bring their per-segment sums for incremental rescoring
+        segments = result.pop("segments", None)
+        if cacheable(result):
+            await results_cache.put_async(key, result)
+            if segments is not None:
+                await results_cache.put_async(result_key(text, "segments"), segments)
+        return result
+    return await single_flight.run(key, compute)
+
+async def compute_queued(key, text, scorer, window):
+    """
+    compute_result for one text of a batch
+    window (a semaphore) bounds how many of the batch's texts wait in the
+    queue at once; a text that still finds the queue full - other requests
+    filled it - waits and retries instead of failing the batch.
+    """
+    async with window:
+        while True:
+            try:
+                return await compute_result(key, text, scorer)
+            except QueueFullError:
+                await asyncio.sleep(QUEUE_RETRY_S)
+
+def batch_window():
+    """
+    Semaphore bounding a batch's queued texts: half the queue, so live
+    /detect requests still find room while a large batch is scored
+    """
+    return asyncio.Semaphore(max(1, batcher.max_queue // 2))
+
+def batch_deadline_ms(n_texts):
+    """Deadline of a batch: REQUEST_TIMEOUT_S per micro-batch worth of texts"""
+    return 1000.0 * REQUEST_TIMEOUT_S * max(1, math.ceil(n_texts / BATCH_MAX_SIZE))
+
+async def score_text(text, scorer):
+    """Result of any scorer for a normalized text, through the result cache"""
+    key = result_key(text, scorer)
+    result = await results_cache.get_async(key)
+    if result is not None:
+        return mark_cached(result)
+    return await compute_result(key, text, scorer)
+
+async def analyze_cascade(text):
+    """
+    Cascade scoring: heuristic, then analytic, then perturbation
+    Each tier answers only when its score is outside its uncertainty band;
+    the result records the deciding tier and the scores of earlier tiers.
+    """
+    heuristic = heuristic_analyze(text)
+    trail = {"heuristic_likelihood": heuristic["aiLikelihood"]}
+    if (
+        "error" not in heuristic["raw_metrics"]
+        and heuristic["confidence"] != "low"
+        and not CASCADE_HEURISTIC_LOW < heuristic["aiLikelihood"] < CASCADE_HEURISTIC_HIGH
+    ):
+        tier, result = "heuristic", heuristic
+    else:
+        result = await score_text(text, "analytic")
+        if "error" in result:
+            return result
+        trail["analytic_score"] = result["score"]
+        if not CASCADE_ANALYTIC_LOW < result["score"] < CASCADE_ANALYTIC_HIGH:
+            tier = "analytic"
+        else:
+            tier, result = "perturbation", await score_text(text, "perturbation")
+            if "error" in result:
+                return result
+    
+    cascade_tiers[tier] += 1
+    raw_metrics = dict(result["raw_metrics"], cascade_tier=tier, **trail)
+    raw_metrics.pop("cached", None)
+    return {
+        "score": result["score"],
+        "aiLikelihood": result["aiLikelihood"],
+        "humanLikelihood": result["humanLikelihood"],
+        "confidence": result["confidence"],
+        "verdict": result["verdict"],
+        "raw_metrics": raw_metrics,
+        "method": CASCADE_METHODS[tier],
+    }
+
+async def score_document(text, scorer):
+    """Result of any scorer for one job document, through the result cache"""
+    text = normalize_text(text)
+    if not text:
+        return {"error": "Text cannot be empty"}
+    return await score_text(text, scorer)
+
+async def document_segments(text):
+    """
+    Per-segment analytic sums of a normalized text (see GPT2PPL.getSegmentSums)
+    They are cached whenever the text is scored with the analytic scorer; a
+    text not scored yet is scored now. None when it cannot be scored.
+    """
+    key = result_key(text, "segments")
+    segments = await results_cache.get_async(key)
+    if segments is None:
+        await compute_result(result_key(text, "analytic"), text, "analytic")
+        segments = await results_cache.get_async(key)
+    return segments
+
+async def analyze_against_draft(text, previous_text):
+    """
+    Score a submission incrementally against its draft
     
-    # Check if CUDA is available
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model_id = "gpt2"  # Use gpt2-medium for better accuracy if you have more RAM
+    Both versions are split into sentence segments and aligned. The draft's
+    per-segment sums (cached when it was scored) are reused for unchanged
+    segments and only the changed span is scored again, in its document
+    context. Drafts that cannot be scored (too short) fall back to scoring
+    the submission on its own.
+    """
+    previous_text = normalize_text(previous_text)
+    previous_segments = split_segments(previous_text)
+    previous_sums = await document_segments(previous_text)
+    if previous_sums is None or len(previous_sums) != len(previous_segments):
+        return await score_text(text, "analytic")
+    
+    plan = diff_segments(previous_segments, split_segments(text))
+    key = result_key(text, "segments")
+    known_sums = await results_cache.get_async(key)
+    result, sums = await executor.run(
+        inference.analyze_incremental, text, plan, previous_sums, known_sums
+    )
+    if known_sums is None:
+        await results_cache.put_async(key, sums)
+    return result
+
+async def run_guarded(http_request: Request, work, deadline_ms=None):
+    """
+    Await inference work with a deadline
+    
+    The work is cancelled - and dropped if it is still queued - when the
+    deadline passes (504) or the client disconnects, e.g. when the
+    dashboard's AbortSignal.timeout fires.
+    """
+    loop = asyncio.get_running_loop()
+    timeout = deadline_ms / 1000.0 if deadline_ms else REQUEST_TIMEOUT_S
+    deadline = loop.time() + timeout
+    task = asyncio.ensure_future(work)
     
-    print(f"Initializing DetectGPT with device: {device}, model: {model_id}")
-    detector = GPT2PPL(device=device, model_id=model_id)
-    print("DetectGPT loaded successfully!")
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise HTTPException(status_code=504, detail="Detection deadline exceeded")
+            
+            done, _ = await asyncio.wait({task}, timeout=min(DISCONNECT_POLL_S, remaining))
+            if done:
+                try:
+                    return task.result()
+                except QueueFullError as e:
+                    raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+            
+            if await http_request.is_disconnected():
+                print("Client disconnected, cancelling detection")
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
 
 @app.get("/")
 async def root():
@@ -66,35 +502,82 @@ async def root():
         "status": "running",
         "service": "DetectGPT AI Detection",
         "version": "1.0.0",
-        "device": detector.device if detector else "not loaded",
-        "model": detector.model_id if detector else "not loaded"
+        "device": model_info.get("device", "not loaded") if batcher else "not loaded",
+        "model": model_info.get("model", "not loaded") if batcher else "not loaded",
+        "precision": model_info.get("precision", "not loaded") if batcher else "not loaded",
+        "model_status": load_state
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the server is up (the model may still be loading)"""
+    if load_state == "failed":
+        raise HTTPException(status_code=500, detail=f"Model failed to load: {load_error}")
+    return {"status": "alive", "model_status": load_state}
+
+@app.get("/health/ready")
 @app.get("/health")
 async def health():
-    """Health check"""
-    if detector is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    """Readiness: the model is loaded and warmed up"""
+    if batcher is None:
+        raise HTTPException(status_code=503, detail=f"Model not loaded ({load_state})")
     return {"status": "healthy", "model_loaded": True}
 
 @app.post("/detect", response_model=DetectionResponse)
-async def detect_ai(request: DetectionRequest):
+async def detect_ai(request: DetectionRequest, http_request: Request):
     """
     Detect if text is AI-generated
     
     - **text**: The text to analyze
-    - **previousText**: Optional previous version to compare
+    - **previousText**: Optional previous version (draft); with the analytic
+      scorer (DRAFT_SCORER when none is named) only segments that changed
+      since the draft are rescored
     - **use_gpu**: Whether to use GPU (if available)
+    - **scorer**: "perturbation" (full DetectGPT), "analytic" (single pass) or
+      "cascade" (heuristic first, escalating only uncertain texts); default
+      DEFAULT_SCORER
+    - **deadline_ms**: Optional per-request deadline (default REQUEST_TIMEOUT_S)
     """
-    if detector is None:
+    if batcher is None:
         raise HTTPException(status_code=503, detail="Model not loaded yet")
     
     if not request.text or len(request.text.strip()) == 0:
         raise HTTPException(status_code=400, detail="Text cannot be empty")
     
+    has_draft = bool(request.previousText and request.previousText.strip())
+    scorer = request.scorer or (DRAFT_SCORER if has_draft else DEFAULT_SCORER)
+    if scorer not in SCORERS:
+        raise HTTPException(status_code=400, detail=f"scorer must be one of: {', '.join(SCORERS)}")
+    
+    text = normalize_text(request.text)
+    key = result_key(text, scorer)
+    
+    incremental = scorer == "analytic" and has_draft and len(text.split()) >= 30
+    
     try:
-        # Analyze the text
-        result = detector.analyze(request.text)
+        method = SCORER_METHODS[scorer]
+        if incremental:
+            result = await run_guarded(
+                http_request,
+                analyze_against_draft(text, request.previousText),
+                request.deadline_ms
+            )
+            if result["raw_metrics"].get("incremental"):
+                method = "Fast-DetectGPT (Incremental vs Draft)"
+        else:
+            result = await results_cache.get_async(key)
+            if result is not None:
+                result = mark_cached(result)
+            else:
+                # Analyze the text (batched with concurrent requests, shared
+                # with concurrent requests for the same text)
+                result = await run_guarded(
+                    http_request,
+                    compute_result(key, text, scorer),
+                    request.deadline_ms
+                )
+            if scorer == "cascade":
+                method = result.get("method", method)
         
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
@@ -106,7 +589,7 @@ async def detect_ai(request: DetectionRequest):
             verdict=result["verdict"],
             score=result["score"],
             raw_metrics=result["raw_metrics"],
-            method="DetectGPT (GPT-2 Perplexity)"
+            method=method
         )
     
     except HTTPException:
@@ -127,22 +610,344 @@ async def detect_ai(request: DetectionRequest):
             method="Error Fallback"
         )
 
-@app.post("/detect/batch")
-async def detect_ai_batch(texts: list[str]):
-    """Batch detection endpoint"""
-    if detector is None:
+@app.post("/detect/sentences")
+async def detect_sentences(request: DetectionRequest, http_request: Request):
+    """
+    Per-sentence detection from a single pass over the whole document
+    
+    Sentences are split on ., ! or ? followed by whitespace and each one is
+    scored from the token log-probs that fall inside it.
+    """
+    if batcher is None:
         raise HTTPException(status_code=503, detail="Model not loaded yet")
     
-    results = []
-    for text in texts:
+    if not request.text or len(request.text.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+    
+    text = normalize_text(request.text)
+    key = result_key(text, "sentences")
+    
+    try:
+        result = await results_cache.get_async(key)
+        if result is None:
+            result = await run_guarded(
+                http_request,
+                executor.run(inference.analyze_sentences, text),
+                request.deadline_ms
+            )
+            await results_cache.put_async(key, result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"ERROR analyzing sentences: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Sentence analysis failed: {str(e)}")
+    
+    result["method"] = "Fast-DetectGPT (GPT-2 Token Attribution)"
+    return result
+
+def check_stream_format(stream):
+    """Reject unknown ?stream= formats"""
+    if stream not in STREAM_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400, detail=f"stream must be one of: {', '.join(STREAM_MEDIA_TYPES)}"
+        )
+
+def stream_event(event, payload, fmt):
+    """One streamed record: an NDJSON line, or an SSE event of type event"""
+    data = json.dumps(payload)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + "\n"
+
+def streaming_response(events, fmt):
+    """StreamingResponse sending the (event, payload) pairs of an async iterator"""
+    async def body():
+        async for event, payload in events:
+            yield stream_event(event, payload, fmt)
+    # no-cache / no proxy buffering, so every record reaches the client right away
+    return StreamingResponse(
+        body(),
+        media_type=STREAM_MEDIA_TYPES[fmt],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def outcome_result(outcome):
+    """Result of a scored batch text, or an error for an exception"""
+    if isinstance(outcome, Exception):
+        return {"error": str(outcome)}
+    return outcome
+
+def batch_summary(results, cached, started):
+    """Aggregate record closing a streamed batch"""
+    scored = [result for result in results if cacheable(result)]
+    return {
+        "done": True,
+        "total": len(results),
+        "failed": len(results) - len(scored),
+        "cached": cached,
+        "aiLikelihood": round(sum(r["aiLikelihood"] for r in scored) / len(scored)) if scored else None,
+        "verdicts": dict(Counter(result["verdict"] for result in scored)),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000),
+    }
+
+async def stream_batch(texts, keys, positions, results, misses, scorer):
+    """
+    (event, payload) pairs of a streamed batch
+    Cached results go out first, then every other text as soon as it is
+    scored (in completion order, duplicates together), then the batch summary.
+    """
+    started = time.perf_counter()
+    cached = 0
+    for i, result in enumerate(results):
+        if result is not None:
+            cached += 1
+            yield "result", {"index": i, "result": result}
+    
+    window = batch_window()
+    
+    async def score(i):
         try:
-            result = detector.analyze(text)
-            results.append(result)
+            return i, await compute_queued(keys[i], texts[i], scorer, window)
         except Exception as e:
-            results.append({"error": str(e)})
+            return i, e
+    
+    # Queue the distinct uncached texts a window at a time; they share micro-batches
+    tasks = [asyncio.ensure_future(score(i)) for i in misses]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            i, outcome = await next_done
+            for j in positions[keys[i]]:
+                results[j] = outcome_result(outcome)
+                yield "result", {"index": j, "result": results[j]}
+    finally:
+        # Client gone: drop the texts that are still queued
+        for task in tasks:
+            task.cancel()
+    
+    yield "done", batch_summary(results, cached, started)
+
+@app.post("/detect/batch")
+async def detect_ai_batch(texts: list[str], http_request: Request, scorer: Optional[str] = None,
+                          stream: Optional[str] = None):
+    """
+    Batch detection endpoint
+    
+    With ?stream=ndjson or ?stream=sse every text's result is sent as soon as
+    it is scored, followed by a summary of the whole batch.
+    """
+    if batcher is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+    
+    scorer = scorer or DEFAULT_SCORER
+    if scorer not in SCORERS:
+        raise HTTPException(status_code=400, detail=f"scorer must be one of: {', '.join(SCORERS)}")
+    if stream is not None:
+        check_stream_format(stream)
+    
+    global batch_duplicates
+    texts = [normalize_text(text) for text in texts]
+    keys = [result_key(text, scorer) for text in texts]
+    
+    # Identical texts are looked up and scored once
+    positions = {}
+    for i, key in enumerate(keys):
+        positions.setdefault(key, []).append(i)
+    batch_duplicates += len(texts) - len(positions)
+    
+    results = [None] * len(texts)
+    misses = []  # first position of every distinct uncached text
+    for key, indices in positions.items():
+        result = await results_cache.get_async(key)
+        if result is None:
+            misses.append(indices[0])
+        else:
+            for i in indices:
+                results[i] = mark_cached(result)
+    
+    # Large batches are queued a window at a time (compute_queued); only a
+    # queue that is already full turns the batch away
+    if misses and batcher.queue.qsize() >= batcher.max_queue:
+        raise HTTPException(status_code=429, detail="Detection queue is full", headers={"Retry-After": "1"})
+    
+    if stream is not None:
+        return streaming_response(stream_batch(texts, keys, positions, results, misses, scorer), stream)
+    
+    # Queue the distinct uncached texts a window at a time; they share micro-batches
+    window = batch_window()
+    outcomes = await run_guarded(
+        http_request,
+        asyncio.gather(
+            *(compute_queued(keys[i], texts[i], scorer, window) for i in misses),
+            return_exceptions=True
+        ),
+        batch_deadline_ms(len(misses))
+    )
+    
+    for i, outcome in zip(misses, outcomes):
+        for j in positions[keys[i]]:
+            results[j] = outcome_result(outcome)
     
     return {"results": results}
 
+async def stream_chunks(text, ids, offsets, chunks):
+    """
+    (event, payload) pairs of a streamed long document
+    Every chunk is scored by its own inference call - in parallel across the
+    inference workers - and sent as soon as it is done; the pooled document
+    result follows and is cached like a /detect result.
+    """
+    started = time.perf_counter()
+    
+    async def score(c):
+        begin, end, weight = chunks[c]
+        try:
+            return c, await executor.run(
+                inference.analyze_chunk, text, ids[begin:end], offsets[begin:end], end - begin - weight
+            )
+        except Exception as e:
+            return c, ({"error": str(e)}, None)
+    
+    tasks = [asyncio.ensure_future(score(c)) for c in range(len(chunks))]
+    likelihoods = [None] * len(chunks)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            c, (result, likelihoods[c]) = await next_done
+            begin, end, _ = chunks[c]
+            yield "chunk", {
+                "chunk": c,
+                "chunks": len(chunks),
+                "start": offsets[begin][0],
+                "end": offsets[end - 1][1],
+                "tokens": end - begin,
+                "result": result,
+            }
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    scored = [(chunk_likelihoods, chunks[c][2]) for c, chunk_likelihoods in enumerate(likelihoods)
+              if chunk_likelihoods is not None]
+    try:
+        result = await executor.run(inference.pool_chunks, scored, len(chunks))
+    except Exception as e:
+        result = {"error": str(e)}
+    if cacheable(result):
+        await results_cache.put_async(result_key(text, "perturbation"), result)
+    yield "done", {
+        "done": True,
+        "chunks": len(chunks),
+        "failed_chunks": len(chunks) - len(scored),
+        "result": result,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000),
+    }
+
+async def single_event(result):
+    """Stream of just the final record, for cached results and documents scored in one piece"""
+    yield "done", {"done": True, "result": result}
+
+@app.post("/detect/stream")
+async def detect_stream(request: DetectionRequest, http_request: Request, stream: str = "ndjson"):
+    """
+    Detection of one document with streamed progress (?stream=ndjson or sse)
+    
+    With the perturbation scorer, a document longer than one chunk is scored
+    chunk by chunk: each chunk's result is sent as soon as it is done, then
+    a "done" record with the pooled document result (the same as /detect's).
+    Short documents, cached results and the other scorers send only the
+    "done" record.
+    """
+    if batcher is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+    
+    if not request.text or len(request.text.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+    
+    scorer = request.scorer or DEFAULT_SCORER
+    if scorer not in SCORERS:
+        raise HTTPException(status_code=400, detail=f"scorer must be one of: {', '.join(SCORERS)}")
+    check_stream_format(stream)
+    
+    text = normalize_text(request.text)
+    cached = await results_cache.get_async(result_key(text, scorer))
+    if cached is not None:
+        return streaming_response(single_event(mark_cached(cached)), stream)
+    
+    chunks = []
+    if scorer == "perturbation" and len(text.split()) >= 30:
+        ids, offsets, chunks = await run_guarded(
+            http_request, executor.run(inference.plan_chunks, text), request.deadline_ms
+        )
+    if len(chunks) <= 1:
+        result = await run_guarded(http_request, score_document(text, scorer), request.deadline_ms)
+        return streaming_response(single_event(result), stream)
+    
+    if executor.pending + len(chunks) > executor.max_pending:
+        raise HTTPException(status_code=429, detail="Inference queue is full", headers={"Retry-After": "1"})
+    return streaming_response(stream_chunks(text, ids, offsets, chunks), stream)
+
+def require_jobs():
+    """Reject /jobs requests while background jobs are disabled"""
+    if job_runner is None:
+        raise HTTPException(status_code=503, detail="Background jobs are disabled (set JOBS_PATH)")
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    """
+    Queue a background detection job
+    
+    - **texts**: The texts to analyze
+    - **scorer**: "perturbation", "analytic" or "cascade" (default DEFAULT_SCORER)
+    
+    Returns the job id right away; poll GET /jobs/{id} or stream
+    GET /jobs/{id}/results. Jobs survive restarts.
+    """
+    require_jobs()
+    if load_state == "failed":
+        raise HTTPException(status_code=503, detail=f"Model failed to load: {load_error}")
+    
+    scorer = request.scorer or DEFAULT_SCORER
+    if scorer not in SCORERS:
+        raise HTTPException(status_code=400, detail=f"scorer must be one of: {', '.join(SCORERS)}")
+    if not request.texts:
+        raise HTTPException(status_code=400, detail="texts cannot be empty")
+    
+    return await job_runner.submit(request.texts, scorer)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status and progress, with the result of every finished document (null while pending)"""
+    require_jobs()
+    job = await job_runner.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["results"] = await job_runner.results(job_id)
+    return job
+
+@app.get("/jobs/{job_id}/results")
+async def stream_job_results(job_id: str):
+    """
+    Stream a job's results as NDJSON
+    
+    One {"index", "result"} line per document as it finishes (in finishing
+    order), then a final line with the job status once the job is done.
+    """
+    require_jobs()
+    if await job_runner.job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(job_runner.stream(job_id), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics():
+    """Service metrics: micro-batching, inference executor, result cache, deduplication and jobs"""
+    return {
+        "scheduler": batcher.stats() if batcher else None,
+        "executor": executor.stats() if executor else None,
+        "cache": results_cache.stats() if results_cache else None,
+        "dedup": dict(single_flight.stats(), batch_duplicates=batch_duplicates),
+        "jobs": await job_runner.stats() if job_runner else None,
+        "cascade_tiers": cascade_tiers
+    }
+
 if __name__ == "__main__":
     import uvicorn
     import os
@@ -7,87 +7,694 @@ This code uses GPT-2 perplexity to detect AI-generated text.
 Published under the MIT license.
 """
 import time
+import bisect
+import contextlib
+import hashlib
+import json
+import os
+import struct
 import torch
 import itertools
 import math
 import numpy as np
 import re
 import transformers
-from transformers import GPT2LMHeadModel, GPT2TokenizerFast
+from transformers import GPT2Config, GPT2LMHeadModel, GPT2TokenizerFast
+from transformers import LogitsProcessor, LogitsProcessorList, TopKLogitsWarper, TopPLogitsWarper
 from transformers import T5Tokenizer
-from scipy.stats import norm
-from difflib import SequenceMatcher
-from multiprocessing.pool import ThreadPool
+from cache import perturbation_key
+from incremental import segment_spans
+try:
+    from transformers.pytorch_utils import Conv1D
+except ImportError:  # transformers < 4.21
+    from transformers.modeling_utils import Conv1D
+try:
+    from transformers import DynamicCache
+except ImportError:  # transformers < 4.36 passes past_key_values as tuples
+    DynamicCache = None
 
-def similar(a, b):
-    return SequenceMatcher(None, a, b).ratio()
+SAFETENSORS_DTYPES = {"F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16}
+
+# getVerdict's (threshold, verdict, confidence) bands, highest first: a score
+# above a threshold gets its band; scores below the last one are
+# VERDICT_FLOOR. Early stopping (verdictSettled) clears every threshold, so
+# more perturbations could change neither the verdict nor its confidence
+VERDICT_BANDS = (
+    (0.3, "Likely AI-generated or heavily AI-assisted", "High"),
+    (0.05, "Likely AI-generated or heavily AI-assisted", "Medium"),
+    (-0.15, "Mixed human and AI content", "Medium"),
+    (-0.5, "Primarily human-written", "Medium"),
+)
+VERDICT_FLOOR = ("Primarily human-written", "High")
 
 def normCdf(x):
-    return norm.cdf(x)
+    return 0.5 * (1.0 + math.erf(x / math.sqrt(2.0)))
 
 def likelihoodRatio(x, y):
     return normCdf(x)/normCdf(y)
 
-torch.manual_seed(0)
-np.random.seed(0)
+def resolveSnapshot(model_id):
+    """
+    Local snapshot directory for model_id, or None
+    model_id may itself be a directory (save_pretrained output); otherwise
+    the Hugging Face cache is searched without touching the network.
+    """
+    if os.path.isdir(model_id):
+        return model_id
+    try:
+        from huggingface_hub import snapshot_download
+        return snapshot_download(model_id, local_files_only=True)
+    except Exception:
+        return None
+
+def mmapSafetensors(path):
+    """
+    State dict whose tensors are views into a private memory map of a
+    .safetensors file: pages are only read when a weight is first touched
+    Only floating-point tensors (the weights) are mapped; others, such as
+    the U8 / BOOL attention masks of legacy checkpoints, are skipped - the
+    model builds those buffers itself.
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+    data = torch.from_file(path, shared=False, size=os.path.getsize(path), dtype=torch.uint8)
+    start = 8 + header_size
+    state_dict = {}
+    for name, info in header.items():
+        if info["dtype"] not in SAFETENSORS_DTYPES:
+            continue
+        begin, end = info["data_offsets"]
+        tensor = data[start + begin:start + end].view(SAFETENSORS_DTYPES[info["dtype"]])
+        state_dict[name] = tensor.view(info["shape"])
+    return state_dict
+
+@contextlib.contextmanager
+def emptyParameters():
+    """
+    Create module parameters on the meta device - no allocation or random
+    init - while buffers (GPT-2's causal mask) are still built for real
+    """
+    register_parameter = torch.nn.Module.register_parameter
+
+    def register_empty(module, name, param):
+        register_parameter(module, name, param)
+        if param is not None:
+            module._parameters[name] = torch.nn.Parameter(param.to("meta"), requires_grad=param.requires_grad)
+
+    torch.nn.Module.register_parameter = register_empty
+    try:
+        yield
+    finally:
+        torch.nn.Module.register_parameter = register_parameter
+
+def loadSnapshotModel(snapshot):
+    """
+    GPT2LMHeadModel from a local snapshot with memory-mapped weights
+    The parameters are assigned the mmap'd tensors directly (zero copy).
+    Raises if the snapshot has no model.safetensors or leaves weights unset.
+    """
+    weights = os.path.join(snapshot, "model.safetensors")
+    if not os.path.isfile(weights):
+        raise FileNotFoundError(f"no model.safetensors in {snapshot}")
+    state_dict = mmapSafetensors(weights)
+    with emptyParameters():
+        model = GPT2LMHeadModel(GPT2Config.from_pretrained(snapshot))
+    # The original gpt2 checkpoints store the body's weights without the
+    # "transformer." prefix
+    target = model if any(k.startswith("transformer.") for k in state_dict) else model.transformer
+    target.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+    unset = [name for name, param in model.named_parameters() if param.is_meta]
+    if unset:
+        raise RuntimeError(f"weights missing from {weights}: {', '.join(unset[:3])}")
+    return model
+
+def conv1dToLinear(module):
+    """
+    Replace GPT-2's Conv1D layers (weight stored as [in, out]) with equivalent
+    nn.Linear layers, which dynamic quantization knows how to handle
+    """
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            n_in, n_out = child.weight.shape
+            linear = torch.nn.Linear(n_in, n_out)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            conv1dToLinear(child)
+    return module
+
+class TransformerBody(torch.nn.Module):
+    """
+    GPT-2 body returning only the last hidden state (a traceable signature)
+    The causal + padding mask is built here as a 4D additive mask from plain
+    tensor ops, since transformers' own mask construction cannot be traced.
+    """
+
+    def __init__(self, transformer):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, input_ids, attention_mask):
+        width = input_ids.shape[1]
+        dtype = self.transformer.wte.weight.dtype
+        causal = torch.ones(width, width, dtype=torch.bool, device=input_ids.device).tril()
+        allowed = causal[None, None] & attention_mask[:, None, None, :].bool()
+        mask = torch.zeros(allowed.shape, dtype=dtype, device=input_ids.device)
+        mask = mask.masked_fill(~allowed, torch.finfo(dtype).min)
+        return self.transformer(
+            input_ids, attention_mask=mask, use_cache=False, return_dict=False
+        )[0]
+
+class GeneratorSampling(LogitsProcessor):
+    """
+    Sample the next token of each row from its own torch.Generator and force it
+    Used with generate(do_sample=False): transformers' own sampling draws
+    from the global torch RNG, which concurrent requests would share. One
+    generator per row keeps a row's sample independent of its batch.
+    """
+    def __init__(self, generators):
+        self.generators = generators
+
+    def __call__(self, input_ids, scores):
+        probs = torch.softmax(scores.float(), dim=-1)
+        tokens = torch.cat([
+            torch.multinomial(row, 1, generator=generator)
+            for row, generator in zip(probs, self.generators)
+        ])
+        return torch.full_like(scores, -float("inf")).scatter(1, tokens[:, None], 0.0)
+
 
 class GPT2PPL:
-    def __init__(self, device="cpu", model_id="gpt2"):
+    def __init__(self, device="cpu", model_id="gpt2", max_batch_size=16, max_batch_tokens=8192,
+                 precision="fp32", compile_mode=None, analytic_center=1.0, analytic_scale=2.0,
+                 perturbation_mode="batched", use_t5=False):
         """
         Initialize DetectGPT with GPT-2 model
         Note: Using 'cpu' and 'gpt2' (small) for better compatibility
         For better accuracy, use 'cuda' and 'gpt2-medium' if GPU is available
+
+        max_batch_size / max_batch_tokens bound the padded [B, T] tensors used
+        when scoring perturbations in batched mode
+
+        precision: "fp32", "bf16" (forward passes under bfloat16 autocast) or
+        "int8" (dynamic int8 quantization of every Linear / Conv1D layer, CPU
+        only); see precision_report.py for the score drift of each mode
+
+        compile_mode: None (eager), "trace" (torch.jit.trace) or "compile"
+        (torch.compile) for the batched scoring forward pass; see
+        compileForward
+
+        analytic_center / analytic_scale map the analytic curvature onto the
+        perturbation score (see curvatureScore); fit them for a model with
+        calibrate_analytic.py
+
+        perturbation_mode: how word-drop perturbations go through the model,
+        "batched", "prefix" or "sequential" (see roundLikelihoods); scores do
+        not depend on it
+
+        use_t5: perturb texts by filling masked spans with T5 (t5_model_id,
+        loaded here) instead of dropping words - closer to DetectGPT, slower
         """
+        if compile_mode not in (None, "trace", "compile"):
+            raise ValueError(f"Unknown compile mode: {compile_mode}")
+        if precision not in ("fp32", "bf16", "int8"):
+            raise ValueError(f"Unknown precision: {precision}")
+        if precision == "int8" and device != "cpu":
+            raise ValueError("int8 precision is only supported on cpu")
+        if analytic_scale <= 0:
+            raise ValueError(f"analytic_scale must be positive: {analytic_scale}")
+        if perturbation_mode not in ("batched", "prefix", "sequential"):
+            raise ValueError(f"Unknown perturbation mode: {perturbation_mode}")
         self.device = device
         self.model_id = model_id
+        self.precision = precision
         
-        print(f"Loading {model_id} model on {device}...")
-        self.model = GPT2LMHeadModel.from_pretrained(model_id).to(device)
-        self.tokenizer = GPT2TokenizerFast.from_pretrained(model_id)
+        print(f"Loading {model_id} model on {device} ({precision})...")
+        snapshot = resolveSnapshot(model_id)
+        self.model = None
+        if snapshot is not None:
+            try:
+                self.model = loadSnapshotModel(snapshot).to(device)
+            except Exception as e:
+                print(f"WARNING: Memory-mapped load from {snapshot} failed ({e}). Using from_pretrained.")
+        if self.model is None:
+            self.model = GPT2LMHeadModel.from_pretrained(model_id).to(device)
+        self.tokenizer = GPT2TokenizerFast.from_pretrained(snapshot or model_id)
+        if precision == "int8":
+            # Weights are stored as int8 with per-channel scales; activations
+            # are quantized on the fly. The LM head is quantized too, so it
+            # no longer shares its weights with the (fp32) input embedding.
+            conv1dToLinear(self.model)
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model,
+                {torch.nn.Linear: torch.ao.quantization.per_channel_dynamic_qconfig},
+                dtype=torch.qint8
+            )
+        self.model.eval()
 
         self.max_length = self.model.config.n_positions
         self.stride = 512
         self.threshold = 0.5  # Adjusted threshold
+        # Perturbation scoring cuts long texts into chunks of chunk_tokens
+        # tokens, consecutive chunks sharing chunk_overlap tokens of context
+        self.chunk_tokens = 768
+        self.chunk_overlap = 64
+
+        # Perturbations are scored in rounds: min_perturbations first, then
+        # perturbation_round more at a time, up to max_perturbations, until
+        # the score's confidence interval (adaptive_z standard errors) clears
+        # every VERDICT_BANDS threshold
+        self.min_perturbations = 10
+        self.perturbation_round = 5
+        self.max_perturbations = 30
+        self.adaptive_z = 1.96
+        # Perturbations of a text are drawn from generators seeded with seed
+        # and a hash of the text (see textRng): reproducible, and concurrent
+        # calls never touch shared RNG state
+        self.seed = 42
+
+        # Perturbation scoring: "batched" pads the original and all of its
+        # perturbations into a few [B, T] batches, "prefix" runs the original once
+        # and rescores only the suffix after each dropped word from its KV cache,
+        # "sequential" scores them one by one
+        self.perturbation_mode = perturbation_mode
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        # Positions (summed over the batch) pushed through the LM head at once
+        self.head_chunk_tokens = 256
+
+        # Compiled forward passes run on inputs padded up to one of these
+        # shapes (rows x tokens), all compiled once at startup. Rows come in
+        # powers of two, so padding a batch never adds more than a third of
+        # its rows (see rowPieces)
+        self.length_buckets = tuple(b for b in (64, 128, 256, 512) if b < self.max_length) + (self.max_length,)
+        self.batch_buckets = tuple(b for b in (1, 2, 4, 8, 16, 32) if b < max_batch_size) + (max_batch_size,)
+        self.compile_mode = compile_mode
+        self.compiled = {}  # (rows, tokens) -> compiled body
+        # Largest relative difference (norm of the difference over the norm
+        # of the eager output) a compiled graph may show against eager mode:
+        # bfloat16 rounds to ~3 significant digits, and fused kernels round
+        # in a different order than eager ones
+        self.compile_tolerance = {"fp32": 1e-4, "bf16": 3e-2, "int8": 1e-3}[precision]
+        self.eager_shapes = set()  # batch shapes already reported as run eagerly
+
+        # Analytic (Fast-DetectGPT) curvature is rescaled onto the range of the
+        # perturbation score so getVerdict thresholds apply to both scorers.
+        # The defaults are an uncalibrated guess for gpt2, which is why the
+        # service defaults to the perturbation scorer until they are fitted
+        # (calibrate_analytic.py)
+        self.analytic_center = analytic_center
+        self.analytic_scale = analytic_scale
 
-        # T5 for text perturbation (optional, can be disabled for faster inference)
-        self.use_t5 = False  # Set to True for more accurate detection but slower
+        # T5 for text perturbation (optional, off for faster inference)
+        self.use_t5 = use_t5
+        self.t5_model_id = "t5-base"
+        # Masking: spans of mask_span words covering about mask_ratio of the
+        # words; fills sampled with top-k / top-p
+        self.mask_span = 2
+        self.mask_ratio = 0.3
+        self.t5_top_k = 50
+        self.t5_top_p = 0.96
+        # Masked variants filled per generate() call, and the fill length limit
+        self.t5_batch_size = 8
+        self.t5_max_new_tokens = 256
+        # Optional PerturbationStore (cache.py): T5-perturbed texts are looked
+        # up there before generating and saved after
+        self.perturbation_store = None
         if self.use_t5:
             print("Loading T5 model for text perturbation...")
-            self.t5_model = transformers.AutoModelForSeq2SeqLM.from_pretrained("t5-base").to(device)
-            self.t5_tokenizer = T5Tokenizer.from_pretrained("t5-base", model_max_length=512)
+            self.t5_model = transformers.AutoModelForSeq2SeqLM.from_pretrained(self.t5_model_id).to(device)
+            self.t5_tokenizer = T5Tokenizer.from_pretrained(self.t5_model_id, model_max_length=512)
+
+        if compile_mode:
+            self.compileForward()
+
+    def bucketShape(self, rows, width):
+        """Smallest compiled (rows, tokens) bucket holding a batch, or None"""
+        rows_bucket = next((b for b in self.batch_buckets if b >= rows), None)
+        width_bucket = next((b for b in self.length_buckets if b >= width), None)
+        if rows_bucket is None or width_bucket is None:
+            return None
+        return rows_bucket, width_bucket
+
+    def rowPieces(self, rows, width):
+        """
+        Split a batch of rows into pieces that each fill a compiled bucket well
+        The remaining rows are padded up to the next compiled bucket when they
+        fill at least three quarters of it; otherwise the largest compiled
+        bucket that they fill completely is split off (5 rows: 4 + 1, not 8).
+        Returns the row counts of the pieces.
+        """
+        width_bucket = next((b for b in self.length_buckets if b >= width), None)
+        compiled = [b for b in self.batch_buckets if (b, width_bucket) in self.compiled]
+        pieces = []
+        while rows > 0:
+            bucket = next((b for b in compiled if b >= rows), None)
+            if bucket is None or rows * 4 < bucket * 3:
+                bucket = max((b for b in compiled if b <= rows), default=rows)
+            piece = min(bucket, rows)
+            pieces.append(piece)
+            rows -= piece
+        return pieces
+
+    def compileForward(self):
+        """
+        Compile the scoring forward pass for every shape bucket
+        Batches are padded up to a bucket, so all compilation (or tracing)
+        happens here at startup, never while serving. Buckets larger than
+        max_batch_tokens are skipped - makeBatches never builds them, except
+        for a single long sequence. The first compiled graph is checked
+        against eager mode, within compile_tolerance for the precision; on
+        any failure the service logs a warning and keeps running eagerly.
+        """
+        shapes = [
+            (rows, width)
+            for width in self.length_buckets
+            for rows in self.batch_buckets
+            if rows == 1 or rows * width <= self.max_batch_tokens
+        ]
+        print(f"Compiling scoring forward ({self.compile_mode}) for {len(shapes)} shape buckets...")
+        start = time.time()
+        body = TransformerBody(self.model.transformer).eval()
+        try:
+            if self.compile_mode == "compile":
+                from torch._dynamo import config as dynamo_config
+                # One graph per bucket; the default limit would fall back to
+                # eager after 8 shapes
+                limit = len(shapes) + 8
+                if hasattr(dynamo_config, "recompile_limit"):
+                    dynamo_config.recompile_limit = max(dynamo_config.recompile_limit, limit)
+                dynamo_config.cache_size_limit = max(dynamo_config.cache_size_limit, limit)
+                compiled_body = torch.compile(body, dynamic=False)
+
+            with torch.no_grad(), self.autocast():
+                for rows, width in shapes:
+                    input_ids = torch.full((rows, width), self.tokenizer.eos_token_id,
+                                           dtype=torch.long, device=self.device)
+                    attention_mask = torch.ones_like(input_ids)
+                    attention_mask[rows // 2:, width // 2:] = 0  # warm with padding, as served
+                    if self.compile_mode == "trace":
+                        compiled = torch.jit.trace(body, (input_ids, attention_mask), check_trace=False)
+                    else:
+                        compiled = compiled_body
+                    hidden = compiled(input_ids, attention_mask)
+                    if not self.compiled:
+                        # Graphs are built per shape, so checking the first
+                        # one against the plain eager forward is enough
+                        expected = self.model.transformer(input_ids, attention_mask=attention_mask).last_hidden_state
+                        keep = attention_mask.bool()
+                        expected = expected.float()[keep]
+                        difference = float((hidden.float()[keep] - expected).norm() / expected.norm().clamp_min(1e-12))
+                        if not difference <= self.compile_tolerance:
+                            raise RuntimeError(
+                                f"compiled output differs from eager for shape {rows}x{width}: relative "
+                                f"difference {difference:.2e} > {self.compile_tolerance:.0e} ({self.precision})"
+                            )
+                    self.compiled[rows, width] = compiled
+        except Exception as e:
+            reason = str(e).splitlines()[0] if str(e) else type(e).__name__
+            print(f"WARNING: Compiling the forward pass ({self.compile_mode}, {self.precision}) failed "
+                  f"({reason}). Falling back to eager mode.")
+            self.compiled = {}
+            return
+        print(f"Compiled {len(shapes)} shape buckets in {time.time() - start:.1f}s")
+
+    def warmup(self):
+        """
+        One forward pass (body and LM head) per sequence-length bucket
+        The first pass at each shape pays for lazy kernel setup and memory
+        allocation; doing that at startup keeps it off the first requests.
+        """
+        start = time.time()
+        for width in self.length_buckets:
+            input_ids = torch.full((1, width), self.tokenizer.eos_token_id, dtype=torch.long, device=self.device)
+            with torch.no_grad(), self.autocast():
+                hidden = self.runBody(input_ids, torch.ones_like(input_ids))
+                self.headLogProbs(hidden[:, :-1], input_ids[:, 1:], analytic=True)
+        print(f"Warmed up {len(self.length_buckets)} sequence lengths in {time.time() - start:.1f}s")
+
+    def runBody(self, input_ids, attention_mask):
+        """
+        Last hidden states of GPT-2's body for a right-padded batch
+        Uses the compiled graph of the batch's bucket when there is one:
+        extra rows and columns are padding, which cannot change the real
+        positions (causal attention, masked keys) and are sliced off again.
+        Batches that would need mostly padding rows are split (rowPieces).
+        """
+        rows, width = input_ids.shape
+        if not self.compiled:
+            return self.model.transformer(input_ids, attention_mask=attention_mask).last_hidden_state
+
+        pieces = self.rowPieces(rows, width)
+        if len(pieces) > 1:
+            bounds = np.cumsum([0] + pieces).tolist()
+            return torch.cat([
+                self.runBody(input_ids[a:b], attention_mask[a:b]) for a, b in zip(bounds, bounds[1:])
+            ])
+
+        shape = self.bucketShape(rows, width)
+        compiled = self.compiled.get(shape) if shape else None
+        if compiled is None:
+            if (rows, width) not in self.eager_shapes:
+                self.eager_shapes.add((rows, width))
+                print(f"WARNING: No compiled graph for a {rows}x{width} batch; running it in eager mode.")
+            return self.model.transformer(input_ids, attention_mask=attention_mask).last_hidden_state
+
+        padded_ids = torch.full(shape, self.tokenizer.eos_token_id, dtype=torch.long, device=self.device)
+        padded_mask = torch.zeros(shape, dtype=torch.long, device=self.device)
+        padded_ids[:rows, :width] = input_ids
+        padded_mask[:rows, :width] = attention_mask
+        # Rows that are pure padding still attend to their first position
+        padded_mask[rows:, 0] = 1
+        try:
+            return compiled(padded_ids, padded_mask)[:rows, :width]
+        except Exception as e:
+            print(f"WARNING: Compiled forward failed ({e}). Falling back to eager mode.")
+            self.compiled = {}
+            return self.model.transformer(input_ids, attention_mask=attention_mask).last_hidden_state
+
+    def autocast(self):
+        """Context for GPT-2 forward passes: bfloat16 autocast in bf16 mode"""
+        if self.precision == "bf16":
+            # No weight-cast cache: it only helps autograd, and traced graphs
+            # would capture the cached casts as constants
+            return torch.autocast(device_type=torch.device(self.device).type, dtype=torch.bfloat16,
+                                  cache_enabled=False)
+        return contextlib.nullcontext()
 
     def getLogLikelihood(self, text):
         """Calculate log-likelihood of text using GPT-2"""
-        with torch.no_grad():
-            encodings = self.tokenizer(text, return_tensors="pt")
-            seq_len = encodings.input_ids.size(1)
-
-            nlls = []
-            prev_end_loc = 0
-            for begin_loc in range(0, seq_len, self.stride):
-                end_loc = min(begin_loc + self.max_length, seq_len)
-                trg_len = end_loc - prev_end_loc
-                input_ids = encodings.input_ids[:, begin_loc:end_loc].to(self.device)
-                target_ids = input_ids.clone()
-                target_ids[:, :-trg_len] = -100
-
-                outputs = self.model(input_ids, labels=target_ids)
-                neg_log_likelihood = outputs.loss
-
-                nlls.append(neg_log_likelihood)
-
-                prev_end_loc = end_loc
-                if end_loc == seq_len:
-                    break
+        return self.getLogLikelihoods([text])[0]
+
+    def makeWindows(self, seq_len):
+        """
+        Sliding windows over a sequence of seq_len tokens
+        Returns (begin, end, first_target) triples. Each window holds at most
+        max_length tokens and starts stride tokens after the previous one;
+        only its tokens from first_target on are scored, the ones before are
+        context, so every token after the first is scored exactly once.
+        """
+        # A stride wider than the context would skip tokens between windows
+        stride = min(self.stride, self.max_length - 1)
+        windows = []
+        prev_end_loc = 0
+        for begin_loc in range(0, seq_len, stride):
+            end_loc = min(begin_loc + self.max_length, seq_len)
+            trg_len = end_loc - prev_end_loc
+            windows.append((begin_loc, end_loc, max(1, (end_loc - begin_loc) - trg_len)))
+            prev_end_loc = end_loc
+            if end_loc == seq_len:
+                break
+        return windows
+
+    def makeBatches(self, lengths):
+        """
+        Group sequence indices into batches that respect max_batch_size and
+        max_batch_tokens (padded width * rows). Sequences are sorted by length
+        so each batch carries as little padding as possible.
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches = []
+        current = []
+        for i in order:
+            # Longest sequence of the batch is its first entry
+            width = lengths[current[0]] if current else lengths[i]
+            if current and (len(current) >= self.max_batch_size or
+                            width * (len(current) + 1) > self.max_batch_tokens):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def headLogProbs(self, hidden, targets, analytic=False):
+        """
+        Apply the LM head to hidden states [B, T, H] a few positions at a time
+        Full logits are [B, T, vocab] - about 200 MB in float32 for a single
+        1024-token window - so only head_chunk_tokens positions are projected
+        at once and reduced to what the scorers need: the log-prob of each
+        target token (via its logit and the log-sum-exp) and, with
+        analytic=True, the mean and variance of the log-prob under the
+        model's distribution.
+        Returns a dict of [B, T] CPU tensors: ll (and mean, var).
+        """
+        batch_size, width = targets.shape
+        step = max(1, self.head_chunk_tokens // batch_size)
+        stats = {"ll": torch.empty(batch_size, width)}
+        if analytic:
+            stats["mean"] = torch.empty(batch_size, width)
+            stats["var"] = torch.empty(batch_size, width)
+
+        for start in range(0, width, step):
+            end = min(start + step, width)
+            logits = self.model.lm_head(hidden[:, start:end]).float()
+            lse = torch.logsumexp(logits, dim=-1)
+            target_logits = logits.gather(-1, targets[:, start:end].unsqueeze(-1)).squeeze(-1)
+            stats["ll"][:, start:end] = (target_logits - lse).cpu()
+            if analytic:
+                log_probs = logits.sub_(lse.unsqueeze(-1))
+                weighted = log_probs.exp().mul_(log_probs)  # p * log p
+                mean = weighted.sum(dim=-1)
+                second = weighted.mul_(log_probs).sum(dim=-1)  # E[(log p)^2]
+                stats["mean"][:, start:end] = mean.cpu()
+                stats["var"][:, start:end] = (second - mean.square()).cpu()
+            del logits
+
+        return stats
+
+    def scoreTokens(self, sequences, first_targets=None, analytic=False):
+        """
+        Per-token log-probs for token-id sequences of at most max_length tokens
+        Sequences are right-padded into [B, T] tensors with an attention mask,
+        so each batch costs a single forward pass. Tokens from
+        first_targets[i] (default 1) on are scored; the ones before only
+        provide context.
+        Returns one tensor per sequence, or with analytic=True a dict of
+        ll / mean / var tensors (see getTokenStats).
+        """
+        if first_targets is None:
+            first_targets = [1] * len(sequences)
+        empty = torch.zeros(0)
+        results = [
+            {"ll": empty, "mean": empty, "var": empty} if analytic else empty
+        ] * len(sequences)
+        live = [i for i, seq in enumerate(sequences) if len(seq) > first_targets[i]]
+        pad_id = self.tokenizer.eos_token_id
+
+        with torch.no_grad(), self.autocast():
+            for batch in self.makeBatches([len(sequences[i]) for i in live]):
+                rows = [live[b] for b in batch]
+                width = max(len(sequences[i]) for i in rows)
+                input_ids = torch.full((len(rows), width), pad_id, dtype=torch.long)
+                attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+                for row, i in enumerate(rows):
+                    input_ids[row, :len(sequences[i])] = torch.tensor(sequences[i], dtype=torch.long)
+                    attention_mask[row, :len(sequences[i])] = 1
+                input_ids = input_ids.to(self.device)
+                attention_mask = attention_mask.to(self.device)
+
+                hidden = self.runBody(input_ids, attention_mask)
+                # Same shift as the labels= loss: position t predicts token t+1
+                stats = self.headLogProbs(hidden[:, :-1], input_ids[:, 1:], analytic)
+                del hidden
 
-            return -torch.stack(nlls).mean()
+                for row, i in enumerate(rows):
+                    targets = slice(first_targets[i] - 1, len(sequences[i]) - 1)
+                    if analytic:
+                        results[i] = {key: value[row, targets] for key, value in stats.items()}
+                    else:
+                        results[i] = stats["ll"][row, targets]
+
+        return results
+
+    def scoreWindowed(self, sequences, analytic=False):
+        """
+        Per-token log-probs for token-id sequences of any length
+        Sequences longer than the model context are cut into sliding windows
+        (makeWindows); the windows of all sequences share the same padded
+        batches. Returns what scoreTokens returns, one entry per sequence.
+        """
+        windows, first_targets, owners = [], [], []
+        for i, seq in enumerate(sequences):
+            for begin, end, first in self.makeWindows(len(seq)):
+                windows.append(seq[begin:end])
+                first_targets.append(first)
+                owners.append(i)
+
+        parts = [[] for _ in sequences]
+        for owner, part in zip(owners, self.scoreTokens(windows, first_targets, analytic)):
+            parts[owner].append(part)
+
+        if analytic:
+            return [
+                {key: torch.cat([part[key] for part in seq_parts]) for key in ("ll", "mean", "var")}
+                for seq_parts in parts
+            ]
+        return [torch.cat(seq_parts) for seq_parts in parts]
+
+    def getBatchNLL(self, sequences, first_targets=None):
+        """
+        Calculate the mean negative log-likelihood of each token-id sequence
+        Long sequences are windowed; the NLL is averaged over tokens, not
+        windows. first_targets[i] > 1 makes the tokens of sequence i before
+        it context only (sequences within the model context).
+        """
+        if first_targets is None or all(first <= 1 for first in first_targets):
+            lls = self.scoreWindowed(sequences)
+        else:
+            lls = self.scoreTokens(sequences, first_targets)
+        return torch.stack([-ll.sum() / max(ll.numel(), 1) for ll in lls])
+
+    def getLogLikelihoods(self, texts):
+        """
+        Calculate log-likelihoods of several texts with batched forward passes
+        Texts longer than the model context are windowed; their windows are
+        batched together with the other texts.
+        """
+        if not texts:
+            return torch.zeros(0)
+        return -self.getBatchNLL([self.tokenizer(text).input_ids for text in texts])
+
+    def encode(self, text):
+        """Token ids of text with their character offsets, from one tokenizer call"""
+        encoding = self.tokenizer(text, return_offsets_mapping=True)
+        return encoding.input_ids, encoding.offset_mapping
+
+    def makeChunks(self, n_tokens):
+        """
+        Cut a text of n_tokens tokens into chunks of at most chunk_tokens
+        Consecutive chunks overlap by chunk_overlap tokens. Returns
+        (begin, end, weight) token ranges, where weight is the number of
+        tokens the chunk adds on top of the previous one. The end - begin -
+        weight overlap tokens at the start of a later chunk are context only:
+        they are neither scored nor perturbed again.
+        """
+        chunk_tokens = min(self.chunk_tokens, self.max_length)
+        if n_tokens <= chunk_tokens:
+            return [(0, n_tokens, n_tokens)]
+
+        step = chunk_tokens - self.chunk_overlap
+        chunks = []
+        for begin in range(0, n_tokens, step):
+            end = min(begin + chunk_tokens, n_tokens)
+            weight = end - begin if begin == 0 else end - begin - self.chunk_overlap
+            chunks.append((begin, end, weight))
+            if end == n_tokens:
+                break
+        return chunks
 
     def apply_extracted_fills(self, masked_texts, extracted_fills):
-        """Apply T5 fills to masked text"""
+        """Apply T5 fills to masked text (None where fills are missing)"""
         texts = []
         for idx, (text, fills) in enumerate(zip(masked_texts, extracted_fills)):
             tokens = list(re.finditer("<extra_id_\\d+>", text))
             if len(fills) < len(tokens):
+                texts.append(None)
                 continue
 
             offset = 0
@@ -99,39 +706,67 @@ class GPT2PPL:
 
         return texts
 
-    def unmasker(self, text, num_of_masks):
-        """Use T5 to fill masked tokens"""
+    def unmasker(self, texts, num_of_masks, generators):
+        """
+        Use T5 to fill masked tokens
+        texts are filled t5_batch_size at a time in padded generate() calls;
+        texts[i] samples from generators[i] (a torch.Generator). Returns the
+        filled texts in order, None for those T5 did not fill completely.
+        """
         if not self.use_t5:
             return []
-            
-        num_of_masks = max(num_of_masks)
-        stop_id = self.t5_tokenizer.encode(f"<extra_id_{num_of_masks}>")[0]
-        tokens = self.t5_tokenizer(text, return_tensors="pt", padding=True)
-        for key in tokens:
-            tokens[key] = tokens[key].to(self.device)
-
-        output_sequences = self.t5_model.generate(
-            **tokens, 
-            max_length=512, 
-            do_sample=True, 
-            top_p=0.96, 
-            num_return_sequences=1, 
-            eos_token_id=stop_id
-        )
-        results = self.t5_tokenizer.batch_decode(output_sequences, skip_special_tokens=False)
 
-        texts = [x.replace("<pad>", "").replace("</s>", "").strip() for x in results]
+        results = []
+        for start in range(0, len(texts), self.t5_batch_size):
+            end = start + self.t5_batch_size
+            stop_id = self.t5_tokenizer.encode(f"<extra_id_{max(num_of_masks[start:end])}>")[0]
+            tokens = self.t5_tokenizer(texts[start:end], return_tensors="pt", padding=True)
+            for key in tokens:
+                tokens[key] = tokens[key].to(self.device)
+
+            # Top-k / top-p sampling, from the rows' own generators
+            sampling = LogitsProcessorList([
+                TopKLogitsWarper(self.t5_top_k), TopPLogitsWarper(self.t5_top_p),
+                GeneratorSampling(generators[start:end])
+            ])
+            with torch.no_grad():
+                output_sequences = self.t5_model.generate(
+                    **tokens,
+                    max_new_tokens=self.t5_max_new_tokens,
+                    do_sample=False,
+                    logits_processor=sampling,
+                    num_return_sequences=1,
+                    eos_token_id=stop_id
+                )
+            results.extend(self.t5_tokenizer.batch_decode(output_sequences, skip_special_tokens=False))
+
+        texts_filled = [x.replace("<pad>", "").replace("</s>", "").strip() for x in results]
         pattern = re.compile("<extra_id_\\d+>")
-        extracted_fills = [pattern.split(x)[1:-1] for x in texts]
+        extracted_fills = [pattern.split(x)[1:-1] for x in texts_filled]
         extracted_fills = [[y.strip() for y in x] for x in extracted_fills]
 
-        perturbed_texts = self.apply_extracted_fills(text, extracted_fills)
+        perturbed_texts = self.apply_extracted_fills(texts, extracted_fills)
 
         return perturbed_texts
 
-    def maskRandomWord(self, text, ratio):
-        """Mask random words in text for perturbation"""
-        span = 2
+    def textRng(self, text):
+        """
+        numpy Generator for the perturbations of text
+        Seeded with self.seed and a hash of text, so the same text always gets
+        the same perturbations, whatever else runs concurrently.
+        """
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+        return np.random.default_rng([self.seed, int.from_bytes(digest, "little")])
+
+    def torchGenerator(self, rng):
+        """torch.Generator on self.device, seeded from a textRng generator"""
+        generator = torch.Generator(device=self.device)
+        generator.manual_seed(int(rng.integers(2 ** 63)))
+        return generator
+
+    def maskRandomWord(self, text, ratio, rng):
+        """Mask random words in text for perturbation, drawing spans from rng"""
+        span = self.mask_span
         tokens = text.split(' ')
         mask_string = '<<<mask>>>'
 
@@ -139,7 +774,7 @@ class GPT2PPL:
 
         n_masks = 0
         while n_masks < n_spans:
-            start = np.random.randint(0, len(tokens) - span)
+            start = int(rng.integers(0, len(tokens) - span))
             end = start + span
             search_start = max(0, start - 1)
             search_end = min(len(tokens), end + 1)
@@ -156,191 +791,625 @@ class GPT2PPL:
         text = ' '.join(tokens)
         return text, n_masks
 
-    def getScore(self, sentence):
+    def prefixState(self, base, first_target=1):
         """
-        Calculate DetectGPT score
-        Returns: (score, diff, std)
-        Higher score = more likely AI-generated
+        Run a token-id sequence once for getPrefixSharedLogLikelihoods
+        Returns its log-likelihood (of the tokens from first_target on) with
+        the per-token NLLs and the cached keys/values (legacy tuple format)
+        of the forward pass. Sequences longer than the model context are
+        scored in windows and keep no cache.
+        """
+        if len(base) > self.max_length:
+            return {"ll": float(-self.getBatchNLL([base])[0]), "nll": None, "past": None, "first": 1}
+
+        with torch.no_grad(), self.autocast():
+            base_ids = torch.tensor([base], dtype=torch.long, device=self.device)
+            outputs = self.model.transformer(base_ids, use_cache=True)
+            # nll[t] is the NLL of predicting token t+1 from tokens 0..t
+            base_nll = -self.headLogProbs(outputs.last_hidden_state[:, :-1], base_ids[:, 1:])["ll"][0]
+            past = outputs.past_key_values
+            if hasattr(past, "to_legacy_cache"):
+                past = past.to_legacy_cache()
+        return {
+            "ll": float(-base_nll[first_target - 1:].mean()), "nll": base_nll, "past": past,
+            "first": first_target
+        }
+
+    def getPrefixSharedLogLikelihoods(self, base, sequences, state=None, first_target=1):
+        """
+        Calculate log-likelihoods of token-id sequences that share a prefix with base
+        The base sequence is run once with use_cache=True (prefixState; pass
+        state to reuse an earlier run across calls). Each sequence then
+        reuses the cached keys/values for its common prefix and only its
+        suffix goes through the model, so a word dropped at position idx
+        costs a forward over the tokens after idx instead of the whole
+        sequence. Tokens before first_target (the state's, when given) are
+        context only; the sequences must share them with base.
+        Returns (base log-likelihood, tensor of log-likelihoods for sequences).
+        """
+        if state is None:
+            state = self.prefixState(base, first_target)
+        first = state["first"]
+        if state["past"] is None:
+            if not sequences:
+                return state["ll"], torch.zeros(0)
+            return state["ll"], -self.getBatchNLL(list(sequences), [first] * len(sequences))
+
+        base_nll, past = state["nll"], state["past"]
+        lls = torch.zeros(len(sequences))
+        with torch.no_grad(), self.autocast():
+            for i, ids in enumerate(sequences):
+                prefix_len = 0
+                for a, b in zip(ids, base):
+                    if a != b:
+                        break
+                    prefix_len += 1
+
+                if len(ids) <= first or len(ids) > self.max_length or prefix_len < first:
+                    lls[i] = -self.getBatchNLL([ids], [first])[0]
+                    continue
+
+                # Re-feed the last shared token so its logits predict the suffix;
+                # everything before it comes from the base pass
+                keep = prefix_len - 1
+                suffix = torch.tensor([ids[keep:]], dtype=torch.long, device=self.device)
+                if keep > 0:
+                    cache = tuple((k[:, :, :keep], v[:, :, :keep]) for k, v in past)
+                    if DynamicCache is not None:
+                        cache = DynamicCache.from_legacy_cache(cache)
+                    hidden = self.model.transformer(suffix, past_key_values=cache, use_cache=True).last_hidden_state
+                else:
+                    hidden = self.model.transformer(suffix).last_hidden_state
+                suffix_nll = -self.headLogProbs(hidden[:, :-1], suffix[:, 1:])["ll"][0]
+
+                total = base_nll[first - 1:keep].sum() + suffix_nll.sum()
+                lls[i] = -total / (len(ids) - first)
+
+        return state["ll"], lls
+
+    def wordDropSequences(self, text, ids, offsets, context=0):
+        """
+        Perturbations that each drop one random word, built on token ids
+        ids / offsets are the tokens of text (or of a chunk of it) with their
+        character offsets; the first context tokens are context only and
+        stay untouched. A perturbation deletes the tokens overlapping the
+        chosen word, so nothing is joined back into a string or tokenized
+        again. Words are drawn from textRng of the text covered by the
+        perturbable tokens, so the same text always gets the same set.
+        Returns a list of token-id lists, empty for 10 words or less.
+        """
+        if len(ids) <= context:
+            return []
+        start, end = offsets[context][0], offsets[-1][1]
+        words = [(start + m.start(), start + m.end()) for m in re.finditer(r"\S+", text[start:end])]
+        if len(words) <= 10:
+            return []
+
+        # Create MORE perturbations for better accuracy (scored adaptively,
+        # see perturbationRounds)
+        num_perturbations = min(self.max_perturbations, max(15, len(words) // 4))
+
+        # Drop a random word (never the first or last one)
+        picks = self.textRng(text[start:end]).integers(1, len(words) - 1, size=num_perturbations)
+
+        perturbed = []
+        for pick in picks.tolist():
+            word_start, word_end = words[pick]
+            drop = [
+                k for k in range(context, len(offsets))
+                if offsets[k][0] < word_end and offsets[k][1] > word_start
+            ]
+            if not drop:
+                perturbed.append(list(ids))
+                continue
+            first = drop[0]
+            if first > context:
+                # A word tokenized without its leading space (after a newline,
+                # or when the space is a token of its own) takes the
+                # whitespace token in front of it along
+                if (not self.tokenizer.decode(ids[first:first + 1])[:1].isspace()
+                        and self.tokenizer.decode(ids[first - 1:first]).isspace()):
+                    first -= 1
+            perturbed.append(ids[:first] + ids[drop[-1] + 1:])
+        return perturbed
+
+    def perturbationRounds(self, n_available):
+        """
+        Ranges (start, end) of perturbations to score, one per round
+        The first round covers min_perturbations, later rounds
+        perturbation_round more each, up to n_available. Callers stop
+        early once verdictSettled says more samples cannot change the verdict.
+        """
+        end = 0
+        while end < n_available:
+            start = end
+            end = min(n_available, end + (self.perturbation_round if start else self.min_perturbations))
+            yield start, end
+
+    def verdictSettled(self, score, n_perturbations):
+        """
+        Whether the verdict of a perturbation score is settled
+        The z-score estimated from n perturbations has a standard error of
+        about sqrt((1 + z^2 / 2) / n) (sampling error of the perturbed mean
+        and standard deviation). The verdict and its confidence are settled
+        once the interval score +- adaptive_z standard errors lies clearly on
+        one side of every VERDICT_BANDS threshold.
+        """
+        if n_perturbations < 2:
+            return False
+        margin = self.adaptive_z * math.sqrt((1 + score ** 2 / 2) / n_perturbations)
+        return all(abs(score - threshold) > margin for threshold, _, _ in VERDICT_BANDS)
+
+    def getWordDropLikelihoods(self, text, ids, offsets, context=0):
+        """
+        Log-likelihood of a token-id sequence and of its word-drop perturbations
+        Perturbations are scored in rounds and sampling stops as soon as the
+        verdict is settled (see scoreWordDrops). The first context tokens
+        are context only.
+        Returns (log_likelihood, numpy array of perturbed log-likelihoods), or
+        None when the text is too short to perturb.
+        """
+        perturbed = self.wordDropSequences(text, ids, offsets, context)
+        if not perturbed:
+            return None
+        return self.scoreWordDrops([(ids, perturbed, context)])[0]
+
+    def scoreWordDrops(self, items):
+        """
+        Log-likelihoods of token-id sequences and of their word-drop perturbations
+        items: (ids, perturbed, context) triples, e.g. the chunks of a
+        document; the first context tokens of ids and of every perturbation
+        are context only (the overlap of a later chunk)
+        Every item settles its own verdict: its perturbations are scored in
+        rounds (perturbationRounds) until verdictSettled holds for its own
+        score or they run out. The rule does not depend on perturbation_mode,
+        so all modes - and a chunk scored on its own (analyzeChunk) - sample
+        the same perturbations.
+        Returns one (log_likelihood, numpy array of perturbed log-likelihoods)
+        per item.
+        """
+        if self.perturbation_mode == "batched":
+            groups = [list(range(len(items)))]
+        else:
+            # One item at a time, so at most one original's prefix state
+            # (cached keys/values) is held across rounds
+            groups = [[c] for c in range(len(items))]
+
+        originals = [None] * len(items)
+        scored = [[] for _ in items]
+        for group in groups:
+            states = {}
+            active = [c for c in group if items[c][1]]
+            n_available = max(len(items[c][1]) for c in group)
+            for start, end in self.perturbationRounds(n_available):
+                rounds = [(c, start, min(end, len(items[c][1]))) for c in active]
+                for c, original, lls in self.roundLikelihoods(items, rounds, states):
+                    if original is not None:
+                        originals[c] = original
+                    scored[c].extend(lls)
+
+                settled = {
+                    c for c, _, round_end in rounds
+                    if round_end >= len(items[c][1]) or self.verdictSettled(
+                        self.perturbationScore(originals[c], scored[c])[0], len(scored[c])
+                    )
+                }
+                active = [c for c in active if c not in settled]
+                if not active:
+                    break
+
+        return [(originals[c], np.asarray(scored[c])) for c in range(len(items))]
+
+    def roundLikelihoods(self, items, rounds, states):
+        """
+        Run one round of scoreWordDrops
+        rounds: (item, start, end) - perturbations start..end of each item,
+        plus the item's original in its first round (start 0)
+        states: per-item prefix states (prefixState), kept by the caller
+        across rounds so each original runs once
+        perturbation_mode decides how the sequences go through the model:
+          batched    - the sequences of all items share padded batches
+          prefix     - per item, perturbations reuse the original's cached
+                       keys/values for the tokens before their dropped word
+          sequential - one forward per sequence
+        Returns (item, original log-likelihood or None, perturbed
+        log-likelihoods) per round.
+        """
+        if self.perturbation_mode == "batched":
+            sequences, first_targets = [], []
+            for c, start, end in rounds:
+                ids, perturbed, context = items[c]
+                round_sequences = ([ids] if start == 0 else []) + perturbed[start:end]
+                sequences.extend(round_sequences)
+                first_targets.extend([max(1, context)] * len(round_sequences))
+            lls = (-self.getBatchNLL(sequences, first_targets)).tolist() if sequences else []
+            results, position = [], 0
+            for c, start, end in rounds:
+                original = None
+                if start == 0:
+                    original, position = lls[position], position + 1
+                results.append((c, original, lls[position:position + end - start]))
+                position += end - start
+            return results
+
+        results = []
+        for c, start, end in rounds:
+            ids, perturbed, context = items[c]
+            first = max(1, context)
+            if self.perturbation_mode == "prefix":
+                # Each perturbation shares every token before its dropped word
+                # with the original
+                if c not in states:
+                    states[c] = self.prefixState(ids, first)
+                base_ll, lls = self.getPrefixSharedLogLikelihoods(ids, perturbed[start:end], states[c])
+                original = float(base_ll) if start == 0 else None
+                lls = lls.tolist()
+            else:
+                original = float(-self.getBatchNLL([ids], [first])[0]) if start == 0 else None
+                lls = [float(-self.getBatchNLL([seq], [first])[0]) for seq in perturbed[start:end]]
+            results.append((c, original, lls))
+        return results
+
+    def perturbationScore(self, log_likelihood, perturbed_likelihoods):
+        """
+        Turn the original and perturbed log-likelihoods into (score, diff, std)
+        """
+        # Calculate statistics
+        mean_perturbed = np.mean(perturbed_likelihoods)
+        std_perturbed = np.std(perturbed_likelihoods)
+
+        original_ll = np.asarray(log_likelihood)
+
+        # DetectGPT theory: AI text has more curvature (higher score)
+        # When we perturb AI text, it stays in high-probability region
+        # When we perturb human text, perplexity varies more
+        diff = original_ll - mean_perturbed
+
+        # Normalize score - THIS IS THE ORIGINAL CORRECT LOGIC
+        # Higher score = AI (perplexity doesn't change much when perturbed)
+        # Lower score = Human (perplexity varies when perturbed)
+        score = diff / (std_perturbed + 1e-10)
+
+        return float(score), float(diff), float(std_perturbed)
+
+    def getPerturbationLikelihoods(self, sentence, encoding=None):
+        """
+        Log-likelihood of sentence and of its perturbations
+        encoding: (ids, offsets) of sentence when already tokenized
+        Returns (log_likelihood, numpy array of perturbed log-likelihoods), or
+        None when the text is too short to perturb.
         """
         original_sentence = sentence
         sentence_length = len(list(re.finditer("[^\\d\\W]+", sentence)))
         
         # For faster inference without T5, use alternative perturbation method
         if not self.use_t5:
-            # FIXED: Set seed for consistent results
-            np.random.seed(42)
-            torch.manual_seed(42)
-            
-            # Get original perplexity
-            log_likelihood = self.getLogLikelihood(original_sentence)
-            
-            # Generate simple perturbations by randomly dropping/replacing words
-            perturbed_likelihoods = []
-            words = original_sentence.split()
-            
-            if len(words) > 10:
-                # Create MORE perturbations for better accuracy
-                num_perturbations = min(30, max(15, len(words) // 4))
-                
-                for i in range(num_perturbations):
-                    # Seed each perturbation for consistency
-                    np.random.seed(42 + i)
-                    
-                    # Randomly drop 1-2 words or swap word order
-                    perturbed = words.copy()
-                    if len(perturbed) > 5:
-                        # Drop a random word
-                        idx = np.random.randint(1, len(perturbed) - 1)
-                        perturbed.pop(idx)
-                    
-                    perturbed_text = " ".join(perturbed)
-                    perturbed_ll = self.getLogLikelihood(perturbed_text)
-                    perturbed_likelihoods.append(perturbed_ll.cpu().detach().numpy())
-                
-                # Calculate statistics
-                perturbed_likelihoods = np.array(perturbed_likelihoods)
-                mean_perturbed = np.mean(perturbed_likelihoods)
-                std_perturbed = np.std(perturbed_likelihoods)
-                
-                original_ll = log_likelihood.cpu().detach().numpy()
-                
-                # DetectGPT theory: AI text has more curvature (higher score)
-                # When we perturb AI text, it stays in high-probability region
-                # When we perturb human text, perplexity varies more
-                diff = original_ll - mean_perturbed
-                
-                # Normalize score - THIS IS THE ORIGINAL CORRECT LOGIC
-                # Higher score = AI (perplexity doesn't change much when perturbed)
-                # Lower score = Human (perplexity varies when perturbed)
-                score = diff / (std_perturbed + 1e-10)
-                
-                return float(score), float(diff), float(std_perturbed)
-            else:
-                # Text too short, return neutral score
-                return 0.0, 0.0, 1.0
+            # Generate simple perturbations by randomly dropping words
+            ids, offsets = encoding or self.encode(original_sentence)
+            return self.getWordDropLikelihoods(original_sentence, ids, offsets)
         
         # Full DetectGPT with perturbations (slower but more accurate)
         remaining = min(50, max(20, sentence_length // 2))
         
-        real_log_likelihood = self.getLogLikelihood(original_sentence)
-        
-        # Generate perturbed versions
-        sentences = []
-        for i in range(remaining // 10):
-            ratio = int(0.3 * sentence_length)
-            mask_text, num_of_masks = self.maskRandomWord(original_sentence, ratio)
-            perturbed = self.unmasker([mask_text], [num_of_masks])
-            sentences.extend(perturbed)
-        
-        if len(sentences) == 0:
-            score = -float(real_log_likelihood.cpu().detach().numpy())
-            return score, score, 1.0
+        real_log_likelihood = float(self.getLogLikelihood(original_sentence))
+
+        # Every masked variant and its fill generator is drawn up front, so a
+        # perturbation does not depend on how rounds and batches split them
+        rng = self.textRng(original_sentence)
+        n_perturbations = min(self.max_perturbations, remaining // 10)
+        ratio = int(self.mask_ratio * sentence_length)
+        masked = [self.maskRandomWord(original_sentence, ratio, rng) for _ in range(n_perturbations)]
+        generators = [self.torchGenerator(rng) for _ in range(n_perturbations)]
+
+        # Filled variants in order (None where T5 failed), starting from those
+        # stored by an earlier run on the same text
+        store_key = None
+        filled = []
+        if self.perturbation_store is not None:
+            store_key = perturbation_key(original_sentence, self.perturbationParams())
+            filled = self.perturbation_store.get(store_key) or []
         
+        # Fill and score perturbations round by round until the verdict settles
         generated_log_likelihoods = []
-        for sentence in sentences:
-            generated_log_likelihoods.append(
-                self.getLogLikelihood(sentence).cpu().detach().numpy()
-            )
+        for start, end in self.perturbationRounds(n_perturbations):
+            if end > len(filled):
+                begin = len(filled)
+                mask_texts, num_of_masks = zip(*masked[begin:end])
+                filled.extend(self.unmasker(list(mask_texts), list(num_of_masks), generators[begin:end]))
+                if store_key is not None:
+                    self.perturbation_store.put(store_key, filled)
+            sentences = [sentence for sentence in filled[start:end] if sentence is not None]
+            if not sentences:
+                continue
+            
+            if self.perturbation_mode != "sequential":
+                generated_log_likelihoods.extend(self.getLogLikelihoods(sentences).tolist())
+            else:
+                generated_log_likelihoods.extend(
+                    float(self.getLogLikelihood(sentence)) for sentence in sentences
+                )
+            score = self.perturbationScore(real_log_likelihood, generated_log_likelihoods)[0]
+            if self.verdictSettled(score, len(generated_log_likelihoods)):
+                break
+        
+        return real_log_likelihood, np.asarray(generated_log_likelihoods)
 
-        generated_log_likelihoods = np.asarray(generated_log_likelihoods)
-        mean_generated_log_likelihood = np.mean(generated_log_likelihoods)
-        std_generated_log_likelihood = np.std(generated_log_likelihoods)
+    def perturbationParams(self):
+        """Masking and sampling parameters that, with the text, determine its T5 perturbations"""
+        return {
+            "t5": self.t5_model_id, "seed": self.seed, "ratio": self.mask_ratio, "span": self.mask_span,
+            "top_k": self.t5_top_k, "top_p": self.t5_top_p, "max_new_tokens": self.t5_max_new_tokens,
+        }
 
-        # Original DetectGPT logic
-        diff = real_log_likelihood.cpu().detach().numpy() - mean_generated_log_likelihood
-        score = diff / (std_generated_log_likelihood + 1e-10)
+    def getScore(self, sentence, encoding=None):
+        """
+        Calculate DetectGPT score
+        encoding: (ids, offsets) of sentence when already tokenized
+        Returns: (score, diff, std)
+        Higher score = more likely AI-generated
+        """
+        return self.likelihoodsScore(self.getPerturbationLikelihoods(sentence, encoding))
 
-        return float(score), float(diff), float(std_generated_log_likelihood)
+    def likelihoodsScore(self, likelihoods):
+        """(score, diff, std) for a getPerturbationLikelihoods result"""
+        if likelihoods is None:
+            # Text too short, return neutral score
+            return 0.0, 0.0, 1.0
 
-    def getVerdict(self, score):
-        """Get human-readable verdict from score"""
-        # Much more aggressive thresholds
-        if score > 0.7:
-            return "Likely AI-generated or heavily AI-assisted", "High"
-        elif score > 0.3:
-            return "Likely AI-generated or heavily AI-assisted", "High"
-        elif score > 0.05:
-            return "Likely AI-generated or heavily AI-assisted", "Medium"
-        elif score > -0.15:
-            return "Mixed human and AI content", "Medium"
-        elif score > -0.5:
-            return "Primarily human-written", "Medium"
-        else:
-            return "Primarily human-written", "High"
+        log_likelihood, perturbed_likelihoods = likelihoods
+        if len(perturbed_likelihoods) == 0:
+            score = -log_likelihood
+            return score, score, 1.0
+        return self.perturbationScore(log_likelihood, perturbed_likelihoods)
 
-    def analyze(self, text):
+    def getChunkLikelihoods(self, text, ids, offsets, chunks):
         """
-        Main analysis function
-        Returns dict with score, verdict, and confidence
+        getPerturbationLikelihoods for every chunk of a document
+        ids / offsets: tokens of text; chunks: token ranges from makeChunks
+        With word-drop perturbations all chunks are scored together (in
+        batched mode their perturbations share padded batches), but every
+        chunk settles its own verdict, exactly as when it is scored on its own
+        (analyzeChunk). Chunks that fail or cannot be perturbed yield None.
         """
-        if len(text.split()) < 30:
-            return {
-                "error": "Text too short. Please provide at least 30 words.",
-                "min_words": 30
-            }
-        
-        # Check if text is too long for model (GPT-2 max tokens ~1024)
-        # Each word ~1.3 tokens on average
-        words = text.split()
-        max_words_per_chunk = 600  # ~780 tokens, safe limit
-        
-        if len(words) > max_words_per_chunk:
-            # Split into chunks and analyze separately
-            chunks = []
-            for i in range(0, len(words), max_words_per_chunk):
-                chunk = " ".join(words[i:i + max_words_per_chunk])
-                chunks.append(chunk)
-            
-            # Analyze each chunk
-            chunk_scores = []
-            for i, chunk in enumerate(chunks):
+        if self.use_t5:
+            results = []
+            for i, (begin, end, weight) in enumerate(chunks):
                 try:
-                    score, diff, std = self.getScore(chunk)
-                    chunk_scores.append(score)
+                    likelihoods = self.getOneChunkLikelihoods(
+                        text, ids[begin:end], offsets[begin:end], end - begin - weight
+                    )
                 except Exception as e:
                     print(f"Error analyzing chunk {i+1}/{len(chunks)}: {e}")
-                    # Continue with other chunks instead of failing completely
-                    continue
-            
-            # Average the scores
-            if not chunk_scores:
-                # If all chunks failed, return neutral score instead of error
-                print(f"WARNING: All chunks failed to analyze. Returning neutral score.")
-                return {
-                    "aiLikelihood": 50,
-                    "humanLikelihood": 50,
-                    "confidence": "low",
-                    "verdict": "Unclear - analysis error",
-                    "score": 0.0,
-                    "raw_metrics": {
-                        "error": "All text chunks failed analysis",
-                        "total_chunks": len(chunks)
-                    }
-                }
-            
-            score = sum(chunk_scores) / len(chunk_scores)
-            diff = 0.0  # Not meaningful for averaged scores
-            std = 1.0
-            print(f"Analyzed {len(chunk_scores)}/{len(chunks)} chunks successfully")
+                    likelihoods = None
+                results.append(likelihoods)
+            return results
+
+        live = self.chunkWordDrops(text, ids, offsets, chunks)
+        results = [None] * len(chunks)
+        if live:
+            for (c, _), likelihoods in zip(live, self.scoreWordDrops([item for _, item in live])):
+                results[c] = likelihoods
+        return results
+
+    def chunkWordDrops(self, text, ids, offsets, chunks):
+        """
+        scoreWordDrops items of the chunks of a document
+        Returns (chunk index, (ids, perturbed, context)) for every chunk that
+        can be perturbed; context is the chunk's overlap with the previous one.
+        """
+        live = []
+        for c, (begin, end, weight) in enumerate(chunks):
+            context = end - begin - weight
+            perturbed = self.wordDropSequences(text, ids[begin:end], offsets[begin:end], context)
+            if perturbed:
+                live.append((c, (ids[begin:end], perturbed, context)))
+        return live
+
+    def getOneChunkLikelihoods(self, text, ids, offsets, context=0):
+        """
+        getPerturbationLikelihoods for one chunk scored on its own
+        ids / offsets: the chunk's tokens within text, of which the first
+        context tokens are context only. T5 perturbs strings, so there the
+        context is left out instead. Returns None when the chunk cannot be
+        perturbed.
+        """
+        if self.use_t5:
+            chunk = text[offsets[min(context, len(offsets) - 1)][0]:offsets[-1][1]].strip()
+            likelihoods = self.getPerturbationLikelihoods(chunk)
         else:
-            # Normal analysis for shorter texts
-            try:
-                score, diff, std = self.getScore(text)
-            except Exception as e:
-                print(f"Error in single text analysis: {e}")
-                # Return neutral score on error
-                return {
-                    "aiLikelihood": 50,
-                    "humanLikelihood": 50,
-                    "confidence": "low",
-                    "verdict": "Unclear - analysis error",
-                    "score": 0.0,
-                    "raw_metrics": {"error": str(e)}
+            likelihoods = self.getWordDropLikelihoods(text, ids, offsets, context)
+        if likelihoods is not None and len(likelihoods[1]) == 0:
+            return None
+        return likelihoods
+
+    def analyzeChunk(self, text, ids, offsets, context=0):
+        """
+        Perturbation-score one chunk of a long document on its own
+        ids / offsets: the chunk's tokens within text; context: its leading
+        overlap tokens (end - begin - weight, see makeChunks).
+        Returns (result, likelihoods): the analyze()-style result of the chunk
+        and its likelihoods for chunkedResult (None if the chunk failed).
+        The chunk settles its verdict as in getChunkLikelihoods, so pooling
+        the chunks scored one by one gives analyze()'s document result.
+        """
+        try:
+            likelihoods = self.getOneChunkLikelihoods(text, ids, offsets, context)
+        except Exception as e:
+            print(f"Error analyzing chunk: {e}")
+            return {"error": str(e)}, None
+        if likelihoods is None:
+            return {"error": "Chunk could not be perturbed"}, None
+        score, diff, std = self.perturbationScore(*likelihoods)
+        result = self.buildResult(score, diff, std, "perturbation")
+        result["raw_metrics"]["num_perturbations"] = len(likelihoods[1])
+        return result, likelihoods
+
+    def chunkedResult(self, scored, n_chunks):
+        """
+        analyze() result of a long document from its scored chunks
+        scored: (likelihoods, weight) of every chunk that did not fail.
+        """
+        if not scored:
+            # If all chunks failed, return neutral score instead of error
+            print(f"WARNING: All chunks failed to analyze. Returning neutral score.")
+            return {
+                "aiLikelihood": 50,
+                "humanLikelihood": 50,
+                "confidence": "low",
+                "verdict": "Unclear - analysis error",
+                "score": 0.0,
+                "raw_metrics": {
+                    "error": "All text chunks failed analysis",
+                    "total_chunks": n_chunks
                 }
-        
-        verdict, confidence = self.getVerdict(score)
-        
-        # Convert score to percentage (0-100)
+            }
+
+        # Token-weighted: a short tail chunk counts for less than a full one
+        score, diff, std = self.poolChunkLikelihoods(
+            [likelihoods for likelihoods, _ in scored],
+            [weight for _, weight in scored]
+        )
+        print(f"Analyzed {len(scored)}/{n_chunks} chunks successfully")
+        result = self.buildResult(score, diff, std, "perturbation")
+        result["raw_metrics"]["num_perturbations"] = max(len(perturbed) for (_, perturbed), _ in scored)
+        return result
+
+    def poolChunkLikelihoods(self, chunk_likelihoods, weights):
+        """
+        Combine per-chunk likelihoods into one document (score, diff, std)
+        Chunk log-likelihoods are averaged weighted by their token counts,
+        which gives the per-token log-likelihood of the whole document.
+        Perturbation j of the document uses the j-th perturbation of every
+        chunk (chunks with fewer perturbations keep their original text).
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        weights = weights / weights.sum()
+        original = np.array([ll for ll, _ in chunk_likelihoods])
+        n_perturbations = max(len(perturbed) for _, perturbed in chunk_likelihoods)
+        if n_perturbations == 0:
+            return 0.0, 0.0, 1.0
+        perturbed = np.repeat(original[:, None], n_perturbations, axis=1)
+        for c, (_, chunk_perturbed) in enumerate(chunk_likelihoods):
+            perturbed[c, :len(chunk_perturbed)] = chunk_perturbed
+        return self.perturbationScore(weights @ original, weights @ perturbed)
+
+    def getTokenStats(self, input_ids):
+        """
+        Per-token statistics from a single (sliding-window) forward pass
+        For every token after the first returns:
+          ll   - log-prob of the observed token
+          mean - expected log-prob under the model's own distribution
+          var  - variance of the log-prob under that distribution
+        Entry k of each tensor belongs to token k+1 of input_ids.
+        """
+        return self.scoreWindowed([list(input_ids)], analytic=True)[0]
+
+    def tokenSegments(self, spans, offsets):
+        """
+        Segment index of every token, from the character spans of the segments
+        A token belongs to the segment holding its last character; tokens in
+        the whitespace between segments belong to the next one, tokens after
+        the last segment to the last one. The segments therefore partition
+        the tokens.
+        """
+        owners = []
+        segment = 0
+        for _, end in offsets:
+            while segment < len(spans) - 1 and spans[segment][1] <= end - 1:
+                segment += 1
+            owners.append(segment)
+        return owners
+
+    def addSegmentStats(self, sums, owners, stats, first_token):
+        """Add analytic token stats (entry k belongs to token first_token + k) to per-segment sums"""
+        ll, mean, var = stats["ll"].tolist(), stats["mean"].tolist(), stats["var"].tolist()
+        for k in range(len(ll)):
+            segment_sums = sums[owners[first_token + k]]
+            segment_sums[0] += ll[k]
+            segment_sums[1] += mean[k]
+            segment_sums[2] += var[k]
+            segment_sums[3] += 1
+
+    def getSegmentSums(self, texts):
+        """
+        Analytic token statistics of several texts, summed per sentence segment
+        (incremental.segment_spans)
+        Every text is scored as a whole - all texts, and the sliding windows
+        of those longer than the model context, share padded [B, T] forward
+        passes - and its token statistics are then split among its segments,
+        so each segment's sums carry the full-document context.
+        Returns, per text, one [ll_sum, mean_sum, var_sum, n_tokens] per segment.
+        """
+        encodings = [self.encode(text) for text in texts]
+        results = []
+        for text, (_, offsets), stats in zip(
+            texts, encodings, self.scoreWindowed([ids for ids, _ in encodings], analytic=True)
+        ):
+            spans = segment_spans(text) or [(0, len(text))]
+            sums = [[0.0, 0.0, 0.0, 0] for _ in spans]
+            self.addSegmentStats(sums, self.tokenSegments(spans, offsets), stats, 1)
+            results.append(sums)
+        return results
+
+    def segmentsScore(self, segment_sums):
+        """curvatureScore of a document from its per-segment sums (added in order)"""
+        totals = [0.0, 0.0, 0.0, 0]
+        for sums in segment_sums:
+            for k in range(4):
+                totals[k] += sums[k]
+        return self.curvatureScore(*totals)
+
+    def curvatureScore(self, ll_sum, mean_sum, var_sum, n_tokens):
+        """
+        Turn summed token statistics into the (score, diff, std) triple
+        diff is the per-token gap between the observed and expected log-prob,
+        std the per-token standard deviation of that gap, score their
+        (rescaled) ratio.
+        """
+        if n_tokens == 0:
+            return 0.0, 0.0, 1.0
+        diff = float(ll_sum - mean_sum) / n_tokens
+        std = math.sqrt(max(float(var_sum), 1e-10)) / n_tokens
+        curvature = diff / std
+        score = (curvature - self.analytic_center) / self.analytic_scale
+        return float(score), float(diff), float(std)
+
+    def spanScore(self, ll_sum, mean_sum, var_sum, n_tokens, n_reference):
+        """
+        curvatureScore of a span of a document, on the document's scale
+        The summed curvature grows with sqrt(n_tokens), so a short sentence
+        would land near -center/scale whatever its tokens. The span's
+        per-token effect is projected to n_reference tokens instead (the whole
+        document), which keeps the calibration and getVerdict thresholds
+        tuned on documents meaningful for its sentences.
+        """
+        score, diff, std = self.curvatureScore(ll_sum, mean_sum, var_sum, n_tokens)
+        if n_tokens == 0 or n_reference <= n_tokens:
+            return score, diff, std
+        curvature = diff / std * math.sqrt(n_reference / n_tokens)
+        return float((curvature - self.analytic_center) / self.analytic_scale), diff, std
+
+    def getAnalyticScore(self, sentence):
+        """
+        Calculate a Fast-DetectGPT style score from one forward pass
+        Instead of sampling perturbations, the conditional probability
+        curvature is computed analytically: the observed log-likelihood is
+        compared with its expectation and variance under the model's own
+        next-token distribution.
+        Returns: (score, diff, std) - same meaning as getScore
+        """
+        return self.segmentsScore(self.getSegmentSums([sentence])[0])
+
+    def getVerdict(self, score):
+        """Get human-readable (verdict, confidence) from score (see VERDICT_BANDS)"""
+        # Much more aggressive thresholds
+        for threshold, verdict, confidence in VERDICT_BANDS:
+            if score > threshold:
+                return verdict, confidence
+        return VERDICT_FLOOR
+
+    def getLikelihood(self, score):
+        """Convert a score to an AI likelihood percentage (0-100)"""
         # ULTRA AGGRESSIVE: Match commercial detectors like ZeroGPT
         # Even small positive scores indicate AI
         if score > 1.5:
@@ -376,6 +1445,107 @@ class GPT2PPL:
         else:
             ai_likelihood = 0    # Clearly human
         
+        return ai_likelihood
+
+    def splitSentences(self, text):
+        """
+        Split text into sentence spans on ., ! or ? followed by whitespace
+        (same rule as the dashboard's detect-sentences route)
+        Returns a list of (start, end) character offsets with whitespace trimmed.
+        """
+        spans = []
+        start = 0
+        for match in list(re.finditer(r"(?<=[.!?])\s+", text)) + [None]:
+            end = match.start() if match else len(text)
+            segment = text[start:end]
+            if segment.strip():
+                lead = len(segment) - len(segment.lstrip())
+                spans.append((start + lead, start + len(segment.rstrip())))
+            if match:
+                start = match.end()
+        return spans
+
+    def analyzeSentences(self, text):
+        """
+        Score every sentence of a document from a single pass over the text
+        Per-token log-probs are computed once for the whole document and mapped
+        back to characters with the fast tokenizer's offset mapping; each
+        sentence is then scored from the tokens that fall inside it, scaled
+        to the document's length (spanScore).
+        """
+        encoding = self.tokenizer(text, return_offsets_mapping=True)
+        input_ids = encoding.input_ids
+        offsets = encoding.offset_mapping
+
+        spans = self.splitSentences(text)
+        n = len(spans)
+        ll_sums, mean_sums, var_sums, counts = [0.0] * n, [0.0] * n, [0.0] * n, [0] * n
+
+        if len(input_ids) >= 2:
+            stats = self.getTokenStats(input_ids)
+            ll, mean, var = stats["ll"].tolist(), stats["mean"].tolist(), stats["var"].tolist()
+            # Token k+1 owns stats entry k; attribute it to the sentence holding
+            # its last character so leading-space tokens land on the right word
+            sentence = 0
+            for k in range(len(ll)):
+                char = offsets[k + 1][1] - 1
+                while sentence < n and spans[sentence][1] <= char:
+                    sentence += 1
+                if sentence == n:
+                    break
+                if char < spans[sentence][0]:
+                    continue
+                ll_sums[sentence] += ll[k]
+                mean_sums[sentence] += mean[k]
+                var_sums[sentence] += var[k]
+                counts[sentence] += 1
+
+        sentences = []
+        for i, (start, end) in enumerate(spans):
+            score, diff, std = self.spanScore(ll_sums[i], mean_sums[i], var_sums[i], counts[i], sum(counts))
+            verdict, confidence = self.getVerdict(score)
+            sentences.append({
+                "text": text[start:end],
+                "start": start,
+                "end": end,
+                "tokens": counts[i],
+                "score": score,
+                "aiLikelihood": self.getLikelihood(score),
+                "confidence": confidence,
+                "verdict": verdict,
+            })
+
+        score, diff, std = self.curvatureScore(sum(ll_sums), sum(mean_sums), sum(var_sums), sum(counts))
+        return {
+            "sentences": sentences,
+            "score": score,
+            "aiLikelihood": self.getLikelihood(score),
+            "raw_metrics": {"diff": diff, "std": std, "tokens": sum(counts)},
+        }
+
+    def cacheParams(self, scorer):
+        """Scoring parameters that, with the text and model id, determine analyze() results"""
+        params = {"max_length": self.max_length, "stride": self.stride, "precision": self.precision}
+        if scorer == "perturbation":
+            params.update({
+                "use_t5": self.use_t5, "seed": self.seed, "rng": "text", "word_drop": "tokens",
+                "verdicts": "per-chunk", "chunk_context": "overlap",
+                "perturbations": [self.min_perturbations, self.perturbation_round,
+                                  self.max_perturbations, self.adaptive_z],
+                "settle": [threshold for threshold, _, _ in VERDICT_BANDS],
+                "chunk_tokens": self.chunk_tokens, "chunk_overlap": self.chunk_overlap
+            })
+        else:
+            params.update({"center": self.analytic_center, "scale": self.analytic_scale})
+        if scorer == "sentences":
+            params["spans"] = "document-length"
+        return params
+
+    def buildResult(self, score, diff, std, scorer):
+        """Build the analyze() response for a score triple"""
+        verdict, confidence = self.getVerdict(score)
+        
+        ai_likelihood = self.getLikelihood(score)
         human_likelihood = 100 - ai_likelihood
         
         return {
@@ -386,6 +1556,228 @@ class GPT2PPL:
             "verdict": verdict,
             "raw_metrics": {
                 "diff": float(diff),
-                "std": float(std)
+                "std": float(std),
+                "scorer": scorer
             }
         }
+
+    def analyzeIncremental(self, text, plan, previous_sums, known_sums=None):
+        """
+        Score a final submission against its draft, segment by segment
+        text:          the submission (normalized)
+        plan:          (status, previous_index) per segment of text (incremental.diff_segments)
+        previous_sums: per-segment sums of the draft (getSegmentSums)
+        known_sums:    per-segment sums of text itself, when already scored
+        Unchanged segments reuse the draft's sums. The tokens from the first
+        to the last changed or added segment are scored again, with the text
+        before them as context (as much as the model window holds), so a
+        final identical to its draft costs no forward pass and scores exactly
+        like a full analysis of the text. Each segment reports how far its
+        score moved from its draft version (positive delta = more AI-like).
+        Returns (result, segment_sums) with the per-segment sums of text.
+        """
+        spans = segment_spans(text) or [(0, len(text))]
+        rescore = [j for j, (status, _) in enumerate(plan) if status != "unchanged"]
+
+        if known_sums is not None:
+            sums, fresh = known_sums, range(0)
+        else:
+            sums = [
+                list(previous_sums[previous]) if status == "unchanged" else [0.0, 0.0, 0.0, 0]
+                for status, previous in plan
+            ]
+            fresh = range(rescore[0], rescore[-1] + 1) if rescore else range(0)
+            if rescore:
+                ids, offsets = self.encode(text)
+                owners = self.tokenSegments(spans, offsets)
+                begin = max(1, bisect.bisect_left(owners, fresh.start))
+                end = bisect.bisect_right(owners, fresh.stop - 1)
+                for j in fresh:
+                    sums[j] = [0.0, 0.0, 0.0, 0]
+                if begin < end:
+                    # Context: the window ending at the last rescored token,
+                    # or half a window before the first one if that is longer
+                    context = max(0, min(end - self.max_length, begin - self.max_length // 2))
+                    stats = self.scoreWindowed([ids[context:end]], analytic=True)[0]
+                    skip = begin - context - 1  # stats of context tokens before begin
+                    self.addSegmentStats(
+                        sums, owners, {key: value[skip:] for key, value in stats.items()}, begin
+                    )
+
+        details = []
+        for index, ((start, end), (status, previous)) in enumerate(zip(spans, plan)):
+            score = self.curvatureScore(*sums[index])[0]
+            previous_score = (
+                self.curvatureScore(*previous_sums[previous])[0] if previous is not None else None
+            )
+            details.append({
+                "index": index,
+                "status": status,
+                "text": " ".join(text[start:end].split()),
+                "tokens": sums[index][3],
+                "score": score,
+                "previousScore": previous_score,
+                "delta": score - previous_score if previous_score is not None else None,
+            })
+
+        score, diff, std = self.segmentsScore(sums)
+        result = self.buildResult(score, diff, std, "analytic")
+        result["raw_metrics"].update({
+            "incremental": True,
+            "segments": details,
+            "reused_segments": len(spans) - len(fresh),
+            "scored_segments": len(fresh),
+        })
+        return result, sums
+
+    def analyzeMany(self, texts, scorer="perturbation", segments=False):
+        """
+        Analyze several texts, sharing forward passes between them
+        With the analytic scorer all texts go through padded batched forwards
+        (bounded by max_batch_size / max_batch_tokens). Word-drop perturbation
+        scoring runs the chunks of all texts through one scoreWordDrops call
+        (analyzeWordDrops); T5 perturbations are filled per text, so those
+        texts run one after another.
+        Returns one analyze()-style dict per text; with segments=True analytic
+        results also carry the per-segment sums (getSegmentSums) under
+        "segments", for incremental rescoring (analyzeIncremental).
+        """
+        if scorer == "perturbation" and not self.use_t5:
+            return self.analyzeWordDrops(texts)
+        if scorer != "analytic":
+            return [self.analyze(text, scorer=scorer) for text in texts]
+
+        results = [None] * len(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            if len(text.split()) < 30:
+                results[i] = self.analyze(text, scorer=scorer)
+            else:
+                pending.append(i)
+
+        if pending:
+            try:
+                for i, sums in zip(pending, self.getSegmentSums([texts[i] for i in pending])):
+                    score, diff, std = self.segmentsScore(sums)
+                    results[i] = self.buildResult(score, diff, std, scorer)
+                    if segments:
+                        results[i]["segments"] = sums
+            except Exception as e:
+                # Retry one by one so a single bad text only fails itself
+                print(f"Error in batched analysis of {len(pending)} texts: {e}")
+                for i in pending:
+                    results[i] = self.analyze(texts[i], scorer=scorer)
+
+        return results
+
+    def analyzeWordDrops(self, texts):
+        """
+        Word-drop perturbation analysis of several texts at once
+        The perturbable chunks of every text are scored by one scoreWordDrops
+        call, so in batched mode the perturbations of different texts share
+        padded batches. Every chunk still settles its own verdict, so each
+        result is the one analyze() gives for its text alone.
+        """
+        results = [None] * len(texts)
+        plans, items, owners = [], [], []
+        for i, text in enumerate(texts):
+            if len(text.split()) < 30:
+                results[i] = self.analyze(text, scorer="perturbation")
+                continue
+            ids, offsets = self.encode(text)
+            chunks = self.makeChunks(len(ids))
+            for c, item in self.chunkWordDrops(text, ids, offsets, chunks):
+                items.append(item)
+                owners.append((len(plans), c))
+            plans.append((i, chunks, [None] * len(chunks)))
+
+        try:
+            for (p, c), likelihoods in zip(owners, self.scoreWordDrops(items) if items else []):
+                plans[p][2][c] = likelihoods
+        except Exception as e:
+            # Retry one by one so a single bad text only fails itself
+            print(f"Error in batched perturbation analysis of {len(plans)} texts: {e}")
+            for i, _, _ in plans:
+                results[i] = self.analyze(texts[i], scorer="perturbation")
+            return results
+
+        for i, chunks, chunk_likelihoods in plans:
+            results[i] = self.perturbationResult(chunks, chunk_likelihoods)
+        return results
+
+    def perturbationResult(self, chunks, chunk_likelihoods):
+        """
+        analyze() result of a text from the likelihoods of its chunks
+        chunk_likelihoods: one getPerturbationLikelihoods-style entry per
+        chunk, None for chunks that failed or could not be perturbed.
+        """
+        if len(chunks) > 1:
+            scored = [
+                (likelihoods, weight)
+                for (_, _, weight), likelihoods in zip(chunks, chunk_likelihoods)
+                if likelihoods is not None
+            ]
+            return self.chunkedResult(scored, len(chunks))
+
+        likelihoods = chunk_likelihoods[0]
+        score, diff, std = self.likelihoodsScore(likelihoods)
+        result = self.buildResult(score, diff, std, "perturbation")
+        result["raw_metrics"]["num_perturbations"] = len(likelihoods[1]) if likelihoods else 0
+        return result
+
+    def analyze(self, text, scorer="perturbation"):
+        """
+        Main analysis function
+        scorer: "perturbation" (full DetectGPT, default) or "analytic" (single
+                forward pass; only as good as analytic_center / analytic_scale)
+        Returns dict with score, verdict, and confidence
+        """
+        if scorer not in ("analytic", "perturbation"):
+            raise ValueError(f"Unknown scorer: {scorer}")
+
+        if len(text.split()) < 30:
+            return {
+                "error": "Text too short. Please provide at least 30 words.",
+                "min_words": 30
+            }
+        
+        # Long texts are cut on exact GPT-2 token counts (see makeChunks)
+        if scorer == "perturbation":
+            ids, offsets = self.encode(text)
+            chunks = self.makeChunks(len(ids))
+        else:
+            chunks = [None]
+        
+        if len(chunks) > 1:
+            try:
+                chunk_likelihoods = self.getChunkLikelihoods(text, ids, offsets, chunks)
+            except Exception as e:
+                print(f"Error analyzing {len(chunks)} chunks: {e}")
+                chunk_likelihoods = [None] * len(chunks)
+            return self.perturbationResult(chunks, chunk_likelihoods)
+        else:
+            # Normal analysis for shorter texts; the analytic scorer slides its
+            # window over long texts itself
+            try:
+                if scorer == "analytic":
+                    score, diff, std = self.getAnalyticScore(text)
+                else:
+                    likelihoods = self.getPerturbationLikelihoods(text, (ids, offsets))
+                    score, diff, std = self.likelihoodsScore(likelihoods)
+                    num_perturbations = len(likelihoods[1]) if likelihoods else 0
+            except Exception as e:
+                print(f"Error in single text analysis: {e}")
+                # Return neutral score on error
+                return {
+                    "aiLikelihood": 50,
+                    "humanLikelihood": 50,
+                    "confidence": "low",
+                    "verdict": "Unclear - analysis error",
+                    "score": 0.0,
+                    "raw_metrics": {"error": str(e)}
+                }
+        
+        result = self.buildResult(score, diff, std, scorer)
+        if scorer == "perturbation":
+            result["raw_metrics"]["num_perturbations"] = num_perturbations
+        return result
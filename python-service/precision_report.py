@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Accuracy-drift report for GPT2PPL precision modes
+
+Scores a fixed corpus with every precision mode and compares each mode's
+score against fp32: absolute drift, verdict agreement, mean latency per text
+and serialized model size.
+
+Usage: python precision_report.py [--model gpt2] [--modes fp32,bf16,int8]
+                                  [--scorers analytic,perturbation]
+"""
+import argparse
+import io
+import time
+import torch
+from model import GPT2PPL
+
+# Fixed drift corpus: AI-styled, student-styled and mixed essays of a range
+# of lengths. Do not edit - reports are only comparable on the same texts.
+CORPUS = [
+    ("ai-education",
+     "Artificial intelligence represents a transformative paradigm in modern education. "
+     "It is important to note that AI systems can facilitate personalized learning "
+     "experiences through adaptive algorithms. Moreover, these technologies enable "
+     "educators to leverage data-driven insights for enhanced pedagogical outcomes. "
+     "The integration of AI in educational settings has profound implications for "
+     "student engagement and learning efficacy. Furthermore, it is essential to "
+     "recognize that these advancements necessitate careful consideration of ethical "
+     "frameworks and pedagogical best practices."),
+    ("ai-climate",
+     "Climate change is one of the most pressing challenges facing humanity today. "
+     "Rising global temperatures have led to more frequent extreme weather events, "
+     "including hurricanes, droughts, and wildfires. Additionally, melting polar ice "
+     "caps contribute to rising sea levels, which threaten coastal communities around "
+     "the world. To address this crisis, governments, businesses, and individuals must "
+     "work together to reduce greenhouse gas emissions and transition to renewable "
+     "energy sources. In conclusion, collective action is crucial to ensuring a "
+     "sustainable future for generations to come."),
+    ("ai-history",
+     "The Industrial Revolution marked a pivotal turning point in human history. "
+     "Beginning in Britain in the late eighteenth century, it transformed economies "
+     "that had been based on agriculture and handicrafts into economies based on "
+     "large-scale industry, mechanized manufacturing, and the factory system. New "
+     "machines, new power sources, and new ways of organizing work made existing "
+     "industries more productive and efficient. Overall, the Industrial Revolution "
+     "laid the foundation for the modern world and continues to shape society today."),
+    ("human-homework",
+     "I think AI is pretty cool but also kinda scary lol. Like, it can help with "
+     "homework but what if I rely on it too much? I'm trying to balance using it "
+     "for ideas vs doing my own thinking. Not sure if I'm doing this right tbh. "
+     "Sometimes I write stuff and then check with AI to see if it makes sense. "
+     "My teacher says that's okay as long as I'm learning from it. But I wonder "
+     "if other students are just copying AI answers without understanding them."),
+    ("human-lab",
+     "So our lab didn't really work the first time. We mixed the solutions like the "
+     "sheet said but nothing turned blue, and Jamie thinks we grabbed the wrong "
+     "beaker (the one from 3rd period maybe?). Second try we measured everything "
+     "twice and it finally changed color after like four minutes, which is way "
+     "slower than the 90 seconds the book says. My guess is the room was cold, it "
+     "was freezing in there, or the stuff was old. Next time I'd label everything."),
+    ("human-reflection",
+     "Honestly the hardest part of this semester wasn't the exams, it was keeping up "
+     "with reading while working twenty hours a week at the cafe. I fell behind in "
+     "October and never totally caught up. What helped was doing the readings on the "
+     "bus and writing two or three sentences about each one right after, even if they "
+     "were kind of dumb sentences. By finals I had a messy notebook but I actually "
+     "remembered stuff, which has not always been true for me."),
+    ("mixed-edit",
+     "My project looks at why people in my town stopped using the river trail. I "
+     "talked to nine neighbors and most said it just felt unsafe after the lights "
+     "broke. Furthermore, it is important to note that infrastructure maintenance "
+     "plays a crucial role in fostering community engagement and ensuring public "
+     "safety. My grandma said she used to walk there every morning until 2019 and "
+     "now she only goes if my uncle comes with her, which is like once a month."),
+    ("ai-long",
+     " ".join([
+         "Effective time management is a critical skill for academic success. "
+         "Students who plan their schedules carefully are better able to balance "
+         "coursework, extracurricular activities, and personal responsibilities. "
+         "By setting clear goals and prioritizing tasks, learners can reduce stress "
+         "and improve the quality of their work. Moreover, developing these habits "
+         "early fosters lifelong benefits in professional and personal contexts."
+     ] * 6)),
+]
+
+
+def model_size_mb(model):
+    """Size of the serialized state dict (quantized weights included)"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def score_corpus(detector, scorer):
+    """(scores, verdicts, mean seconds per text) for the corpus"""
+    scores, verdicts, elapsed = [], [], 0.0
+    for _, text in CORPUS:
+        start = time.perf_counter()
+        result = detector.analyze(text, scorer=scorer)
+        elapsed += time.perf_counter() - start
+        scores.append(result["score"])
+        verdicts.append(result["verdict"])
+    return scores, verdicts, elapsed / len(CORPUS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--model", default="gpt2")
+    parser.add_argument("--modes", default="fp32,bf16,int8")
+    parser.add_argument("--scorers", default="analytic,perturbation")
+    args = parser.parse_args()
+    modes = args.modes.split(",")
+    scorers = args.scorers.split(",")
+    if "fp32" not in modes:
+        modes.insert(0, "fp32")
+
+    results = {}  # (mode, scorer) -> (scores, verdicts, seconds)
+    sizes = {}
+    for mode in modes:
+        detector = GPT2PPL(device="cpu", model_id=args.model, precision=mode)
+        sizes[mode] = model_size_mb(detector.model)
+        for scorer in scorers:
+            results[mode, scorer] = score_corpus(detector, scorer)
+        del detector
+
+    for scorer in scorers:
+        print(f"\n== {scorer} scorer ({args.model}) ==")
+        print(f"{'text':<18}" + "".join(f"{mode:>10}" for mode in modes))
+        for i, (name, _) in enumerate(CORPUS):
+            print(f"{name:<18}" + "".join(f"{results[mode, scorer][0][i]:>10.3f}" for mode in modes))
+
+        base_scores, base_verdicts, _ = results["fp32", scorer]
+        print(f"\n{'mode':<6} {'max |drift|':>11} {'mean |drift|':>12} {'verdicts':>9} {'s/text':>8}")
+        for mode in modes:
+            scores, verdicts, seconds = results[mode, scorer]
+            drift = [abs(a - b) for a, b in zip(scores, base_scores)]
+            agree = sum(a == b for a, b in zip(verdicts, base_verdicts))
+            print(f"{mode:<6} {max(drift):>11.4f} {sum(drift) / len(drift):>12.4f} "
+                  f"{agree:>4}/{len(CORPUS):<4} {seconds:>8.3f}")
+
+    print("\nmodel size: " + ", ".join(f"{mode} {sizes[mode]:.0f} MB" for mode in modes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Dynamic micro-batching for DetectGPT requests
+
+Concurrent /detect calls are queued and grouped into micro-batches that are
+scored with one batched forward pass, instead of running one by one at
+batch size 1. Concurrent calls for the same text are coalesced first, so a
+retry racing the original does not score it twice.
+"""
+import asyncio
+import time
+from collections import Counter
+from executor import QueueFullError
+
+
+class BatchItem:
+    """A queued detection request waiting for its result"""
+
+    def __init__(self, text, scorer, future):
+        self.text = text
+        self.scorer = scorer
+        self.future = future
+        self.enqueued = time.monotonic()
+        # Rough GPT-2 token count (~1.3 tokens per word) for the batch budget
+        self.tokens = len(text.split()) * 4 // 3 + 1
+
+
+class MicroBatcher:
+    """
+    Groups queued texts into micro-batches
+
+    A batch is closed when max_batch_size texts are queued, when adding the
+    next text would exceed max_batch_tokens, or max_wait_ms after its first
+    text arrived - whichever comes first.
+
+    run_batch is a coroutine function taking a list of (text, scorer) pairs
+    and returning one result per pair. Up to max_concurrent_batches batches
+    are scored at once; at most max_queue texts may wait for a batch before
+    submit() raises QueueFullError.
+    """
+
+    def __init__(self, run_batch, max_wait_ms=10, max_batch_size=16, max_batch_tokens=8192,
+                 max_concurrent_batches=1, max_queue=256):
+        self.run_batch = run_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrent_batches = max_concurrent_batches
+        self.max_queue = max_queue
+
+        self.queue = None
+        self.worker = None
+        self.slots = None
+        self.running = set()  # batch tasks being scored
+        self.carry = None  # item that did not fit in the previous batch
+
+        # Metrics
+        self.requests = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.batch_sizes = Counter()
+        self.rejected = 0
+        self.dropped = 0
+
+    async def start(self):
+        """Start the batching loop on the running event loop"""
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self.worker = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        """Stop the batching loop"""
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    async def submit(self, text, scorer):
+        """
+        Queue a text and wait for its analyze() result
+        Cancelling the caller (deadline, client disconnect) drops the text if
+        its batch has not started yet.
+        """
+        if self.queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"Detection queue is full ({self.queue.qsize()} waiting)")
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(BatchItem(text, scorer, future))
+        self.requests += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await future
+
+    async def collect(self):
+        """Wait for the next micro-batch"""
+        if self.carry is not None:
+            first, self.carry = self.carry, None
+        else:
+            first = await self.queue.get()
+
+        batch = [first]
+        tokens = first.tokens
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if tokens + item.tokens > self.max_batch_tokens:
+                self.carry = item
+                break
+            batch.append(item)
+            tokens += item.tokens
+
+        return batch
+
+    async def loop(self):
+        """Collect micro-batches and hand them to run_batch"""
+        while True:
+            await self.slots.acquire()
+            try:
+                batch = await self.collect()
+            except BaseException:
+                self.slots.release()
+                raise
+            task = asyncio.create_task(self.score(batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def score(self, batch):
+        """Score one micro-batch and resolve its futures"""
+        try:
+            # Requests whose caller already gave up are not scored
+            live = [item for item in batch if not item.future.done()]
+            self.dropped += len(batch) - len(live)
+            if not live:
+                return
+
+            now = time.monotonic()
+            self.batches += 1
+            self.batched_texts += len(live)
+            self.batch_sizes[len(live)] += 1
+            self.total_wait += sum(now - item.enqueued for item in live)
+
+            try:
+                results = await self.run_batch([(item.text, item.scorer) for item in live])
+            except Exception as e:
+                for item in live:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                return
+
+            for item, result in zip(live, results):
+                if not item.future.done():
+                    item.future.set_result(result)
+        finally:
+            self.slots.release()
+
+    def stats(self):
+        """Queue-depth and batch-size metrics"""
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+            "avg_wait_ms": 1000.0 * self.total_wait / self.batched_texts if self.batched_texts else 0.0,
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "max_batch_tokens": self.max_batch_tokens,
+            "max_concurrent_batches": self.max_concurrent_batches,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls
+
+    run(key, factory) awaits factory() - or, when a call with the same key
+    is already in flight, joins that call and gets its result (or error).
+    The shared call keeps running while any caller still waits for it and
+    is cancelled once all of them have been cancelled.
+    """
+
+    def __init__(self):
+        self.calls = {}  # key -> Flight
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        """Result of factory() for key, shared with concurrent callers of the same key"""
+        flight = self.calls.get(key)
+        if flight is None:
+            flight = self.calls[key] = Flight(asyncio.ensure_future(factory()))
+            flight.task.add_done_callback(lambda _: self.forget(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self.forget(key, flight)
+
+    def forget(self, key, flight):
+        """Drop a finished or abandoned call, so later callers start afresh"""
+        if self.calls.get(key) is flight:
+            del self.calls[key]
+
+    def stats(self):
+        """In-flight and coalesced call counters"""
+        return {
+            "in_flight": len(self.calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+class Flight:
+    """A call shared by every SingleFlight caller of its key"""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
@@ -0,0 +1,109 @@
+"""
+Shared fixtures
+
+Tests run offline against a tiny randomly initialized GPT-2 (two layers, a
+byte-level BPE vocabulary trained on CORPUS) that is built once per session.
+Its scores are meaningless, but every code path runs the real model code.
+"""
+import asyncio
+import os
+import sys
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+CORPUS = (
+    "The reflection describes what the student learned during the semester. "
+    "It covers the lab sessions, the group project and the final exam. "
+    "Writing every week helped me understand the material much better. "
+    "I struggled with the statistics module at first, but the tutor explained it again! "
+    "Would I take this course again? Yes, because it changed how I study.\n\n"
+    "Our team built a small weather station and measured the temperature for a month. "
+    "We compared the data with the forecast and wrote a report about the differences. "
+)
+
+TEXT = (
+    "This semester I learned how to plan a project from the first idea to the final report. "
+    "Our group met every week in the lab, and we wrote down what each of us would do next. "
+    "At first the statistics module was hard for me, but the tutor explained it again.\n\n"
+    "The weather station we built measured the temperature for a month. "
+    "We compared the data with the forecast and found that the forecast was often too warm. "
+    "Writing the report together taught me more than the exam did."
+)
+
+
+def words(n, seed=0):
+    """n words of filler text drawn from CORPUS (deterministic per seed)"""
+    import random
+    vocabulary = CORPUS.split()
+    rng = random.Random(seed)
+    return " ".join(rng.choice(vocabulary) for _ in range(n))
+
+
+@pytest.fixture(scope="session")
+def tiny_model_dir(tmp_path_factory):
+    """Directory of a tiny GPT-2 snapshot (save_pretrained output)"""
+    import torch
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import GPT2Config, GPT2LMHeadModel, GPT2TokenizerFast
+
+    path = str(tmp_path_factory.mktemp("tiny-gpt2"))
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator([CORPUS] * 3, vocab_size=600, special_tokens=["<|endoftext|>"])
+    bpe.save_model(path)
+    tokenizer = GPT2TokenizerFast(
+        vocab_file=os.path.join(path, "vocab.json"), merges_file=os.path.join(path, "merges.txt")
+    )
+    tokenizer.save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=len(tokenizer), n_positions=256, n_embd=64, n_layer=2, n_head=2)
+    GPT2LMHeadModel(config).save_pretrained(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def detector(tiny_model_dir):
+    """A GPT2PPL on the tiny model (shared: tests must not change its settings)"""
+    from model import GPT2PPL
+    return GPT2PPL(model_id=tiny_model_dir)
+
+
+@pytest.fixture(scope="session")
+def service(tiny_model_dir, tmp_path_factory):
+    """
+    The FastAPI service module, configured for the tiny model
+    main reads its configuration when imported, so the environment is set
+    first. Use serve() to run a scenario against a started service.
+    """
+    os.environ.update({
+        "MODEL_ID": tiny_model_dir,
+        "MODEL_WARMUP": "0",
+        "JOBS_PATH": str(tmp_path_factory.mktemp("jobs") / "jobs.db"),
+    })
+    import main
+    return main
+
+
+@pytest.fixture
+def serve(service):
+    """
+    serve(scenario) starts the service (fresh caches and workers), waits for
+    the model and runs the coroutine function scenario(client) with an
+    httpx.AsyncClient bound to the app
+    """
+    import httpx
+
+    async def run(scenario):
+        # The previous scenario's batcher is stopped; wait for the new one
+        service.batcher = None
+        async with service.app.router.lifespan_context(service.app):
+            while service.batcher is None:
+                assert service.load_state != "failed", service.load_error
+                await asyncio.sleep(0.05)
+            transport = httpx.ASGITransport(app=service.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+                return await scenario(client)
+
+    return lambda scenario: asyncio.run(run(scenario))
@@ -0,0 +1,39 @@
+"""Bulk heuristic scoring against heuristic.analyze_text"""
+import pytest
+from bulk_heuristic import iter_results, score_corpus
+from conftest import CORPUS, TEXT, words
+from heuristic import analyze_text
+
+
+def assert_matches_analyze_text(texts, **kwargs):
+    results = list(iter_results(range(len(texts)), score_corpus(texts, **kwargs)))
+    assert len(results) == len(texts)
+    for text, result in zip(texts, results):
+        expected = analyze_text(text)
+        assert result["aiLikelihood"] == expected["aiLikelihood"]
+        assert result["confidence"] == expected["confidence"]
+        assert result["verdict"] == expected["verdict"]
+        assert result["score"] == pytest.approx(expected["score"], abs=1e-9)
+        for name, value in expected["raw_metrics"].items():
+            assert result["raw_metrics"][name] == pytest.approx(value, abs=1e-9), name
+
+
+@pytest.mark.parametrize("texts", [
+    [],
+    [""],
+    ["   "],
+    ["", "\n", " \t "],
+    ["", TEXT, ""],
+], ids=["no-texts", "empty", "blank", "whitespace", "empty-around-text"])
+def test_empty_texts(texts):
+    assert_matches_analyze_text(texts)
+
+
+def test_chunk_of_only_empty_texts():
+    # The second chunk has no words at all
+    assert_matches_analyze_text([TEXT, CORPUS, "", " ", "\n\n"], chunk_size=2)
+
+
+def test_corpus():
+    texts = [TEXT, CORPUS] + [words(n, seed=n) + "." for n in range(0, 300, 7)]
+    assert_matches_analyze_text(texts, chunk_size=10)
@@ -0,0 +1,75 @@
+"""Result cache and perturbation store round-trips"""
+import asyncio
+from cache import PerturbationStore, ResultCache, cache_key, perturbation_key
+
+RESULT = {"aiLikelihood": 73, "score": 0.41, "raw_metrics": {"diff": 1.5, "std": 0.5}}
+
+
+def test_cache_key_normalizes_the_text():
+    params = {"n": 1}
+    assert cache_key("Café\r\nessay  ", "gpt2", "analytic", params) == \
+        cache_key("Café\nessay", "gpt2", "analytic", params)
+    assert cache_key("essay", "gpt2", "analytic", params) != cache_key("essay", "gpt2", "analytic", {"n": 2})
+    assert cache_key("essay", "gpt2", "analytic", params) != cache_key("essay", "gpt2-medium", "analytic", params)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    assert cache.get("a") == RESULT
+    cache.put("c", RESULT)
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULT
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "results.db")
+    cache = ResultCache(path=path)
+    cache.put("key", RESULT)
+    cache.db.close()
+
+    reopened = ResultCache(path=path)
+    assert reopened.get("key") == RESULT
+    assert reopened.get("key") == RESULT
+    stats = reopened.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = ResultCache(ttl_s=-1, path=str(tmp_path / "results.db"))
+    cache.put("key", RESULT)
+    assert cache.get("key") is None
+    assert cache.stats()["disk_entries"] == 0
+
+
+def test_async_round_trip(tmp_path):
+    async def run(cache):
+        await cache.put_async("key", RESULT)
+        return await cache.get_async("key"), await cache.get_async("missing")
+
+    for path in (None, str(tmp_path / "results.db")):
+        assert asyncio.run(run(ResultCache(path=path))) == (RESULT, None)
+
+
+def test_perturbation_store_round_trip(tmp_path):
+    path = str(tmp_path / "perturbations.db")
+    texts = ["A perturbed essay.", None, "Another one."]
+    key = perturbation_key("An essay.", {"mask_ratio": 0.15, "seed": 0})
+    PerturbationStore(path).put(key, texts)
+
+    store = PerturbationStore(path)
+    assert store.get(key) == texts
+    assert store.get(perturbation_key("An essay.", {"mask_ratio": 0.3, "seed": 0})) is None
+    assert (store.stats()["hits"], store.stats()["misses"]) == (1, 1)
+
+
+def test_perturbation_store_evicts_least_recently_used(tmp_path):
+    store = PerturbationStore(str(tmp_path / "perturbations.db"), max_bytes=200)
+    for i in range(6):
+        store.put(f"key{i}", [f"perturbed text number {i} " * 4])
+    stats = store.stats()
+    assert stats["evictions"] > 0
+    assert stats["bytes"] <= 200
+    assert store.get("key5") is not None
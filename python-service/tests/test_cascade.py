@@ -0,0 +1,58 @@
+"""Cascade scorer tiers"""
+from conftest import words
+
+
+def fake_heuristic(likelihood, confidence="high"):
+    def analyze(text):
+        return {
+            "score": likelihood / 100,
+            "aiLikelihood": likelihood,
+            "humanLikelihood": 100 - likelihood,
+            "confidence": confidence,
+            "verdict": "Likely AI-generated" if likelihood >= 50 else "Likely human-written",
+            "raw_metrics": {"heuristic": True},
+        }
+    return analyze
+
+
+def cascade(serve, text):
+    async def scenario(client):
+        result = await client.post("/detect", json={"text": text, "scorer": "cascade"})
+        metrics = await client.get("/metrics")
+        return result.json(), metrics.json()["cascade_tiers"]
+    return serve(scenario)
+
+
+def test_confident_heuristic_answers_alone(serve, service, monkeypatch):
+    monkeypatch.setattr(service, "cascade_tiers", dict.fromkeys(service.cascade_tiers, 0))
+    monkeypatch.setattr(service, "heuristic_analyze", fake_heuristic(95))
+    result, tiers = cascade(serve, words(60, seed=30))
+    assert result["aiLikelihood"] == 95
+    assert result["raw_metrics"]["cascade_tier"] == "heuristic"
+    assert result["method"] == service.CASCADE_METHODS["heuristic"]
+    assert "analytic_score" not in result["raw_metrics"]
+    assert tiers == {"heuristic": 1, "analytic": 0, "perturbation": 0}
+
+
+def test_uncertain_texts_escalate_by_band(serve, service, monkeypatch):
+    monkeypatch.setattr(service, "cascade_tiers", dict.fromkeys(service.cascade_tiers, 0))
+    # 50 is inside the heuristic band; an empty analytic band lets analytic decide
+    monkeypatch.setattr(service, "heuristic_analyze", fake_heuristic(50))
+    monkeypatch.setattr(service, "CASCADE_ANALYTIC_LOW", 0.0)
+    monkeypatch.setattr(service, "CASCADE_ANALYTIC_HIGH", 0.0)
+    analytic, _ = cascade(serve, words(60, seed=31))
+    assert analytic["raw_metrics"]["cascade_tier"] == "analytic"
+    assert analytic["raw_metrics"]["heuristic_likelihood"] == 50
+    assert analytic["score"] == analytic["raw_metrics"]["analytic_score"]
+    assert analytic["method"] == service.CASCADE_METHODS["analytic"]
+
+    # Low-confidence heuristics escalate whatever their likelihood
+    monkeypatch.setattr(service, "heuristic_analyze", fake_heuristic(99, confidence="low"))
+    monkeypatch.setattr(service, "CASCADE_ANALYTIC_LOW", -1e9)
+    monkeypatch.setattr(service, "CASCADE_ANALYTIC_HIGH", 1e9)
+    perturbation, tiers = cascade(serve, words(60, seed=32))
+    assert perturbation["raw_metrics"]["cascade_tier"] == "perturbation"
+    assert perturbation["raw_metrics"]["heuristic_likelihood"] == 99
+    assert "analytic_score" in perturbation["raw_metrics"]
+    assert perturbation["method"] == service.CASCADE_METHODS["perturbation"]
+    assert tiers == {"heuristic": 0, "analytic": 1, "perturbation": 1}
@@ -0,0 +1,39 @@
+"""Compiled (traced) scoring forward passes"""
+import pytest
+import torch
+from model import GPT2PPL
+
+
+@pytest.fixture(scope="module")
+def traced(tiny_model_dir):
+    return GPT2PPL(model_id=tiny_model_dir, compile_mode="trace", max_batch_tokens=2048)
+
+
+def test_small_batches_are_split_instead_of_padded(traced):
+    assert traced.rowPieces(5, 100) == [4, 1]
+    assert traced.rowPieces(7, 100) == [7]
+    assert traced.rowPieces(3, 100) == [3]
+    # 16 x 256 is beyond max_batch_tokens, so 13 rows of 200 tokens run as 8 + 4 + 1
+    assert traced.rowPieces(13, 200) == [8, 4, 1]
+
+
+def test_traced_nll_matches_eager(traced, tiny_model_dir):
+    eager = GPT2PPL(model_id=tiny_model_dir)
+    sequences = [list(range(10, 10 + n)) for n in (40, 37, 30, 22, 9)]
+    assert torch.allclose(traced.getBatchNLL(sequences), eager.getBatchNLL(sequences), atol=1e-5)
+
+
+def test_bf16_trace_passes_the_eager_check(tiny_model_dir):
+    detector = GPT2PPL(model_id=tiny_model_dir, precision="bf16", compile_mode="trace", max_batch_tokens=1024)
+    assert detector.compiled
+
+
+def test_failed_check_falls_back_with_a_warning(traced, capsys):
+    compiled = traced.compiled
+    traced.compiled, traced.compile_tolerance = {}, -1.0
+    try:
+        traced.compileForward()
+        assert traced.compiled == {}
+        assert "WARNING: Compiling the forward pass (trace, fp32) failed" in capsys.readouterr().out
+    finally:
+        traced.compiled, traced.compile_tolerance = compiled, 1e-4
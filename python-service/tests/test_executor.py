@@ -0,0 +1,98 @@
+"""Inference executor limits, deadlines and cancellation"""
+import asyncio
+import os
+import threading
+import time
+import pytest
+from conftest import TEXT, words
+from executor import InferenceExecutor, QueueFullError
+
+
+def worker_pid(_):
+    return os.getpid()
+
+
+def crash():
+    os._exit(1)
+
+
+def fail():
+    raise ValueError("bad input")
+
+
+def test_queue_limit_and_cancelled_calls_are_dropped():
+    release = threading.Event()
+    ran = []
+
+    def work(name):
+        if name == "blocker":
+            release.wait(5)
+        ran.append(name)
+        return name
+
+    async def run():
+        executor = InferenceExecutor(workers=1, max_pending=2)
+        blocker = asyncio.ensure_future(executor.run(work, "blocker"))
+        queued = asyncio.ensure_future(executor.run(work, "queued"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(QueueFullError):
+            await executor.run(work, "rejected")
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        release.set()
+        await blocker
+        executor.shutdown()
+        return executor.stats()
+
+    stats = asyncio.run(run())
+    assert ran == ["blocker"]
+    assert (stats["completed"], stats["rejected"], stats["cancelled"], stats["pending"]) == (1, 1, 1, 0)
+
+
+def test_missed_deadline_answers_504(serve, service, monkeypatch):
+    import inference
+    analyze_batch = inference.analyze_batch
+    monkeypatch.setattr(inference, "analyze_batch", lambda items: time.sleep(0.5) or analyze_batch(items))
+
+    async def scenario(client):
+        return await client.post("/detect", json={"text": TEXT, "scorer": "analytic", "deadline_ms": 100})
+
+    assert serve(scenario).status_code == 504
+
+
+def test_batch_larger_than_the_queue_is_scored_in_windows(serve, service, monkeypatch):
+    monkeypatch.setattr(service, "INFERENCE_MAX_QUEUE", 2)
+    texts = [words(40, seed=seed) for seed in range(10, 16)]
+
+    async def scenario(client):
+        return await client.post("/detect/batch?scorer=analytic", json=texts)
+
+    response = serve(scenario)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == len(texts)
+    assert all("error" not in result for result in results)
+
+
+def test_fork_workers_run_tasks_and_replace_a_crashed_process():
+    async def run():
+        executor = InferenceExecutor(backend="fork", workers=2, max_pending=8)
+        try:
+            pids = await asyncio.gather(*(executor.run(worker_pid, i) for i in range(6)))
+            with pytest.raises(ValueError, match="bad input"):
+                await executor.run(fail)
+            with pytest.raises(RuntimeError, match="exited"):
+                await executor.run(crash)
+            after = await asyncio.gather(*(executor.run(worker_pid, i) for i in range(4)))
+            return pids, after, executor.stats()
+        finally:
+            executor.shutdown()
+
+    pids, after, stats = asyncio.run(run())
+    assert os.getpid() not in pids
+    assert len(set(pids)) == 2
+    assert os.getpid() not in after
+    workers = stats["worker_stats"]
+    assert sum(w["restarts"] for w in workers) == 1
+    assert set(after) == {w["pid"] for w in workers}
+    assert stats["completed"] == 10 and stats["pending"] == 0
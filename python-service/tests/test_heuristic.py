@@ -0,0 +1,161 @@
+"""The compiled heuristic engine against the per-pattern functions it replaced"""
+import json
+import math
+import random
+import re
+from collections import Counter
+import pytest
+from conftest import CORPUS, TEXT
+from heuristic import analyze_many, analyze_text
+
+# Reference implementation: the functions each detector carried before
+# heuristic.py (one re.findall per pattern group, texts split per feature)
+
+BASELINE_AI_PATTERNS = [
+    r'\b(it\'s important to note|it\'s worth noting|it\'s crucial to understand)\b',
+    r'\b(in conclusion|to summarize|in summary)\b',
+    r'\b(furthermore|moreover|additionally|consequently)\b',
+    r'\b(delve into|dive deep|explore in depth)\b',
+    r'\b(let\'s explore|let\'s examine|let\'s consider)\b',
+    r'\b(comprehensive|multifaceted|holistic approach)\b',
+    r'\b(it\'s essential to|it\'s vital to|it\'s critical to)\b'
+]
+
+BASELINE_HUMAN_PATTERNS = [
+    r'\b(I|me|my|mine|myself)\b',
+    r'\b(don\'t|won\'t|can\'t|isn\'t|aren\'t)\b',
+    r'\b(yeah|yep|nope|gonna|wanna|gotta)\b',
+    r'\b(amazing|awesome|terrible|horrible|fantastic)\b',
+    r'\b(maybe|perhaps|possibly|probably|I think)\b'
+]
+
+
+def baseline_perplexity_score(text):
+    words = text.lower().split()
+    if len(words) < 5:
+        return 50.0
+    word_freq = Counter(words)
+    total_words = len(words)
+    unique_words = len(word_freq)
+    entropy = 0
+    for count in word_freq.values():
+        prob = count / total_words
+        entropy -= prob * math.log2(prob)
+    max_entropy = math.log2(unique_words) if unique_words > 1 else 1
+    normalized_entropy = entropy / max_entropy if max_entropy > 0 else 0
+    ai_score = (1 - normalized_entropy) * 100
+    return max(0, min(100, ai_score))
+
+
+def baseline_count(patterns, text):
+    return sum(len(re.findall(pattern, text, re.IGNORECASE)) for pattern in patterns)
+
+
+def baseline_structure(text):
+    sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+    if len(sentences) < 2:
+        return {"consistency": 0.5, "variation": 0.5}
+    lengths = [len(s.split()) for s in sentences]
+    avg_length = sum(lengths) / len(lengths)
+    variance = sum((l - avg_length) ** 2 for l in lengths) / len(lengths)
+    variation = min(1.0, math.sqrt(variance) / avg_length) if avg_length > 0 else 0
+    return {"consistency": 1 - variation, "variation": variation}
+
+
+def baseline_analyze(text):
+    perplexity_score = baseline_perplexity_score(text)
+    ai_patterns = baseline_count(BASELINE_AI_PATTERNS, text)
+    human_patterns = baseline_count(BASELINE_HUMAN_PATTERNS, text)
+    structure = baseline_structure(text)
+
+    words = text.split()
+    sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+    word_count = len(words)
+    sentence_count = len(sentences)
+    avg_words_per_sentence = word_count / max(sentence_count, 1)
+
+    ai_likelihood = perplexity_score * 0.4
+    pattern_score = max(0, min(100, 50 + (ai_patterns * 10) - (human_patterns * 5)))
+    ai_likelihood += pattern_score * 0.3
+    ai_likelihood += structure["consistency"] * 100 * 0.2
+    if avg_words_per_sentence > 20:
+        ai_likelihood += 10 * 0.1
+    elif avg_words_per_sentence < 8:
+        ai_likelihood -= 10 * 0.1
+    ai_likelihood = max(0, min(100, ai_likelihood))
+
+    if word_count < 50:
+        confidence = "low"
+    elif word_count > 200 and (ai_likelihood < 20 or ai_likelihood > 80):
+        confidence = "high"
+    elif word_count > 100 and (ai_likelihood < 30 or ai_likelihood > 70):
+        confidence = "medium-high"
+    else:
+        confidence = "medium"
+
+    if ai_likelihood >= 80:
+        verdict = "Highly likely AI-generated content"
+    elif ai_likelihood >= 60:
+        verdict = "Likely AI-generated content"
+    elif ai_likelihood >= 40:
+        verdict = "Mixed or uncertain - may contain AI assistance"
+    elif ai_likelihood >= 20:
+        verdict = "Likely human-written content"
+    else:
+        verdict = "Highly likely human-written content"
+
+    return {
+        "aiLikelihood": int(round(ai_likelihood)),
+        "humanLikelihood": int(round(100 - ai_likelihood)),
+        "confidence": confidence,
+        "verdict": verdict,
+        "score": ai_likelihood / 100.0,
+        "raw_metrics": {
+            "perplexity_score": perplexity_score,
+            "ai_patterns": ai_patterns,
+            "human_patterns": human_patterns,
+            "structure_consistency": structure["consistency"],
+            "structure_variation": structure["variation"],
+            "word_count": word_count,
+            "sentence_count": sentence_count,
+            "avg_words_per_sentence": avg_words_per_sentence
+        },
+        "method": "DetectGPT-Lite (Heuristic Analysis)"
+    }
+
+
+# Phrase fragments that overlap across pattern groups, odd case folds and
+# punctuation, so the single-scan regex has to count what every findall did
+FRAGMENTS = [
+    "it's", "important to note", "worth noting", "crucial to understand", "In Conclusion",
+    "to summarize", "in summary", "Furthermore,", "moreover", "additionally", "consequently",
+    "delve into", "dive deep", "explore in depth", "let's explore in depth", "let's",
+    "examine", "consider", "comprehensive", "multifaceted", "holistic approach",
+    "it's vital to summarize", "essential to", "critical to", "I", "i", "me", "my", "mine",
+    "myself", "don't", "won't", "can't", "isn't", "aren't", "yeah", "YEP", "nope", "gonna",
+    "wanna", "gotta", "amazing", "awesome", "terrible", "horrible", "fantastic", "maybe",
+    "perhaps", "possibly", "probably", "I think", "think", "İ", "ſ", "K", "mineral",
+    "summary.", "note!", "deep?", "...", "-", "'", "holistic", "approach", "\n\n", "\t",
+]
+
+
+def fuzz_texts(n, seed=0):
+    rng = random.Random(seed)
+    vocabulary = FRAGMENTS + CORPUS.split()
+    return [
+        " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 300)))
+        for _ in range(n)
+    ]
+
+
+@pytest.mark.parametrize("text", [
+    "", "   ", "Short.", TEXT, CORPUS, "It's vital to summarize: let's explore in depth. I think so!",
+], ids=["empty", "blank", "short", "text", "corpus", "overlaps"])
+def test_matches_baseline(text):
+    assert json.dumps(analyze_text(text)) == json.dumps(baseline_analyze(text))
+
+
+def test_fuzzed_texts_match_baseline():
+    texts = fuzz_texts(500)
+    for text, result in zip(texts, analyze_many(texts)):
+        assert json.dumps(result) == json.dumps(baseline_analyze(text)), text
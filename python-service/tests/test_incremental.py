@@ -0,0 +1,86 @@
+"""Incremental draft-vs-final rescoring"""
+import pytest
+from conftest import TEXT
+from incremental import diff_segments, segment_spans, split_segments
+
+
+def test_segment_spans_match_split_segments():
+    text = "First one. Second one!  Third?\n\n  New paragraph\nstill going.\n \n\nLast"
+    spans = segment_spans(text)
+    assert [" ".join(text[a:b].split()) for a, b in spans] == split_segments(text)
+    assert split_segments(text) == [
+        "First one.", "Second one!", "Third?", "New paragraph still going.", "Last"
+    ]
+
+
+def test_diff_segments_returns_previous_indices():
+    previous = ["A one.", "B two.", "C three is here."]
+    current = ["A one.", "C three is there.", "D four."]
+    assert diff_segments(previous, current) == [
+        ("unchanged", 0), ("changed", 2), ("added", None)
+    ]
+
+
+def test_segment_sums_add_up_to_the_document(detector):
+    ids, _ = detector.encode(TEXT)
+    sums = detector.getSegmentSums([TEXT])[0]
+    assert len(sums) == len(split_segments(TEXT))
+    assert sum(segment[3] for segment in sums) == len(ids) - 1
+    stats = detector.getTokenStats(ids)
+    assert sum(segment[0] for segment in sums) == pytest.approx(float(stats["ll"].sum()), abs=1e-3)
+
+
+def test_identical_final_scores_like_detect(serve):
+    async def scenario(client):
+        draft = await client.post("/detect", json={"text": TEXT, "scorer": "analytic"})
+        final = await client.post(
+            "/detect", json={"text": TEXT, "previousText": TEXT, "scorer": "analytic"}
+        )
+        return draft.json(), final.json()
+
+    draft, final = serve(scenario)
+    assert final["method"] == "Fast-DetectGPT (Incremental vs Draft)"
+    assert final["raw_metrics"]["scored_segments"] == 0
+    assert final["score"] == draft["score"]
+
+
+def test_changed_segments_are_scored_in_document_context(detector):
+    edited = TEXT.replace("was often too warm", "was usually a bit too cold")
+    previous_sums = detector.getSegmentSums([TEXT])[0]
+    plan = diff_segments(split_segments(TEXT), split_segments(edited))
+    changed = [j for j, (status, _) in enumerate(plan) if status != "unchanged"]
+    assert len(changed) == 1
+
+    result, sums = detector.analyzeIncremental(edited, plan, previous_sums)
+    full = detector.getSegmentSums([edited])[0]
+    assert result["raw_metrics"]["scored_segments"] == 1
+    # The prefix is identical; the changed segment sees the same context as in a full pass
+    for j in range(changed[0] + 1):
+        assert sums[j] == pytest.approx(full[j], abs=1e-4)
+
+
+def test_unscored_draft_is_scored_first(serve):
+    async def scenario(client):
+        response = await client.post(
+            "/detect", json={"text": TEXT, "previousText": TEXT, "scorer": "analytic"}
+        )
+        plain = await client.post("/detect", json={"text": TEXT, "scorer": "analytic"})
+        return response.json(), plain.json()
+
+    incremental, plain = serve(scenario)
+    assert incremental["raw_metrics"]["incremental"] is True
+    assert incremental["score"] == plain["score"]
+
+
+def test_draft_without_a_scorer_is_rescored_incrementally(serve):
+    edited = TEXT.replace("was often too warm", "was usually a bit too cold")
+
+    async def scenario(client):
+        final = await client.post("/detect", json={"text": edited, "previousText": TEXT})
+        plain = await client.post("/detect", json={"text": edited})
+        return final.json(), plain.json()
+
+    final, plain = serve(scenario)
+    assert final["method"] == "Fast-DetectGPT (Incremental vs Draft)"
+    assert final["raw_metrics"]["scored_segments"] == 1
+    assert plain["method"] == "DetectGPT (GPT-2 Perplexity)"
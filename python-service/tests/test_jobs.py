@@ -0,0 +1,156 @@
+"""Background jobs: opt-in endpoints, restarts and workers that survive store errors"""
+import asyncio
+import time
+import pytest
+from conftest import TEXT
+from jobs import JobRunner, JobStore
+
+
+def test_jobs_disabled_without_path(serve, service, monkeypatch):
+    monkeypatch.setattr(service, "JOBS_PATH", None)
+
+    async def scenario(client):
+        created = await client.post("/jobs", json={"texts": [TEXT]})
+        status = await client.get("/jobs/unknown")
+        metrics = await client.get("/metrics")
+        return created, status, metrics.json()
+
+    created, status, metrics = serve(scenario)
+    assert created.status_code == 503
+    assert "JOBS_PATH" in created.json()["detail"]
+    assert status.status_code == 503
+    assert metrics["jobs"] is None
+
+
+def test_job_results_through_the_service(serve):
+    async def scenario(client):
+        created = await client.post("/jobs", json={"texts": [TEXT, TEXT[:200]], "scorer": "analytic"})
+        job_id = created.json()["id"]
+        lines = []
+        async with client.stream("GET", f"/jobs/{job_id}/results") as response:
+            async for line in response.aiter_lines():
+                lines.append(line)
+        job = await client.get(f"/jobs/{job_id}")
+        return created, lines, job.json()
+
+    created, lines, job = serve(scenario)
+    assert created.status_code == 202
+    assert len(lines) == 3
+    assert job["status"] == "done"
+    assert all(result is not None and "error" not in result for result in job["results"])
+
+
+def test_worker_survives_a_store_error(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    checkpoint = store.checkpoint
+    failures = []
+
+    def flaky_checkpoint(*args):
+        if not failures:
+            failures.append(args)
+            raise OSError("disk I/O error")
+        return checkpoint(*args)
+
+    monkeypatch.setattr(store, "checkpoint", flaky_checkpoint)
+
+    async def score(text, scorer):
+        return {"score": len(text)}
+
+    async def run():
+        runner = JobRunner(store, score, workers=1, retry_s=0.01)
+        await runner.start()
+        job = await runner.submit(["one", "three"], "analytic")
+        while (await runner.job(job["id"]))["status"] != "done":
+            await runner.wait_progress(0.1)
+        results, stats = await runner.results(job["id"]), await runner.stats()
+        await runner.stop()
+        return results, stats
+
+    results, stats = asyncio.run(run())
+    assert failures
+    assert results == [{"score": 3}, {"score": 5}]
+    assert stats["worker_errors"] == 1
+
+
+def test_restart_resumes_only_unfinished_documents(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = JobStore(path)
+    job_id = store.create(["one", "two", "three"], "analytic")
+    store.checkpoint(job_id, 1, {"score": 0}, False)
+    store.db.close()
+
+    scored = []
+
+    async def score(text, scorer):
+        scored.append(text)
+        return {"score": len(text)}
+
+    async def run():
+        runner = JobRunner(JobStore(path), score, workers=2)
+        await runner.start()
+        while (await runner.job(job_id))["status"] != "done":
+            await runner.wait_progress(0.1)
+        job, results = await runner.job(job_id), await runner.results(job_id)
+        await runner.stop()
+        return job, results
+
+    job, results = asyncio.run(run())
+    assert sorted(scored) == ["one", "three"]
+    assert results == [{"score": 3}, {"score": 0}, {"score": 5}]
+    assert (job["completed"], job["failed"]) == (3, 0)
+
+
+def test_second_checkpoint_of_a_document_changes_nothing(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id = store.create(["one", "two"], "analytic")
+    assert store.checkpoint(job_id, 0, {"score": 1}, False)
+    assert not store.checkpoint(job_id, 0, {"error": "scored again"}, True)
+    job = store.job(job_id)
+    assert (job["status"], job["completed"], job["failed"]) == ("running", 1, 0)
+    assert store.results(job_id) == [{"score": 1}, None]
+    assert store.results_after(job_id, 0) == [(1, 0, {"score": 1})]
+
+
+@pytest.mark.parametrize("read_first", [True, False])
+def test_job_submitted_during_start_is_scored_once(tmp_path, monkeypatch, read_first):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    pending = store.pending
+    reading = []
+
+    def slow_pending():
+        # Let a submit land just after (or just before) the pending documents are read
+        reading.append(True)
+        rows = pending() if read_first else None
+        time.sleep(0.2)
+        return rows if read_first else pending()
+
+    monkeypatch.setattr(store, "pending", slow_pending)
+    scored = []
+
+    async def score(text, scorer):
+        scored.append(text)
+        await asyncio.sleep(0.05)
+        return {"score": len(text)}
+
+    async def run():
+        runner = JobRunner(store, score, workers=2)
+        starting = asyncio.ensure_future(runner.start())
+        while not reading:
+            await asyncio.sleep(0.01)
+        job = await runner.submit(["one", "three"], "analytic")
+        await starting
+
+        async def finished():
+            while (await runner.job(job["id"]))["status"] != "done":
+                await runner.wait_progress(0.1)
+
+        # A document neither start() nor submit() queued would never finish
+        await asyncio.wait_for(finished(), 5)
+        await asyncio.sleep(0.1)
+        job = await runner.job(job["id"])
+        await runner.stop()
+        return job
+
+    job = asyncio.run(run())
+    assert sorted(scored) == ["one", "three"]
+    assert (job["completed"], job["total"]) == (2, 2)
@@ -0,0 +1,26 @@
+"""Zero-copy loading of safetensors snapshots"""
+import os
+import shutil
+import torch
+from safetensors.torch import load_file, save_file
+from model import loadSnapshotModel, mmapSafetensors
+
+
+def test_legacy_mask_buffers_are_skipped(tiny_model_dir, tmp_path):
+    snapshot = str(tmp_path / "legacy")
+    shutil.copytree(tiny_model_dir, snapshot)
+    weights = os.path.join(snapshot, "model.safetensors")
+    state_dict = load_file(weights)
+    state_dict["transformer.h.0.attn.bias"] = torch.ones(1, 1, 8, 8, dtype=torch.uint8)
+    state_dict["transformer.h.0.attn.masked_bias"] = torch.ones(1, dtype=torch.bool)
+    save_file(state_dict, weights)
+
+    mapped = mmapSafetensors(weights)
+    assert "transformer.h.0.attn.bias" not in mapped
+    assert "transformer.h.0.attn.masked_bias" not in mapped
+
+    model = loadSnapshotModel(snapshot)
+    expected = load_file(os.path.join(tiny_model_dir, "model.safetensors"))
+    for name, param in model.named_parameters():
+        if name in expected:
+            assert torch.equal(param, expected[name]), name
@@ -0,0 +1,48 @@
+"""Batched and prefix-shared log-likelihoods against single-text forward passes"""
+import pytest
+import torch
+from conftest import TEXT, words
+
+
+def single_nll(detector, ids):
+    """Mean token NLL of one unpadded sequence, from the model's own loss"""
+    input_ids = torch.tensor([ids])
+    with torch.no_grad():
+        return float(detector.model(input_ids, labels=input_ids).loss)
+
+
+def sequences(detector):
+    texts = [TEXT, TEXT[:80], words(40, seed=1), "A short one."]
+    return [detector.tokenizer(text).input_ids for text in texts]
+
+
+def test_padded_batch_matches_single_text_loss(detector):
+    batch = sequences(detector)
+    assert len({len(ids) for ids in batch}) > 1
+    nll = detector.getBatchNLL(batch)
+    for i, ids in enumerate(batch):
+        assert float(nll[i]) == pytest.approx(single_nll(detector, ids), abs=1e-5)
+
+
+def test_long_sequence_nll_does_not_depend_on_the_batch(detector):
+    long = detector.tokenizer(words(600, seed=2)).input_ids
+    assert len(long) > detector.max_length
+    alone = detector.getBatchNLL([long])
+    batched = detector.getBatchNLL([long] + sequences(detector))
+    assert float(batched[0]) == pytest.approx(float(alone[0]), abs=1e-5)
+
+
+def test_log_likelihoods_match_one_text_at_a_time(detector):
+    texts = [TEXT, words(30, seed=3), TEXT[:120]]
+    batched = detector.getLogLikelihoods(texts)
+    for i, text in enumerate(texts):
+        assert float(batched[i]) == pytest.approx(float(detector.getLogLikelihood(text)), abs=1e-5)
+
+
+def test_prefix_shared_matches_full_passes(detector):
+    base, offsets = detector.encode(TEXT)
+    drops = detector.wordDropSequences(TEXT, base, offsets)[:6]
+    drops.append(base[:1] + base[5:])
+    base_ll, lls = detector.getPrefixSharedLogLikelihoods(base, drops)
+    assert base_ll == pytest.approx(-single_nll(detector, base), abs=1e-5)
+    assert torch.allclose(lls, -detector.getBatchNLL(drops), atol=1e-5)
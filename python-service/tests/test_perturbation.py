@@ -0,0 +1,101 @@
+"""Word-drop perturbation scoring of long documents"""
+import pytest
+from conftest import words
+from model import GPT2PPL
+
+LONG_TEXT = ". ".join(words(12, seed) for seed in range(60)) + "."
+
+
+@pytest.fixture(scope="module")
+def chunked(tiny_model_dir):
+    """A detector with small chunks, so LONG_TEXT spans several"""
+    detector = GPT2PPL(model_id=tiny_model_dir)
+    detector.chunk_tokens, detector.chunk_overlap = 128, 16
+    return detector
+
+
+@pytest.fixture(scope="module")
+def plan(chunked):
+    ids, offsets = chunked.encode(LONG_TEXT)
+    chunks = chunked.makeChunks(len(ids))
+    assert len(chunks) > 2
+    return ids, offsets, chunks
+
+
+@pytest.mark.parametrize("mode", ["prefix", "sequential"])
+def test_chunk_likelihoods_do_not_depend_on_the_mode(chunked, plan, mode):
+    ids, offsets, chunks = plan
+    chunked.perturbation_mode = "batched"
+    batched = chunked.getChunkLikelihoods(LONG_TEXT, ids, offsets, chunks)
+    chunked.perturbation_mode = mode
+    try:
+        other = chunked.getChunkLikelihoods(LONG_TEXT, ids, offsets, chunks)
+    finally:
+        chunked.perturbation_mode = "batched"
+    for (ll, perturbed), (other_ll, other_perturbed) in zip(batched, other):
+        assert other_ll == pytest.approx(ll, abs=1e-4)
+        assert len(other_perturbed) == len(perturbed)
+        assert other_perturbed == pytest.approx(perturbed, abs=1e-4)
+
+
+def test_chunks_scored_one_by_one_pool_to_analyze(chunked, plan):
+    ids, offsets, chunks = plan
+    scored = []
+    for begin, end, weight in chunks:
+        _, likelihoods = chunked.analyzeChunk(
+            LONG_TEXT, ids[begin:end], offsets[begin:end], end - begin - weight
+        )
+        scored.append((likelihoods, weight))
+    streamed = chunked.chunkedResult(scored, len(chunks))
+    document = chunked.analyze(LONG_TEXT, scorer="perturbation")
+    assert streamed["score"] == pytest.approx(document["score"], abs=1e-4)
+    assert streamed["raw_metrics"]["num_perturbations"] == document["raw_metrics"]["num_perturbations"]
+
+
+def test_prefix_mode_runs_each_original_once(tiny_model_dir, plan):
+    ids, offsets, chunks = plan
+    detector = GPT2PPL(model_id=tiny_model_dir, perturbation_mode="prefix")
+    detector.chunk_tokens, detector.chunk_overlap = 128, 16
+    runs = []
+    prefix_state = detector.prefixState
+    detector.prefixState = lambda base, first=1: runs.append(len(base)) or prefix_state(base, first)
+
+    likelihoods = detector.getChunkLikelihoods(LONG_TEXT, ids, offsets, chunks)
+    assert len(runs) == len(chunks)
+    assert any(len(perturbed) > detector.min_perturbations for _, perturbed in likelihoods)
+
+
+def test_unknown_perturbation_mode_is_rejected(tiny_model_dir):
+    with pytest.raises(ValueError):
+        GPT2PPL(model_id=tiny_model_dir, perturbation_mode="parallel")
+
+
+def test_chunk_overlap_is_context_only(chunked, plan):
+    import torch
+    ids, offsets, chunks = plan
+    likelihoods = chunked.getChunkLikelihoods(LONG_TEXT, ids, offsets, chunks)
+    for (begin, end, weight), (ll, _) in list(zip(chunks, likelihoods))[1:]:
+        context = end - begin - weight
+        assert context == chunked.chunk_overlap
+        input_ids = torch.tensor([ids[begin:end]])
+        with torch.no_grad():
+            log_probs = chunked.model(input_ids).logits.log_softmax(-1)[0, :-1]
+        token_ll = log_probs.gather(-1, input_ids[0, 1:, None])[:, 0]
+        # Only the weight tokens after the overlap are scored
+        assert len(token_ll[context - 1:]) == weight
+        assert ll == pytest.approx(float(token_ll[context - 1:].mean()), abs=1e-4)
+
+        perturbed = chunked.wordDropSequences(LONG_TEXT, ids[begin:end], offsets[begin:end], context)
+        assert perturbed and all(seq[:context] == ids[begin:begin + context] for seq in perturbed)
+
+
+def test_early_stopping_clears_every_verdict_boundary(detector):
+    from model import VERDICT_BANDS
+    for threshold, verdict, confidence in VERDICT_BANDS:
+        above, below = detector.getVerdict(threshold + 0.01), detector.getVerdict(threshold - 0.01)
+        assert above == (verdict, confidence) and above != below
+        # A score this close to a boundary is never settled, even after many samples
+        assert not detector.verdictSettled(threshold + 0.01, detector.max_perturbations)
+    assert detector.getVerdict(2.0) == ("Likely AI-generated or heavily AI-assisted", "High")
+    assert detector.getVerdict(-2.0) == ("Primarily human-written", "High")
+    assert detector.verdictSettled(3.0, detector.min_perturbations)
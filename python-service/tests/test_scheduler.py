@@ -0,0 +1,178 @@
+"""Micro-batching of concurrent detection requests"""
+import asyncio
+import pytest
+from conftest import TEXT, words
+from executor import QueueFullError
+from scheduler import MicroBatcher, SingleFlight
+
+TEXTS = [TEXT, words(120, seed=4), words(400, seed=5), "Too short to score."]
+
+
+def run_batches(texts, **kwargs):
+    """Submit texts concurrently; returns their results and the batches run"""
+    batches = []
+
+    async def run_batch(items):
+        batches.append([text for text, _ in items])
+        await asyncio.sleep(0.01)
+        return [text.upper() for text, _ in items]
+
+    async def run():
+        batcher = MicroBatcher(run_batch, **kwargs)
+        await batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(text, "analytic") for text in texts)), batcher
+        finally:
+            await batcher.stop()
+
+    results, batcher = asyncio.run(run())
+    return results, batches, batcher
+
+
+def test_concurrent_texts_share_a_batch():
+    results, batches, batcher = run_batches(["a", "b", "c"], max_wait_ms=50)
+    assert results == ["A", "B", "C"]
+    assert batches == [["a", "b", "c"]]
+    assert batcher.stats()["batch_sizes"] == {"3": 1}
+
+
+def test_batches_close_at_the_size_and_token_limits():
+    _, batches, _ = run_batches(list("abcde"), max_wait_ms=50, max_batch_size=2)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+    texts = [words(30, seed) for seed in range(3)]
+    _, batches, _ = run_batches(texts, max_wait_ms=50, max_batch_tokens=90)
+    assert [len(batch) for batch in batches] == [2, 1]
+
+
+def test_full_queue_is_rejected():
+    async def run():
+        batcher = MicroBatcher(lambda items: asyncio.sleep(0), max_queue=0)
+        await batcher.start()
+        try:
+            with pytest.raises(QueueFullError):
+                await batcher.submit("a", "analytic")
+            return batcher.stats()["rejected"]
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(run()) == 1
+
+
+def test_batched_perturbation_scoring_matches_one_text_at_a_time(detector, monkeypatch):
+    calls = []
+    score_word_drops = detector.scoreWordDrops
+    monkeypatch.setattr(detector, "scoreWordDrops", lambda items: calls.append(len(items)) or score_word_drops(items))
+
+    results = detector.analyzeMany(TEXTS, scorer="perturbation")
+    assert len(calls) == 1 and calls[0] > len(TEXTS) - 1
+    for text, result in zip(TEXTS, results):
+        expected = detector.analyze(text, scorer="perturbation")
+        assert result.keys() == expected.keys()
+        if "error" in expected:
+            continue
+        assert result["score"] == pytest.approx(expected["score"], abs=1e-4)
+        assert result["raw_metrics"]["num_perturbations"] == expected["raw_metrics"]["num_perturbations"]
+
+
+def test_unbatched_modes_skip_the_batcher(serve, service, monkeypatch):
+    monkeypatch.setattr(service, "PERTURBATION_MODE", "sequential")
+
+    async def scenario(client):
+        response = await client.post("/detect", json={"text": TEXT, "scorer": "perturbation"})
+        metrics = await client.get("/metrics")
+        return response, metrics.json()
+
+    response, metrics = serve(scenario)
+    assert response.status_code == 200
+    assert metrics["scheduler"]["requests"] == 0
+    assert metrics["executor"]["completed"] >= 1
+
+
+def test_single_flight_coalesces_identical_calls():
+    calls = []
+
+    async def run():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute(value):
+            calls.append(value)
+            await release.wait()
+            if value == "bad":
+                raise ValueError(value)
+            return value
+
+        shared = [asyncio.ensure_future(flights.run("a", lambda: compute("a"))) for _ in range(3)]
+        other = asyncio.ensure_future(flights.run("b", lambda: compute("b")))
+        failing = [asyncio.ensure_future(flights.run("c", lambda: compute("bad"))) for _ in range(2)]
+        await asyncio.sleep(0)
+        in_flight = flights.stats()["in_flight"]
+        release.set()
+        results = await asyncio.gather(*shared, other)
+        errors = await asyncio.gather(*failing, return_exceptions=True)
+        # Finished calls are forgotten: the next caller computes afresh
+        again = await flights.run("a", lambda: compute("a"))
+        return in_flight, results, errors, again, flights.stats()
+
+    in_flight, results, errors, again, stats = asyncio.run(run())
+    assert in_flight == 3
+    assert results == ["a", "a", "a", "b"] and again == "a"
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert sorted(calls) == ["a", "a", "b", "bad"]
+    assert stats == {"in_flight": 0, "started": 4, "coalesced": 3}
+
+
+def test_single_flight_cancels_a_call_once_every_caller_is_gone():
+    async def run():
+        flights = SingleFlight()
+        started = asyncio.Event()
+
+        async def compute():
+            started.set()
+            await asyncio.sleep(0.1)
+            return "done"
+
+        first = asyncio.ensure_future(flights.run("a", compute))
+        second = asyncio.ensure_future(flights.run("a", compute))
+        await started.wait()
+        task = flights.calls["a"].task
+        # One caller leaving keeps the call running for the other
+        first.cancel()
+        survivor = await second
+        kept = task.cancelled()
+
+        third = asyncio.ensure_future(flights.run("a", compute))
+        await asyncio.sleep(0.01)
+        task = flights.calls["a"].task
+        third.cancel()
+        await asyncio.gather(first, third, return_exceptions=True)
+        await asyncio.sleep(0)
+        return survivor, kept, task.cancelled(), flights.stats()
+
+    survivor, kept, abandoned, stats = asyncio.run(run())
+    assert survivor == "done" and not kept
+    assert abandoned
+    assert stats["in_flight"] == 0
+
+
+def test_duplicate_requests_are_scored_once(serve, service):
+    text, other = words(50, seed=50), words(50, seed=51)
+
+    async def scenario(client):
+        before = (await client.get("/metrics")).json()["dedup"]
+        batch = await client.post("/detect/batch?scorer=analytic", json=[text, other, f"  {text} ", other])
+        # Concurrent identical requests for a new text coalesce into one computation
+        fresh = words(50, seed=52)
+        single = await asyncio.gather(*(
+            client.post("/detect", json={"text": fresh, "scorer": "analytic"}) for _ in range(3)
+        ))
+        after = (await client.get("/metrics")).json()["dedup"]
+        return before, batch.json()["results"], [r.json() for r in single], after
+
+    before, results, single, after = serve(scenario)
+    assert results[0] == results[2] and results[1] == results[3]
+    assert after["batch_duplicates"] - before["batch_duplicates"] == 2
+    assert after["started"] - before["started"] == 3
+    assert after["coalesced"] - before["coalesced"] == 2
+    assert single[0]["score"] == single[1]["score"] == single[2]["score"]
@@ -0,0 +1,24 @@
+"""Per-sentence scores of /detect/sentences"""
+import pytest
+from conftest import TEXT
+
+
+def test_span_score_does_not_grow_with_length(detector):
+    ll, mean, var, n = -40.0, -46.0, 90.0, 20
+    short = detector.spanScore(ll, mean, var, n, 400)[0]
+    long = detector.spanScore(ll * 5, mean * 5, var * 5, n * 5, 400)[0]
+    assert short == pytest.approx(long)
+
+
+def test_whole_document_span_scores_like_the_document(detector):
+    ll, mean, var, n = -40.0, -46.0, 90.0, 20
+    assert detector.spanScore(ll, mean, var, n, n) == detector.curvatureScore(ll, mean, var, n)
+
+
+def test_sentence_tokens_add_up_to_the_document(detector):
+    result = detector.analyzeSentences(TEXT)
+    assert len(result["sentences"]) == len(detector.splitSentences(TEXT))
+    assert sum(s["tokens"] for s in result["sentences"]) == result["raw_metrics"]["tokens"]
+
+    single = detector.analyzeSentences("Our group met every week in the lab.")
+    assert single["sentences"][0]["score"] == pytest.approx(single["score"])
@@ -0,0 +1,81 @@
+"""Streamed batch and long-document results"""
+import json
+from conftest import words
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def sse(response):
+    events = []
+    for block in response.text.split("\n\n"):
+        if block:
+            event, data = block.split("\n")
+            events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_streamed_batch_sends_every_text_then_a_summary(serve):
+    first, second, cached = words(40, seed=40), words(40, seed=41), words(40, seed=42)
+
+    async def scenario(client):
+        await client.post("/detect", json={"text": cached, "scorer": "analytic"})
+        texts = [first, second, first, cached]
+        lines = await client.post("/detect/batch?scorer=analytic&stream=ndjson", json=texts)
+        events = await client.post("/detect/batch?scorer=analytic&stream=sse", json=texts)
+        plain = await client.post("/detect/batch?scorer=analytic", json=texts)
+        return lines, events, plain.json()["results"]
+
+    lines, events, plain = serve(scenario)
+    assert lines.headers["content-type"].startswith("application/x-ndjson")
+    records = ndjson(lines)
+    assert records[0] == {"index": 3, "result": plain[3]}  # cached results go first
+    assert sorted(record["index"] for record in records[:-1]) == [0, 1, 2, 3]
+    summary = records[-1]
+    assert summary["done"] and (summary["total"], summary["failed"], summary["cached"]) == (4, 0, 1)
+    assert sum(summary["verdicts"].values()) == 4
+
+    assert events.headers["content-type"].startswith("text/event-stream")
+    events = sse(events)
+    assert [event for event, _ in events] == ["result"] * 4 + ["done"]
+    # Everything was cached by the first stream
+    assert events[-1][1]["cached"] == 4
+    assert {payload["index"]: payload["result"] for _, payload in events[:-1]} == dict(enumerate(plain))
+
+
+def test_long_document_streams_its_chunks(serve, monkeypatch):
+    import inference
+    text = words(240, seed=43)
+
+    async def scenario(client):
+        monkeypatch.setattr(inference.detector, "chunk_tokens", 128)
+        monkeypatch.setattr(inference.detector, "chunk_overlap", 16)
+        streamed = await client.post("/detect/stream", json={"text": text, "scorer": "perturbation"})
+        again = await client.post("/detect/stream?stream=sse", json={"text": text, "scorer": "perturbation"})
+        detected = await client.post("/detect", json={"text": text, "scorer": "perturbation"})
+        return ndjson(streamed), sse(again), detected.json()
+
+    records, again, detected = serve(scenario)
+    chunks, done = records[:-1], records[-1]
+    assert len(chunks) > 1
+    assert sorted(record["chunk"] for record in chunks) == list(range(len(chunks)))
+    assert all(record["chunks"] == len(chunks) and "error" not in record["result"] for record in chunks)
+    assert min(record["start"] for record in chunks) == 0
+    assert max(record["end"] for record in chunks) == len(text)
+    assert done["done"] and (done["chunks"], done["failed_chunks"]) == (len(chunks), 0)
+
+    # The pooled result is cached like /detect's, so later requests reuse it
+    assert again == [("done", {"done": True, "result": again[0][1]["result"]})]
+    assert again[0][1]["result"]["raw_metrics"]["cached"]
+    assert detected["aiLikelihood"] == done["result"]["aiLikelihood"]
+    assert detected["score"] == done["result"]["score"]
+
+
+def test_unknown_stream_format_is_rejected(serve):
+    async def scenario(client):
+        batch = await client.post("/detect/batch?stream=xml", json=["some text"])
+        document = await client.post("/detect/stream?stream=xml", json={"text": "some text"})
+        return batch.status_code, document.status_code
+
+    assert serve(scenario) == (400, 400)
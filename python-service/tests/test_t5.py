@@ -0,0 +1,136 @@
+"""T5 perturbations: configuration, fill order, unfilled variants and the perturbation store"""
+import torch
+from types import SimpleNamespace
+from cache import PerturbationStore, perturbation_key
+from conftest import words
+
+TEXT = words(120, seed=60)
+UNFILLED = {1, 3}  # variants the stub T5 leaves one mask short
+
+
+class StubT5Tokenizer:
+    """Encodes every text as its position in self.texts; decodes to fills from fill(text)"""
+
+    def __init__(self, fill):
+        self.fill = fill
+        self.texts = []
+
+    def encode(self, text):
+        return [0]
+
+    def __call__(self, texts, return_tensors, padding):
+        ids = torch.arange(len(self.texts), len(self.texts) + len(texts)).unsqueeze(1)
+        self.texts.extend(texts)
+        return {"input_ids": ids}
+
+    def batch_decode(self, sequences, skip_special_tokens):
+        return [self.fill(self.texts[int(row[0])]) for row in sequences]
+
+
+class StubT5Model:
+    """generate() echoes its input ids and records the batch sizes"""
+
+    def __init__(self):
+        self.batches = []
+
+    def to(self, device):
+        return self
+
+    def generate(self, input_ids, **kwargs):
+        self.batches.append(len(input_ids))
+        return input_ids
+
+
+def masked_variants(detector, text, n):
+    """The masked variants getPerturbationLikelihoods draws for text, in order"""
+    rng = detector.textRng(text)
+    ratio = int(detector.mask_ratio * len(text.split()))
+    return [detector.maskRandomWord(text, ratio, rng)[0] for _ in range(n)]
+
+
+def stub_t5(detector, monkeypatch):
+    """
+    Switch the shared detector to a stub T5 filling mask i of variant k with
+    "fill{k}x{i}"; returns the stub model, the texts scored and the
+    expected filled variants
+    """
+    variants = masked_variants(detector, TEXT, 5)
+
+    def fill(masked):
+        k = variants.index(masked)
+        n = masked.count("<extra_id_") - (k in UNFILLED)
+        return "<pad> " + " ".join(f"<extra_id_{i}> fill{k}x{i}" for i in range(n)) + f" <extra_id_{n}></s>"
+
+    expected = []
+    for k, masked in enumerate(variants):
+        text = masked
+        for i in range(masked.count("<extra_id_")):
+            text = text.replace(f"<extra_id_{i}>", f"fill{k}x{i}")
+        expected.append(None if k in UNFILLED else text)
+
+    t5_model = StubT5Model()
+    scored = []
+    get_log_likelihoods = detector.getLogLikelihoods
+
+    def record(sentences):
+        scored.extend(sentences)
+        return get_log_likelihoods(sentences)
+
+    monkeypatch.setattr(detector, "use_t5", True)
+    monkeypatch.setattr(detector, "t5_model", t5_model, raising=False)
+    monkeypatch.setattr(detector, "t5_tokenizer", StubT5Tokenizer(fill), raising=False)
+    monkeypatch.setattr(detector, "getLogLikelihoods", record)
+    # Rounds of 2, 2 and 1 variants, filled 2 at a time, all of them scored
+    monkeypatch.setattr(detector, "t5_batch_size", 2)
+    monkeypatch.setattr(detector, "min_perturbations", 2)
+    monkeypatch.setattr(detector, "perturbation_round", 2)
+    monkeypatch.setattr(detector, "verdictSettled", lambda score, n: False)
+    return t5_model, scored, expected
+
+
+def test_fills_keep_variant_order(detector, monkeypatch):
+    t5_model, scored, expected = stub_t5(detector, monkeypatch)
+    _, perturbed = detector.getPerturbationLikelihoods(TEXT)
+    assert t5_model.batches == [2, 2, 1]
+    # The original, then the filled variants in order; unfilled ones are skipped
+    assert scored == [TEXT] + [text for text in expected if text is not None]
+    assert len(perturbed) == len(expected) - len(UNFILLED)
+
+
+def test_stored_fills_skip_generate(detector, tmp_path, monkeypatch):
+    t5_model, _, expected = stub_t5(detector, monkeypatch)
+    store = PerturbationStore(str(tmp_path / "perturbations.db"))
+    monkeypatch.setattr(detector, "perturbation_store", store)
+
+    first = detector.getPerturbationLikelihoods(TEXT)
+    # Unfilled variants are stored too, as None, so they are not retried
+    assert store.get(perturbation_key(TEXT, detector.perturbationParams())) == expected
+    assert t5_model.batches == [2, 2, 1]
+
+    again = detector.getPerturbationLikelihoods(TEXT)
+    assert t5_model.batches == [2, 2, 1]
+    assert again[0] == first[0]
+    assert again[1].tolist() == first[1].tolist()
+
+
+def test_use_t5_loads_the_fill_model(tiny_model_dir, monkeypatch):
+    import model
+    loaded = []
+
+    def load(stub):
+        return lambda model_id, **kwargs: loaded.append(model_id) or stub
+
+    monkeypatch.setattr(model.transformers.AutoModelForSeq2SeqLM, "from_pretrained", load(StubT5Model()))
+    monkeypatch.setattr(model, "T5Tokenizer", SimpleNamespace(from_pretrained=load(StubT5Tokenizer(None))))
+    with_t5 = model.GPT2PPL(model_id=tiny_model_dir, use_t5=True)
+    assert with_t5.use_t5 and isinstance(with_t5.t5_model, StubT5Model)
+    assert loaded == ["t5-base", "t5-base"]
+    assert with_t5.cacheParams("perturbation")["use_t5"]
+    assert not model.GPT2PPL(model_id=tiny_model_dir).use_t5
+
+
+def test_t5_texts_skip_the_micro_batcher(service, monkeypatch):
+    assert service.shares_batches("perturbation")
+    monkeypatch.setattr(service, "USE_T5", True)
+    assert not service.shares_batches("perturbation")
+    assert service.shares_batches("analytic")